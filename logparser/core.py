@@ -4,14 +4,48 @@ from __future__ import unicode_literals
 import os
 import sys
 import json
+import time
+import errno
+import hashlib
+import heapq
 import shlex
+import select
 import subprocess
 import operator
 import mmap
+import multiprocessing
+import multiprocessing.util
+import zlib
+import bz2
+import threading
+import Queue
 import regex as re
+from fnmatch import fnmatch
+from stat import S_ISDIR, S_ISREG, S_ISLNK
 from pipes import quote
 from pprint import pprint
-from collections import namedtuple
+from collections import namedtuple, OrderedDict, deque
+
+try :
+    import numpy
+except ImportError :
+    numpy = None
+
+try :
+    from os import scandir
+except ImportError :
+    try :
+        from scandir import scandir
+    except ImportError :
+        scandir = None
+
+try :
+    import lzma
+except ImportError :
+    try :
+        from backports import lzma
+    except ImportError :
+        lzma = None
 
 # Pattern for capturing named grok keys
 # name, pattern, optional subname and predicate
@@ -44,6 +78,86 @@ PATTERN_REGEX = re.compile(r"(?!<\\)%{" \
 
 REGEXP_PREDICATE_RE = re.compile(r'(?:\s*([!=])~\s*(.)([^\/]+|(?:\/)+)*)(?:\2)')
 REGEXP_PREDICATE_OP = re.compile(r'(?:\s*)([$!~=<>]{1,3})(?:\s*)')
+# constructs which can not be combined in a single alternation :
+# inline flags, numbered and named back references, recursions
+# and conditionals on groups
+UNCOMBINABLE_REGEX = re.compile(r'\(\?[a-zA-Z-]+[:)]|\\[1-9]|\\[gk]<|\(\?P[=>]|\(\?&|\(\?\d|\(\?\(')
+# anchors which do not keep their line meaning over a whole buffer
+UNSCANNABLE_REGEX = re.compile(r'\\[AZz]')
+# named capturing group start (?<name>, (?P<name> or (?'name'
+NAMED_GROUP_RE = re.compile(r"\(\?P?(?:<\w+>|'\w+')")
+# regex counted repetition {m}, {m,}, {m,n} or {,n}
+QUANTIFIER_RE = re.compile(r'\{(\d*)(,(\d*))?\}')
+
+# Program engines
+# evaluate every pattern on every line
+ENGINE_LOOP = 'loop'
+# scan every line once with all patterns combined in a single
+# regex of numbered branches, the matching branch gives the pattern
+# to evaluate when matchconfigs can not overlap, otherwise the
+# lines it matches are evaluated pattern by pattern
+ENGINE_COMBINED = 'combined'
+# scan whole mapped input files with every pattern
+# and evaluate only lines holding a hit
+ENGINE_BUFFER = 'buffer'
+ENGINES = (ENGINE_LOOP, ENGINE_COMBINED, ENGINE_BUFFER)
+
+# Input file readers
+# read large blocks split in lines in bulk
+READER_BLOCK = 'block'
+# read mapped file line by line
+READER_MMAP = 'mmap'
+READERS = (READER_BLOCK, READER_MMAP)
+# block reader default block size in bytes
+DEFAULT_BLOCKSIZE = 4 * 1024 * 1024
+# multi-line record options, see `MatchConfig`
+RECORD_KEYS = ('start', 'continuation', 'end', 'maxlines', 'timeout')
+DEFAULT_RECORD_MAXLINES = 200
+# seconds between idle callbacks of inputs waiting for data,
+# timed out records are completed on idle callbacks
+IDLE_INTERVAL = 1.0
+
+# batched actions, the shell command receives actions on its standard
+# input or as arguments like xargs, see `ActionExecutor`
+BATCH_STDIN = 'stdin'
+BATCH_XARGS = 'xargs'
+BATCHES = (BATCH_STDIN, BATCH_XARGS)
+DEFAULT_BATCHSIZE = 100
+# maximum seconds actions wait in a batch which is not full,
+# expired batches are flushed on idle callbacks
+DEFAULT_BATCH_MAXAGE = 5.0
+
+# stdout actions output buffering, see `OutputSink`
+DEFAULT_OUTPUT_BUFFERSIZE = 64 * 1024
+DEFAULT_FLUSHINTERVAL = 1.0
+# largest write to a pipe which is not interleaved
+# with writes of other processes
+PIPE_BUF = getattr(select, 'PIPE_BUF', 512)
+
+# actions run by worker threads, see `ActionQueue`
+DEFAULT_ACTIONWORKERS = 4
+DEFAULT_ACTIONQUEUESIZE = 1000
+
+# standard input name, on command line too
+STDIN_INPUTNAME = '-'
+# files larger than split size in bytes are analyzed
+# by ranges in parallel worker processes
+DEFAULT_SPLITSIZE = 128 * 1024 * 1024
+
+# Input file compressions and their magic bytes
+COMPRESSION_GZIP = 'gzip'
+COMPRESSION_BZ2 = 'bz2'
+COMPRESSION_XZ = 'xz'
+COMPRESSIONS = (COMPRESSION_GZIP, COMPRESSION_BZ2, COMPRESSION_XZ)
+COMPRESSION_MAGICS = (
+        (COMPRESSION_GZIP, b'\x1f\x8b'),
+        (COMPRESSION_BZ2, tuple(b'BZh%d' % level for level in range(1, 10))),
+        (COMPRESSION_XZ, b'\xfd7zXZ\x00'),
+)
+COMPRESSION_MAGICLENGTH = 6
+# compressed bytes given at once to decompressors without an output
+# limit, a call decompresses at most a few MiB of highly compressed data
+DECOMPRESS_INPUTSIZE = 4 * 1024
 
 # The line matched
 VALUE_LINE = 0
@@ -76,6 +190,18 @@ GrokPattern.__new__.__defaults__ = (None, None, None)
 GrokPredicateNum = namedtuple('GrokPredicateNum', 'op value vtype')
 GrokPredicateStr = namedtuple('GrokPredicateStr', 'op value')
 GrokPredicateRegex = namedtuple('GrokPredicateRegex', 'pattern negative_match')
+# fully expanded regex of a pattern with the predicates source
+# and the pattern names it depends on
+GrokExpansion = namedtuple('GrokExpansion', 'regexp predicates dependencies')
+# expanded and compiled grok pattern with its predicates table
+# and predicate checks as (group index, check function)
+GrokCompiled = namedtuple('GrokCompiled', 'expandpattern predicates dependencies prefilter predicatechecks')
+# predicate evaluation cost, cheapest checked first
+PREDICATE_COSTS = {
+        GrokPredicateStr : 0,
+        GrokPredicateNum : 1,
+        GrokPredicateRegex : 2,
+}
 
 def getpatternmacrotypes():
     ''' Return pattern macro types
@@ -107,6 +233,888 @@ def patternnametomacrotype(pattern):
     macrotypes = getpatternmacrotypes()
     return macrotypes.get(pattern)
 
+def parsepatternline(text):
+    ''' Parse a pattern definition line
+        ex : NUMBER (?:%{BASE10NUM})
+
+    :param text: pattern definition line
+    :type text: str
+    :returns: grok pattern or None for empty lines and comments
+    :rType: `GrokPattern`
+    '''
+    if isinstance(text, bytes):
+        text = text.decode('utf-8')
+
+    text = text.strip()
+    if text == '' or text.startswith('#'):
+        return
+
+    sep = text.find(' ')
+    name = text[:sep]
+    regexp = text[sep:].strip()
+    return GrokPattern(name, regexp)
+
+class LiteralParser(object):
+    ''' LiteralParser class
+
+        Walk an expanded regex to find the literals that any
+        match must contain. Result is a list of clauses, every
+        clause is a tuple of literals, at least one of them
+        must be found in a text for the regex to match
+
+        ..note::
+            * extraction is conservative : unsupported
+              constructs give no literal, never a wrong one
+            * only ascii literals are kept so they can be
+              searched in both str and unicode lines
+
+    '''
+    # escapes matching a class of characters or a position
+    CLASS_ESCAPES = 'dDwWsSbBAZzGhHvVRXmMnrtfae'
+
+    class Unsupported(Exception):
+        pass
+
+    def __init__(self, regexp):
+        self.__regexp = regexp
+        self.__pos = 0
+
+    def parse(self):
+        ''' Return required literals clauses
+
+        :returns: clauses as tuples of literals
+        :rType: list
+        '''
+        try :
+            clauses = self._alternation()
+            if self.__pos != len(self.__regexp):
+                raise LiteralParser.Unsupported()
+        except LiteralParser.Unsupported:
+            return []
+        return clauses
+
+    def _peek(self, offset=0):
+        pos = self.__pos + offset
+        if pos < len(self.__regexp):
+            return self.__regexp[pos]
+        return ''
+
+    def _alternation(self):
+        branches = [self._sequence()]
+        while self._peek() == '|':
+            self.__pos += 1
+            branches.append(self._sequence())
+
+        if len(branches) == 1 :
+            return branches[0]
+
+        # any branch can match : one literal of each branch
+        clause = set()
+        for clauses in branches :
+            if not len(clauses):
+                return []
+            best = max(clauses, key=lambda c : min(len(l) for l in c))
+            clause.update(best)
+        return [tuple(sorted(clause))]
+
+    def _sequence(self):
+        clauses = []
+        run = ''
+
+        while True :
+            c = self._peek()
+            if c in ('', '|', ')'):
+                break
+
+            (literal, atomclauses) = self._atom()
+            (minrepeat, maxrepeat) = self._quantifier()
+
+            if minrepeat == 0 :
+                # optional atom, nothing required
+                if run :
+                    clauses.append((run,))
+                run = ''
+                continue
+
+            if literal is not None :
+                run += literal
+                if maxrepeat == 1 :
+                    continue
+
+            if run :
+                clauses.append((run,))
+            run = ''
+            clauses.extend(atomclauses)
+
+        if run :
+            clauses.append((run,))
+        return clauses
+
+    def _atom(self):
+        ''' Parse next atom
+
+        :returns: (literal character or None, clauses)
+        :rType: tuple
+        '''
+        c = self._peek()
+        self.__pos += 1
+
+        if c == '\\':
+            return self._escape()
+        if c == '[':
+            self._charclass()
+            return (None, [])
+        if c == '(':
+            return (None, self._group())
+        if c in '.^$':
+            return (None, [])
+        if c in '*+?':
+            raise LiteralParser.Unsupported()
+        if c == '{' and self._matchquantifier(self.__pos - 1) is not None :
+            raise LiteralParser.Unsupported()
+        if ord(c) > 127 :
+            return (None, [])
+        return (c, [])
+
+    def _escape(self):
+        c = self._peek()
+        if c == '':
+            raise LiteralParser.Unsupported()
+        self.__pos += 1
+
+        if not c.isalnum():
+            if ord(c) > 127 :
+                return (None, [])
+            return (c, [])
+
+        if c in self.CLASS_ESCAPES :
+            return (None, [])
+        if c == 'x':
+            if self._peek() == '{':
+                self._skipuntil('}')
+            else :
+                self._skiphex(2)
+        elif c == 'u':
+            self._skiphex(4)
+        elif c == 'U':
+            self._skiphex(8)
+        elif c in 'NpP':
+            if self._peek() == '{':
+                self._skipuntil('}')
+            elif c == 'N':
+                raise LiteralParser.Unsupported()
+            else :
+                self.__pos += 1
+        elif c in 'gkL':
+            if self._peek() not in ('<', '{'):
+                raise LiteralParser.Unsupported()
+            self._skipuntil('>' if self._peek() == '<' else '}')
+        elif c.isdigit():
+            # back reference or octal escape
+            while self._peek().isdigit():
+                self.__pos += 1
+        else :
+            raise LiteralParser.Unsupported()
+        return (None, [])
+
+    def _skiphex(self, count):
+        for i in range(count):
+            if self._peek() not in '0123456789abcdefABCDEF' or self._peek() == '':
+                raise LiteralParser.Unsupported()
+            self.__pos += 1
+
+    def _skipuntil(self, char):
+        end = self.__regexp.find(char, self.__pos)
+        if end < 0 :
+            raise LiteralParser.Unsupported()
+        self.__pos = end + 1
+
+    def _charclass(self):
+        if self._peek() == '^':
+            self.__pos += 1
+        if self._peek() == ']':
+            self.__pos += 1
+
+        while True :
+            c = self._peek()
+            if c == '':
+                raise LiteralParser.Unsupported()
+            self.__pos += 1
+            if c == '\\':
+                self.__pos += 1
+            elif c == '[' and self._peek() == ':':
+                self._skipuntil(']')
+            elif c == ']':
+                return
+
+    def _group(self):
+        ''' Parse group after opening parenthesis
+
+        :returns: group clauses
+        :rType: list
+        '''
+        zerowidth = False
+
+        if self._peek() == '?':
+            self.__pos += 1
+            c = self._peek()
+
+            if c in (':', '>', '|'):
+                self.__pos += 1
+            elif c in ('=', '!'):
+                self.__pos += 1
+                zerowidth = True
+            elif c == '<' and self._peek(1) in ('=', '!'):
+                self.__pos += 2
+                zerowidth = True
+            elif c == '<' or (c == 'P' and self._peek(1) == '<'):
+                self._skipuntil('>')
+            elif c == "'":
+                self.__pos += 1
+                self._skipuntil("'")
+            elif c == '#':
+                self._skipuntil(')')
+                return []
+            elif c in ('&', 'R') or c.isdigit() or \
+                    (c == 'P' and self._peek(1) == '>'):
+                # recursion to a group
+                self._skipuntil(')')
+                return []
+            else :
+                # inline flags, only those keeping
+                # literals meaning are supported
+                flags = ''
+                while self._peek() not in (':', ')', ''):
+                    flags += self._peek()
+                    self.__pos += 1
+                if not flags or [f for f in flags if f not in 'msuL-']:
+                    raise LiteralParser.Unsupported()
+                self.__pos += 1
+                if self.__regexp[self.__pos - 1] == ')':
+                    return []
+
+        clauses = self._alternation()
+        if self._peek() != ')':
+            raise LiteralParser.Unsupported()
+        self.__pos += 1
+
+        if zerowidth :
+            return []
+        return clauses
+
+    def _matchquantifier(self, pos):
+        match = QUANTIFIER_RE.match(self.__regexp, pos)
+        # {} and {,} are literals
+        if match is None or not (match.group(1) or match.group(3)):
+            return None
+        return match
+
+    def _quantifier(self):
+        ''' Parse optional quantifier
+
+        :returns: (min repeat, max repeat or None)
+        :rType: tuple
+        '''
+        c = self._peek()
+        minrepeat, maxrepeat = 1, 1
+
+        if c == '?':
+            minrepeat, maxrepeat = 0, 1
+        elif c == '*':
+            minrepeat, maxrepeat = 0, None
+        elif c == '+':
+            minrepeat, maxrepeat = 1, None
+        elif c == '{':
+            match = self._matchquantifier(self.__pos)
+            if match is None :
+                return (minrepeat, maxrepeat)
+            minrepeat = int(match.group(1) or 0)
+            if match.group(2) is None :
+                maxrepeat = minrepeat
+            else :
+                maxrepeat = int(match.group(3)) if match.group(3) else None
+            self.__pos = match.end() - 1
+        else :
+            return (minrepeat, maxrepeat)
+
+        self.__pos += 1
+        # lazy or possessive quantifier
+        if self._peek() in ('?', '+'):
+            self.__pos += 1
+        return (minrepeat, maxrepeat)
+
+def commonsubstring(literals):
+    ''' Return longest substring common to all `literals`
+
+    :param literals: literals
+    :type literals: tuple
+    :returns: longest common substring
+    :rType: str
+    '''
+    shortest = min(literals, key=len)
+    for length in range(len(shortest), 0, -1):
+        for start in range(0, len(shortest) - length + 1):
+            substring = shortest[start:start+length]
+            if all(substring in l for l in literals):
+                return substring
+    return ''
+
+def requiredliterals(regexp, maxclauses=3, minlength=2, maxalternatives=4):
+    ''' Return the literals clauses any match of `regexp` contains,
+        the longest `maxclauses` clauses are kept
+
+    ..note::
+        * a clause of alternatives sharing a common substring
+          is reduced to it, ex : (KeyError: , NameError: ) -> (Error: ,)
+          as one substring test is cheaper than many
+
+    :param regexp: expanded regex pattern
+    :type regexp: str
+    :param maxclauses: max number of clauses
+    :type maxclauses: int
+    :param minlength: clauses with a shorter literal are ignored
+    :type minlength: int
+    :param maxalternatives: clauses with more literals are ignored
+    :type maxalternatives: int
+    :returns: clauses as tuples of literals (str)
+    :rType: list
+    '''
+    clauses = set()
+    for clause in LiteralParser(regexp).parse():
+        if len(clause) > 1 :
+            substring = commonsubstring(clause)
+            if len(substring) >= minlength :
+                clause = (substring,)
+            elif len(clause) > maxalternatives :
+                continue
+
+        if min(len(l) for l in clause) >= minlength :
+            clauses.add(tuple(l.encode('ascii') for l in clause))
+
+    return selectclauses(clauses, maxclauses)
+
+def selectclauses(clauses, maxclauses=3):
+    ''' Return the `maxclauses` literals clauses with
+        the longest shortest literal
+
+    :param clauses: clauses as tuples of literals (str)
+    :type clauses: iterable
+    :param maxclauses: max number of clauses
+    :type maxclauses: int
+    :returns: clauses as tuples of literals (str)
+    :rType: list
+    '''
+    clauses = sorted(set(clauses), key=lambda c : (-min(len(l) for l in c), c))
+    return clauses[:maxclauses]
+
+def uncapturegroups(regexp):
+    ''' Return `regexp` with its capturing groups made non-capturing,
+        ex : (?<name>\\d+)(a|b) -> (?:\\d+)(?:a|b)
+
+    :param regexp: regex pattern without back references
+    :type regexp: str
+    :returns: regex pattern without capturing group
+    :rType: str
+    '''
+    output = []
+    pos = 0
+    while pos < len(regexp):
+        c = regexp[pos]
+        if c == '\\' :
+            output.append(regexp[pos:pos+2])
+            pos += 2
+            continue
+
+        if c == '[' :
+            # a first ] is a literal of the class
+            end = pos + 1
+            if regexp[end:end+1] == '^' :
+                end += 1
+            if regexp[end:end+1] == ']' :
+                end += 1
+            while end < len(regexp) and regexp[end] != ']' :
+                end += 2 if regexp[end] == '\\' else 1
+            output.append(regexp[pos:end+1])
+            pos = end + 1
+            continue
+
+        if c == '(' :
+            if regexp[pos+1:pos+2] != '?' :
+                output.append('(?:')
+                pos += 1
+                continue
+
+            named = NAMED_GROUP_RE.match(regexp, pos)
+            if named is not None :
+                output.append('(?:')
+                pos = named.end()
+                continue
+
+        output.append(c)
+        pos += 1
+
+    return ''.join(output)
+
+def expandreferences(text, expandname):
+    ''' Replace every %{NAME:subname predicate} reference of `text`
+        by the named group of NAME expanded regex, in a single pass
+
+    :param text: pattern text
+    :type text: str
+    :param expandname: return `GrokExpansion` of a pattern name
+    :type expandname: callable
+    :returns: text expansion
+    :rType: `GrokExpansion`
+    '''
+    predicates = {}
+    dependencies = set()
+
+    def formatreference(match):
+        pattern = match.group('pattern')
+        subname = match.group('subname')
+        predicate = match.group('predicate')
+
+        expansion = expandname(pattern)
+        predicates.update(expansion.predicates)
+        dependencies.add(pattern)
+        dependencies.update(expansion.dependencies)
+
+        if subname is not None :
+            result = '(?<{subname}>{regex})'.format(subname=subname,
+                    regex=expansion.regexp)
+        else :
+            result = '(?<{name}>{regex})'.format(name=match.group('name'),
+                    regex=expansion.regexp)
+
+        if predicate is not None :
+            # add pattern predicate + callout (?C1)
+            predicates[pattern] = predicate
+            result = '(?<C1_{name}>{pattern})'.format(name=pattern, pattern=result)
+        return result
+
+    regexp = PATTERN_REGEX.sub(formatreference, text)
+    return GrokExpansion(regexp=regexp, predicates=predicates,
+            dependencies=frozenset(dependencies))
+
+class PatternLibrary(object):
+    ''' PatternLibrary class
+
+        Immutable set of grok patterns loaded from the
+        .patterns files of a directory. A single library
+        is shared by all `Grok` instances, see `getpatternlibrary`
+
+    '''
+    def __init__(self, patternsdir, signature, patterns):
+        ''' Init patterns library
+
+        :param patternsdir: patterns files directory
+        :type patternsdir: str
+        :param signature: patterns files (name, mtime, size) signature
+        :type signature: tuple
+        :param patterns: patterns {name: `GrokPattern(name, regexp)`, ..}
+        :type patterns: dict
+        '''
+        self.__patternsdir = patternsdir
+        self.__signature = signature
+        self.__patterns = patterns
+
+        # memoized `GrokExpansion` by pattern name
+        self.__expansions = {}
+        self.__version = hashlib.sha1(json.dumps([patternsdir,
+            signature])).hexdigest()
+
+    @property
+    def patternsdir(self):
+        return self.__patternsdir
+
+    @property
+    def signature(self):
+        return self.__signature
+
+    @property
+    def version(self):
+        ''' Library version, changes when
+            a patterns file is modified
+
+        '''
+        return self.__version
+
+    def __contains__(self, name):
+        return name in self.__patterns
+
+    def get(self, name):
+        ''' Return grok pattern associated to name
+
+        :param name: pattern name
+        :type name: str
+        :returns: grok pattern
+        :rType: `GrokPattern`
+        '''
+        return self.__patterns.get(name)
+
+    def getpatterns(self):
+        ''' Return a copy of library patterns
+
+        :returns: patterns {name: `GrokPattern(name, regexp)`, ..}
+        :rType: dict
+        '''
+        return dict(self.__patterns)
+
+    def getpatternnames(self):
+        ''' Return patterns names list
+
+        :returns: patterns names
+        :rType: list
+        '''
+        return sorted(self.__patterns.keys())
+
+    def expand(self, name):
+        ''' Return pattern `name` fully expanded,
+            each pattern of the library is expanded once
+
+        :param name: pattern name
+        :type name: str
+        :returns: pattern expansion
+        :rType: `GrokExpansion`
+        :raises ValueError: undefined or cyclic pattern reference
+        '''
+        expansion = self.__expansions.get(name)
+        if expansion is None :
+            expansion = self._expand(name, [])
+        return expansion
+
+    def _expand(self, name, stack):
+        expansion = self.__expansions.get(name)
+        if expansion is not None :
+            return expansion
+
+        if name in stack :
+            cycle = stack[stack.index(name):] + [name]
+            raise ValueError('Cyclic pattern reference %s' % ' -> '.join(cycle))
+
+        pattern = self.__patterns.get(name)
+        if pattern is None :
+            if stack :
+                raise ValueError('Invalid pattern name %s referenced by %s' % (name, stack[-1]))
+            raise ValueError('Invalid pattern name %s' % name)
+
+        stack.append(name)
+        expansion = expandreferences(pattern.regexp,
+                lambda ref : self._expand(ref, stack))
+        stack.pop()
+
+        self.__expansions[name] = expansion
+        return expansion
+
+    def getdependencies(self, name):
+        ''' Return names of the library patterns
+            `name` depends on, directly or not
+
+        :param name: pattern name
+        :type name: str
+        :returns: pattern names
+        :rType: list
+        '''
+        return sorted(self.expand(name).dependencies)
+
+    @staticmethod
+    def getsignature(patternsdir):
+        ''' Return patterns directory signature as a sorted
+            tuple of (filename, mtime, size) for each .patterns file
+
+        :param patternsdir: patterns files directory
+        :type patternsdir: str
+        :returns: patterns directory signature
+        :rType: tuple
+        '''
+        signature = []
+        for f in os.listdir(patternsdir):
+            if not f.endswith('.patterns'):
+                continue
+            st = os.stat(os.path.join(patternsdir, f))
+            signature.append((f, st.st_mtime, st.st_size))
+        return tuple(sorted(signature))
+
+    @classmethod
+    def load(cls, patternsdir, signature=None):
+        ''' Load patterns library from directory
+
+        :param patternsdir: patterns files directory
+        :type patternsdir: str
+        :param signature: already computed directory signature
+        :type signature: tuple
+        :returns: patterns library
+        :rType: `PatternLibrary`
+        '''
+        if signature is None :
+            signature = cls.getsignature(patternsdir)
+
+        patterns = {}
+        for (f, mtime, size) in signature:
+            with open(os.path.join(patternsdir, f), 'r') as fp:
+                for l in fp:
+                    pattern = parsepatternline(l)
+                    if pattern is not None :
+                        patterns[pattern.name] = pattern
+
+        return cls(patternsdir, signature, patterns)
+
+class GrokCache(object):
+    ''' GrokCache class
+
+        Least recently used cache of `GrokCompiled` patterns
+        keyed by source pattern, patterns library version and flags
+
+    '''
+    def __init__(self, maxsize=512):
+        ''' Init cache
+
+        :param maxsize: max number of compiled patterns kept
+        :type maxsize: int
+        '''
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.__entries = OrderedDict()
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def get(self, key):
+        ''' Return cached value for `key`
+
+        :param key: cache key
+        :type key: tuple
+        :returns: cached value or None
+        :rType: `GrokCompiled`
+        '''
+        value = self.__entries.pop(key, None)
+        if value is None :
+            self.misses += 1
+            return None
+
+        # move entry to most recently used
+        self.__entries[key] = value
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        ''' Add value to cache, remove least
+            recently used entry if cache is full
+
+        :param key: cache key
+        :type key: tuple
+        :param value: value to cache
+        :type value: `GrokCompiled`
+        '''
+        self.__entries.pop(key, None)
+        self.__entries[key] = value
+        while len(self.__entries) > self.maxsize :
+            self.__entries.popitem(last=False)
+
+    def clear(self):
+        ''' Remove all entries and reset counters
+
+        '''
+        self.__entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def info(self):
+        ''' Return cache statistics
+
+        :returns: hits, misses, size and maxsize
+        :rType: dict
+        '''
+        return {'hits' : self.hits,
+                'misses' : self.misses,
+                'size' : len(self.__entries),
+                'maxsize' : self.maxsize}
+
+# process-wide compiled patterns cache
+GROK_CACHE = GrokCache()
+
+class GrokStore(object):
+    ''' GrokStore class
+
+        On-disk store of fully expanded grok patterns
+        and their predicates for a patterns library version.
+        The store file is read lazily on first lookup and
+        only written by `save` (see logparser --warm-cache)
+
+    '''
+    def __init__(self, path):
+        ''' Init store
+
+        :param path: store file path
+        :type path: str
+        '''
+        self.__path = path
+        self.__entries = None
+        self.__dirty = False
+
+    @property
+    def path(self):
+        return self.__path
+
+    @staticmethod
+    def getkey(pattern, localpatterns):
+        ''' Return store key for `pattern`
+
+        :param pattern: source grok pattern
+        :type pattern: str
+        :param localpatterns: `Grok` local patterns
+        :type localpatterns: tuple
+        :returns: store key
+        :rType: str
+        '''
+        return hashlib.sha1(json.dumps([pattern,
+            localpatterns])).hexdigest()
+
+    def _load(self):
+        self.__entries = {}
+
+        if not os.path.exists(self.__path):
+            return
+
+        try :
+            with open(self.__path, 'r') as f:
+                self.__entries = json.load(f)
+        except ValueError:
+            # ignore corrupted store, rebuilt on next save
+            self.__dirty = True
+
+    def __len__(self):
+        if self.__entries is None :
+            self._load()
+        return len(self.__entries)
+
+    def get(self, key):
+        ''' Return stored entry for `key`
+
+        :param key: store key
+        :type key: str
+        :returns: (expanded pattern, {name : predicate}, dependencies) or None
+        :rType: tuple
+        '''
+        if self.__entries is None :
+            self._load()
+
+        entry = self.__entries.get(key)
+        if entry is None :
+            return None
+        return (entry['expandpattern'], entry['predicates'],
+                entry.get('dependencies', []))
+
+    def set(self, key, expandpattern, predicates, dependencies=()):
+        ''' Add entry to store
+
+        :param key: store key
+        :type key: str
+        :param expandpattern: expanded regex pattern
+        :type expandpattern: str
+        :param predicates: predicates source by pattern name
+        :type predicates: dict
+        :param dependencies: pattern names the pattern depends on
+        :type dependencies: list
+        '''
+        if self.__entries is None :
+            self._load()
+
+        entry = {'expandpattern' : expandpattern,
+                 'predicates' : predicates,
+                 'dependencies' : list(dependencies)}
+        if self.__entries.get(key) != entry :
+            self.__entries[key] = entry
+            self.__dirty = True
+
+    def save(self):
+        ''' Write store file, an unchanged store already
+            written is not written again
+
+        :returns: store file path
+        :rType: str
+        '''
+        if not self.__dirty and os.path.exists(self.__path):
+            return self.__path
+
+        if self.__entries is None :
+            self._load()
+
+        directory = os.path.dirname(self.__path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        # write then rename to never expose a partial store
+        tmppath = '%s.%d.tmp' % (self.__path, os.getpid())
+        with open(tmppath, 'w') as f:
+            json.dump(self.__entries, f)
+        os.rename(tmppath, self.__path)
+        self.__dirty = False
+
+        return self.__path
+
+def getcachedir():
+    ''' Return logparser cache directory, $DEFAULT_CACHE_DIR
+        or $XDG_CACHE_HOME/logparser
+
+    :returns: cache directory
+    :rType: str
+    '''
+    cachedir = os.environ.get('DEFAULT_CACHE_DIR')
+    if cachedir :
+        return cachedir
+
+    cachehome = os.environ.get('XDG_CACHE_HOME') or \
+            os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cachehome, 'logparser')
+
+# process-wide pattern stores by path
+GROK_STORES = {}
+
+def getgrokstore(library):
+    ''' Return the on-disk store of `library` expanded patterns
+
+    :param library: patterns library
+    :type library: `PatternLibrary`
+    :returns: patterns store
+    :rType: `GrokStore`
+    '''
+    path = os.path.join(getcachedir(), 'patterns-%s.json' % library.version)
+
+    store = GROK_STORES.get(path)
+    if store is None :
+        store = GrokStore(path)
+        GROK_STORES[path] = store
+    return store
+
+# process-wide patterns libraries by directory
+PATTERN_LIBRARIES = {}
+
+def getpatternlibrary(patternsdir=None):
+    ''' Return the shared patterns library for `patternsdir`.
+        The library is loaded once and reloaded only
+        when a .patterns file is added, removed or modified
+
+    :param patternsdir: patterns files directory, default
+        is $DEFAULT_PATTERNS_DIR
+    :type patternsdir: str
+    :returns: patterns library
+    :rType: `PatternLibrary`
+    '''
+    if patternsdir is None :
+        patternsdir = os.environ.get('DEFAULT_PATTERNS_DIR')
+
+    patternsdir = os.path.abspath(patternsdir)
+    signature = PatternLibrary.getsignature(patternsdir)
+
+    library = PATTERN_LIBRARIES.get(patternsdir)
+    if library is None or library.signature != signature :
+        library = PatternLibrary.load(patternsdir, signature)
+        PATTERN_LIBRARIES[patternsdir] = library
+
+    return library
+
 
 class Grok(object):
     ''' Grok class
@@ -124,10 +1132,34 @@ class Grok(object):
         # full expanded pattern generated with compile()
         self.__expandpattern = None
 
-        # patterns library
+        # pattern names the compiled pattern depends on
+        self.__dependencies = ()
+
+        # required literals clauses checked before regex search
+        self.__prefilter = ()
+
+        # predicate checks as (group index, check function)
+        self.__predicatechecks = ()
+
+        # number of texts searched with regex and
+        # number of texts rejected by the literals prefilter
+        self.nbsearched = 0
+        self.nbrejected = 0
+
+        # shared patterns library
+        self.__library = getpatternlibrary()
+
+        # patterns added to this instance only
         self.__patterns = dict()
 
-        self.loadpatterns()
+        # predicates of compiled pattern by pattern name
+        self.__predicates = dict()
+
+        # predicates source string by pattern name
+        self.__predicatesources = dict()
+
+        # literals clauses required by predicates
+        self.__predicateliterals = []
 
     @property
     def pattern(self):
@@ -143,6 +1175,14 @@ class Grok(object):
         '''
         return self.__expandpattern
 
+    @property
+    def prefilter(self):
+        ''' Literals clauses a text must contain to match,
+            at least one literal of every clause
+
+        '''
+        return self.__prefilter
+
     def _strtoperator(self, strop):
         ''' String to operator
 
@@ -252,121 +1292,281 @@ class Grok(object):
             grokpredicate = self._predicate_numcompare(op, value)
 
         if grokpredicate is not None :
-            grokpattern = GrokPattern(name=pattern,
-                regexp=self.__patterns.get(pattern).regexp,
-                predicate=grokpredicate)
-            self.__patterns[pattern] = grokpattern
+            self.__predicates[pattern] = grokpredicate
+            self.__predicatesources[pattern] = predicate
+            self.__predicateliterals.extend(
+                    self._predicateliterals(op, grokpredicate))
 
-    def _regexcallout(self, key, value):
-        ''' Call regex callout for given match
-            `key` and `value`
+    def _predicateliterals(self, op, pred, minlength=2):
+        ''' Return literals clauses a line must contain
+            to satisfy predicate `pred`
 
-        :param key: key match
-        :type key: str
-        :param value: value match
-        :type value
-        :returns: callout function result
-        :rType: bool
+        :param op: predicate operator
+        :type op: str
+        :param pred: grok predicate
+        :type pred: `GrokPredicateStr` or `GrokPredicateRegex`
+        :param minlength: shorter literals are ignored
+        :type minlength: int
+        :returns: clauses as tuples of literals (str)
+        :rType: list
         '''
-        pattern = re.sub('C1_', '', key)
-        pred = self.getpattern(pattern).predicate
+        if isinstance(pred, GrokPredicateRegex):
+            if pred.negative_match :
+                return []
+            return requiredliterals(pred.pattern.pattern, minlength=minlength)
 
+        if isinstance(pred, GrokPredicateStr) and op == '$==' :
+            try :
+                literal = pred.value.encode('ascii')
+            except UnicodeError :
+                return []
+            if len(literal) >= minlength :
+                return [(literal,)]
+
+        return []
+
+    def _predicatecheck(self, pred):
+        ''' Return check function of a captured value
+            for predicate `pred`
+
+        :param pred: grok predicate
+        :type pred: `GrokPredicateNum`, `GrokPredicateStr`
+            or `GrokPredicateRegex`
+        :returns: check function
+        :rType: callable
+        '''
         if isinstance(pred, GrokPredicateNum):
-            return pred.op(pred.vtype(float(value)), pred.value)
+            (op, value) = (pred.op, pred.value)
+            if pred.vtype is float :
+                return lambda v : op(float(v), value)
+            return lambda v : op(int(float(v)), value)
         elif isinstance(pred, GrokPredicateStr):
-            return pred.op(value, pred.value)
+            (op, value) = (pred.op, pred.value)
+            return lambda v : op(v, value)
         elif isinstance(pred, GrokPredicateRegex):
+            search = pred.pattern.search
             if pred.negative_match :
-                return not pred.pattern.search(value)
-            else :
-                return pred.pattern.search(value)
-        return False
+                return lambda v : search(v) is None
+            return lambda v : search(v) is not None
+        return lambda v : False
+
+    def _compilepredicates(self, expandpattern):
+        ''' Compile predicates of `expandpattern` callout groups
+            in a flat list of checks, cheapest checks first
+
+        :param expandpattern: compiled expanded pattern
+        :type expandpattern: `regex.Pattern`
+        :returns: (group index, check function) list
+        :rType: tuple
+        '''
+        checks = []
+        for (groupname, index) in expandpattern.groupindex.items():
+            if not groupname.startswith('C1_'):
+                continue
+            # a callout without predicate never matches
+            pred = self.__predicates.get(groupname[len('C1_'):])
+            cost = PREDICATE_COSTS.get(type(pred), len(PREDICATE_COSTS))
+            checks.append((cost, index, self._predicatecheck(pred)))
 
-    def _formatpattern(self, match):
-        ''' Generate a new pattern based
-            on capture results
+        return tuple((index, check) for (cost, index, check) in \
+                sorted(checks, key=operator.itemgetter(0, 1)))
 
-        :param match: grok match regex object
-        :type match: regex.Match
-        :returns: formatted pattern
-        :rType: str
+    def _expandname(self, name, expansions, stack):
+        ''' Return pattern `name` expansion, library patterns
+            are expanded by the shared library unless they
+            depend on a pattern overridden in this instance
+
+        :param name: pattern name
+        :type name: str
+        :param expansions: local expansions by pattern name
+        :type expansions: dict
+        :param stack: pattern names being expanded
+        :type stack: list
+        :returns: pattern expansion
+        :rType: `GrokExpansion`
         '''
-        gdict = match.groupdict()
-        subname = gdict.get('subname')
-        name = gdict.get('name')
-        predicate = gdict.get('predicate')
+        expansion = expansions.get(name)
+        if expansion is not None :
+            return expansion
 
-        pformat = '({regex})'
-        if subname is not None :
-            pformat = '(?<{subname}>{regex})'
-        else :
-            pformat = '(?<{name}>{regex})'
+        if name not in self.__patterns and name in self.__library :
+            expansion = self.__library.expand(name)
+            if not expansion.dependencies.intersection(self.__patterns):
+                return expansion
 
-        if match.group('pattern') not in self.__patterns :
-            raise ValueError('Invalid pattern name %s' % match.group('pattern'))
+        if name in stack :
+            cycle = stack[stack.index(name):] + [name]
+            raise ValueError('Cyclic pattern reference %s' % ' -> '.join(cycle))
 
-        result = pformat.format(name=name,
-            subname=subname, regex=self.__patterns.get(match.group('pattern')).regexp)
+        grokpattern = self.getpattern(name)
+        if grokpattern is None :
+            raise ValueError('Invalid pattern name %s' % name)
 
-        if predicate is not None :
-            # add pattern predicate + callout (?C1)
-            self._addpredicate(match.group('pattern'), predicate)
-            result = '(?<C1_{name}>{pattern})'.format(name=match.group('pattern'), pattern=result)
-        return result
+        stack.append(name)
+        expansion = expandreferences(grokpattern.regexp,
+                lambda ref : self._expandname(ref, expansions, stack))
+        stack.pop()
+
+        expansions[name] = expansion
+        return expansion
 
-    def compile(self, pattern):
+    def _expand(self, pattern):
+        ''' Expand grok pattern with regex substituion
+            of every %{...} reference in a single pass
+
+        :param pattern: pattern to expand
+        :type pattern: str
+        :returns: pattern expansion
+        :rType: `GrokExpansion`
+        '''
+        expansions = {}
+        expansion = expandreferences(pattern,
+                lambda ref : self._expandname(ref, expansions, []))
+
+        for name, predicate in expansion.predicates.items():
+            self._addpredicate(name, predicate)
+
+        return expansion
+
+    def compile(self, pattern, flags=0):
         ''' Expand grok pattern with regex substituion
             and compile
 
         :param pattern: pattern to compile
         :type pattern: str
+        :param flags: regex flags, ex : re.MULTILINE
+        :type flags: int
         '''
         self.__pattern = pattern
-        py_regex_pattern = self.__pattern
 
-        while True:
+        localpatterns = tuple(sorted(self.__patterns.items()))
+        key = (pattern, self.__library.version, localpatterns, flags)
+        compiled = GROK_CACHE.get(key)
 
-            # replace %{pattern_name:custom_name} with regex
-            # and regex group name (?P<name>)
-            py_regex_pattern = re.sub(PATTERN_REGEX, lambda match :
-                        self._formatpattern(match), py_regex_pattern)
+        if compiled is None :
+            self.__predicates = dict()
+            self.__predicatesources = dict()
+            self.__predicateliterals = []
 
-            # break if PATTERN_REGEX not found
-            if re.search(PATTERN_REGEX, py_regex_pattern) is None:
-                break
+            store = getgrokstore(self.__library)
+            storekey = store.getkey(pattern, localpatterns)
+            entry = store.get(storekey)
 
-        self.__expandpattern = re.compile(py_regex_pattern)
+            if entry is not None :
+                (py_regex_pattern, predicates, dependencies) = entry
+                for name, predicate in predicates.items():
+                    self._addpredicate(name, predicate)
+            else :
+                expansion = self._expand(pattern)
+                py_regex_pattern = expansion.regexp
+                dependencies = sorted(expansion.dependencies)
+                store.set(storekey, py_regex_pattern,
+                        self.__predicatesources, dependencies)
+
+            expandpattern = re.compile(py_regex_pattern, flags)
+            compiled = GrokCompiled(expandpattern=expandpattern,
+                    predicates=self.__predicates,
+                    dependencies=tuple(dependencies),
+                    prefilter=tuple(selectclauses(
+                        requiredliterals(py_regex_pattern) +
+                        self.__predicateliterals)),
+                    predicatechecks=self._compilepredicates(expandpattern))
+            GROK_CACHE.set(key, compiled)
+
+        self.__expandpattern = compiled.expandpattern
+        self.__predicates = compiled.predicates
+        self.__dependencies = compiled.dependencies
+        self.__prefilter = compiled.prefilter
+        self.__predicatechecks = compiled.predicatechecks
+
+    def getdependencies(self):
+        ''' Return names of the patterns the compiled
+            pattern depends on, directly or not
+
+        :returns: pattern names
+        :rType: list
+        '''
+        return list(self.__dependencies)
+
+    def _checkprefilter(self, text):
+        ''' Check required literals clauses in `text`
+
+        :param text: text to match
+        :type text: str
+        :returns: `False` if `text` can not match
+        :rType: bool
+        '''
+        for clause in self.__prefilter :
+            for literal in clause :
+                if literal in text :
+                    break
+            else :
+                self.nbrejected += 1
+                return False
+        return True
+
+    def _checkpredicates(self, match):
+        ''' Check predicate callouts of `match`
+
+        :param match: regex match object
+        :type match: `regex.Match`
+        :returns: `True` if all predicates are satisfied
+        :rType: bool
+        '''
+        for (index, check) in self.__predicatechecks :
+            value = match.group(index)
+            if value is None :
+                return False
+            try :
+                if not check(value):
+                    return False
+            except ValueError :
+                return False
+        return True
 
-    def match(self, text):
+    def match(self, text, prefilter=True):
         ''' Search for compiled `pattern` in `text`
 
         :param text: text to match
         :type text: str
+        :param prefilter: test required literals before
+            regex search, disabled when already tested
+        :type prefilter: bool
         :returns: regex match object
         :rType: `regex.Match`
         '''
+        if prefilter and not self._checkprefilter(text):
+            return None
+
+        self.nbsearched += 1
         match = self.__expandpattern.search(text)
         if match is None:
             return None
 
         # predicate callout
-        callouts = [k for k in match.groupdict() if k.startswith('C1_')]
-        if not len(callouts):
-            return match
-
-        if all(self._regexcallout(c, match.groupdict().get(c)) for c in callouts):
+        if self._checkpredicates(match):
             return match
 
-    def finditer(self, text):
+    def finditer(self, text, prefilter=True):
         ''' Return an iterator yielding `regex.Match`
             instances over all matches for `pattern` in `text`
+            satisfying the pattern predicates
 
         :param text: text to match
         :type text: str
+        :param prefilter: test required literals before
+            regex search, disabled when already tested
+        :type prefilter: bool
         :return: iterator over all matches
-        :rType: regex.Scanner
+        :rType: iterator
         '''
-        return self.__expandpattern.finditer(text)
+        if prefilter and not self._checkprefilter(text):
+            return
+
+        self.nbsearched += 1
+        for match in self.__expandpattern.finditer(text):
+            if self._checkpredicates(match):
+                yield match
 
     def loadpatternsfromfile(self, filepath):
         ''' Load pattern from file
@@ -379,7 +1579,9 @@ class Grok(object):
         patterns = {}
         with open(filepath, 'r') as f:
             for l in f:
-                self.loadpatternsfromstring(l)
+                pattern = self.loadpatternsfromstring(l)
+                if pattern is not None :
+                    patterns[pattern.name] = pattern
         return patterns
 
     def loadpatternsfromstring(self, text):
@@ -390,35 +1592,30 @@ class Grok(object):
         :returns: grok pattern
         :rType: `GrokPattern`
         '''
-        text = text.decode('utf-8').strip()
-        if text == '' or text.startswith('#'):
+        pattern = parsepatternline(text)
+        if pattern is None :
             return
 
-        sep = text.find(' ')
-        name = text[:sep]
-        regexp = text[sep:].strip()
-        pattern = GrokPattern(name, regexp)
-        self.__patterns.update({name : pattern})
+        self.__patterns.update({pattern.name : pattern})
         return pattern
 
     def loadpatterns(self, patternsdir=None):
-        ''' Load pattern files
+        ''' Use the shared patterns library of `patternsdir`
 
         :param patternsdir: patterns files directory
         :type patternsdir: str
         :returns: patterns {name: `GrokPattern(name, regexp)`, ..}
         :rType: dict
         '''
-        if patternsdir is None :
-            patternsdir = os.environ.get('DEFAULT_PATTERNS_DIR')
+        self.__library = getpatternlibrary(patternsdir)
+        return self.__library.getpatterns()
 
-        patterns = {}
-        for f in os.listdir(patternsdir):
-            if not os.path.join(patternsdir, f).endswith('.patterns'):
-                continue
-            filepatterns = self.loadpatternsfromfile(os.path.join(patternsdir, f))
-            patterns.update(filepatterns)
-        return patterns
+    @property
+    def library(self):
+        ''' Shared patterns library
+
+        '''
+        return self.__library
 
     def getpatternnames(self):
         ''' Return patterns names list
@@ -426,7 +1623,8 @@ class Grok(object):
         :returns: patterns names
         :rType: list
         '''
-        return sorted(self.__patterns.keys())
+        return sorted(set(self.__library.getpatternnames()) |
+                set(self.__patterns.keys()))
 
     def addpattern(self, name, regexp):
         ''' Add pattern with name and associated regex
@@ -447,8 +1645,111 @@ class Grok(object):
         :returns: grok pattern
         :rType: GrokPattern
         '''
-        return self.__patterns.get(name)
+        pattern = self.__patterns.get(name)
+        if pattern is None :
+            pattern = self.__library.get(name)
+
+        if pattern is not None and name in self.__predicates :
+            pattern = pattern._replace(predicate=self.__predicates.get(name))
+        return pattern
+
+
+class NewlineIndex(object):
+    ''' NewlineIndex class
+
+        Map buffer offsets to line number and line bounds,
+        newline offsets are precomputed by blocks with numpy if
+        available, otherwise lines are found around each offset
+        and counted between successive offsets
+
+    '''
+    def __init__(self, buffer):
+        ''' Init newline index
+
+        :param buffer: buffer to index
+        :type buffer: str or mmap.mmap
+        '''
+        self.__buffer = buffer
+        self.__size = len(buffer)
+        self.__newlines = None
+        if numpy is not None :
+            self.__newlines = self.__indexnewlines()
+        # last (offset, line number) counted without numpy
+        self.__last = (0, 1)
+
+    def __indexnewlines(self):
+        # buffer is compared by blocks, a mask of the whole
+        # buffer would take as much memory as the buffer
+        newlines = [numpy.empty(0, dtype=numpy.intp)]
+        for offset in range(0, self.__size, DEFAULT_BLOCKSIZE):
+            block = numpy.frombuffer(self.__buffer, dtype=numpy.uint8,
+                    count=min(DEFAULT_BLOCKSIZE, self.__size - offset), offset=offset)
+            newlines.append(numpy.flatnonzero(block == 10) + offset)
+        return numpy.concatenate(newlines)
+
+    def getbounds(self, offset):
+        ''' Return bounds of line holding buffer offset
+
+        :param offset: buffer offset
+        :type offset: int
+        :returns: line start and line end offsets, end excluding newline
+        :rType: tuple
+        '''
+        if self.__newlines is not None :
+            index = int(numpy.searchsorted(self.__newlines, offset))
+            return self.__getindexbounds(index)
+
+        start = self.__buffer.rfind(b'\n', 0, offset) + 1
+        end = self.__buffer.find(b'\n', offset)
+        if end < 0 :
+            end = self.__size
+        return (start, end)
+
+    def __getindexbounds(self, index):
+        start = 0
+        if index > 0 :
+            start = int(self.__newlines[index-1]) + 1
+        end = self.__size
+        if index < len(self.__newlines):
+            end = int(self.__newlines[index])
+        return (start, end)
+
+    def getline(self, offset):
+        ''' Return line number and bounds of line holding buffer offset
+
+        :param offset: buffer offset
+        :type offset: int
+        :returns: line number starting at 1, line start and line end
+            offsets, end excluding newline
+        :rType: tuple
+        '''
+        if self.__newlines is not None :
+            index = int(numpy.searchsorted(self.__newlines, offset))
+            (start, end) = self.__getindexbounds(index)
+            return (index + 1, start, end)
 
+        (start, end) = self.getbounds(offset)
+
+        # offsets are usually asked in order, count from the last one
+        (lastoffset, lineno) = self.__last
+        if start < lastoffset :
+            (lastoffset, lineno) = (0, 1)
+        lineno += self.__buffer[lastoffset:start].count(b'\n')
+        self.__last = (start, lineno)
+
+        return (lineno, start, end)
+
+
+def getlinedigest(line):
+    ''' Return digest of a line without terminator, identifies
+        a partial last line of a file between scans
+
+    :param line: line without terminator
+    :type line: str
+    :returns: line sha1 hex digest
+    :rType: str
+    '''
+    return hashlib.sha1(line).hexdigest()
 
 class InputProgram(object):
     ''' InputProgram class
@@ -465,8 +1766,20 @@ class InputProgram(object):
         self.nbmatches = 0
         self.done = 0
         self.restartdelay = None
+        self.lineno = 0
 
-    def run(self, matchcallback, nomatchcallback):
+        # digest of the last line read when it has no terminator,
+        # offset stays at its start, see `getlinedigest`
+        self.partial = None
+
+        # lines evaluated and bytes read,
+        # reading and matching time in seconds
+        self.nblines = 0
+        self.nbbytes = 0
+        self.elapsed = 0.0
+
+    def run(self, matchcallback, nomatchcallback, endcallback=None,
+            idlecallback=None):
         ''' Run read file/output process, call `matchcallback` for
             each line and nomatchcallback at the end of file/process
 
@@ -474,12 +1787,31 @@ class InputProgram(object):
         :type matchcallback: callable
         :param nomatchcallback: no-match callback
         :type nomatchcallback: callable
+        :param endcallback: end of file/process callback, called
+            before the no-match one
+        :type endcallback: callable
+        :param idlecallback: callback of a running input, called
+            while it waits for data and every `IDLE_INTERVAL` seconds
+            while it reads data
+        :type idlecallback: callable
         '''
-        for line in self.readline():
-            if not line :
-                break
-
-            matchcallback(self, line.rstrip('\n'))
+        start = time.time()
+        nextidle = start + IDLE_INTERVAL
+        for lines in self.readlines():
+            # inputs waiting for data yield empty lines lists
+            if idlecallback is not None and \
+                    (not lines or time.time() >= nextidle) :
+                nextidle = time.time() + IDLE_INTERVAL
+                idlecallback(self)
+            for line in lines :
+                self.lineno += 1
+                matchcallback(self, line)
+
+        if endcallback is not None :
+            endcallback(self)
+
+        self.nblines = self.lineno
+        self.elapsed += time.time() - start
 
         # execute nomatch if on in this program
         if self.nbmatches == 0 :
@@ -495,6 +1827,71 @@ class InputProgram(object):
         '''
         NotImplementedError
 
+    def readlines(self):
+        ''' Return iterator of lines lists, lines without
+            line terminator
+
+        :returns: lines lists iterator
+        :rType: iterator
+        '''
+        for line in self.readline():
+            if not line :
+                break
+
+            self.nbbytes += len(line)
+            yield (line.rstrip('\n'),)
+
+    def _splitblocks(self, blocks):
+        ''' Return iterator of lines lists split from data blocks,
+            lines spanning blocks are joined and `offset` follows
+            the last complete line. A last line without terminator
+            is read and its digest kept in `partial`
+
+        :param blocks: data blocks iterator
+        :type blocks: iterator
+        :returns: lines lists iterator
+        :rType: iterator
+        '''
+        # partial line at the end of previous block
+        tail = b''
+        for block in blocks :
+            # no data available yet
+            if block is None :
+                yield ()
+                continue
+            if not block :
+                continue
+
+            self.nbbytes += len(block)
+            lines = block.split(b'\n')
+            lines[0] = tail + lines[0]
+            self.offset += len(block) + len(tail)
+            tail = lines.pop()
+            self.offset -= len(tail)
+            yield lines
+
+        if tail :
+            self.partial = getlinedigest(tail)
+            yield (tail,)
+
+    @property
+    def linespersec(self):
+        ''' Lines read and matched per second
+
+        '''
+        if not self.elapsed :
+            return 0.0
+        return self.nblines / self.elapsed
+
+    @property
+    def bytespersec(self):
+        ''' Bytes read and matched per second
+
+        '''
+        if not self.elapsed :
+            return 0.0
+        return self.nbbytes / self.elapsed
+
     @property
     def inputname(self):
         inputname = ''
@@ -503,6 +1900,9 @@ class InputProgram(object):
 
         elif isinstance( self, InputProgramProcess ):
             inputname = self.command
+
+        elif isinstance( self, InputProgramStdin ):
+            inputname = STDIN_INPUTNAME
         return inputname
 
 class InputProgramFile(InputProgram):
@@ -511,20 +1911,48 @@ class InputProgramFile(InputProgram):
         This class is used to read file line
         as program input
     '''
-    def __init__(self, filepath):
+    def __init__(self, filepath, reader=READER_BLOCK, blocksize=DEFAULT_BLOCKSIZE,
+            offset=0, end=None, partial=None):
         ''' Init program file
 
         :param filepath: filepath to read
         :type filepath: str
+        :param reader: file reader, see `READERS`. default is block
+        :type reader: str
+        :param blocksize: block reader block size in bytes
+        :type blocksize: int
+        :param offset: offset to start reading from
+        :type offset: int
+        :param end: offset to stop reading at, a line start.
+            default is to read until end of file
+        :type end: int
+        :param partial: digest of the line without terminator at
+            `offset` read by a previous scan, the line is not read
+            again while it is unchanged
+        :type partial: str
         '''
         InputProgram.__init__(self)
         self.__path = filepath
         self.__stat = None
 
+        # offset following the last complete line read
+        self.offset = offset
+        self.__end = end
+        self.partial = partial
+
+        if reader not in READERS :
+            raise ValueError('Invalid reader %s' % reader)
+        self.__reader = reader
+        self.__blocksize = blocksize
+
     @property
     def path(self):
         return self.__path
 
+    @property
+    def end(self):
+        return self.__end
+
     @property
     def stat(self):
         if self.__stat is None :
@@ -551,51 +1979,1477 @@ class InputProgramFile(InputProgram):
 
         with open(self.path, 'r') as f :
             m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            m.seek(self.offset)
             for line in iter(m.readline, ''):
+                if line.endswith(b'\n'):
+                    self.offset += len(line)
+                else :
+                    self.partial = getlinedigest(line)
                 yield line
 
+                if self.__end is not None and m.tell() >= self.__end :
+                    break
+
+    def readlines(self):
+        ''' Return iterator of lines lists read by blocks,
+            lines without line terminator
+
+        :returns: lines lists iterator
+        :rType: iterator
+        '''
+        # partial line read by a previous scan
+        (partial, self.partial) = (self.partial, None)
+        for lines in self._readfilelines():
+            if partial is not None and lines :
+                if getlinedigest(lines[0]) == partial :
+                    lines = lines[1:]
+                partial = None
+            yield lines
+
+    def _readfilelines(self):
+        if self.__reader == READER_MMAP :
+            for lines in InputProgram.readlines(self):
+                yield lines
+            return
+
+        with open(self.path, 'rb') as f :
+            f.seek(self.offset)
+            for lines in self._splitblocks(self._readblocks(f)):
+                yield lines
+
+    def _readblocks(self, f):
+        ''' Return iterator of file blocks until end offset
+
+        :param f: file object
+        :type f: file
+        :returns: blocks iterator
+        :rType: iterator
+        '''
+        if self.__end is None :
+            for block in iter(lambda : f.read(self.__blocksize), b''):
+                yield block
+            return
+
+        remaining = self.__end - f.tell()
+        while remaining > 0 :
+            block = f.read(min(self.__blocksize, remaining))
+            if not block :
+                break
+            remaining -= len(block)
+            yield block
+
+    @property
+    def blocksize(self):
+        return self.__blocksize
+
+    def runbuffer(self, patterns, matchcallback, nomatchcallback, endcallback=None):
+        ''' Run patterns over the whole mapped file, call `matchcallback`
+            only for lines holding a pattern hit, in file order, and
+            nomatchcallback at the end of file
+
+        :param patterns: MULTILINE compiled patterns
+        :type patterns: list of regex.Pattern
+        :param matchcallback: match callback
+        :type matchcallback: callable
+        :param nomatchcallback: no-match callback
+        :type nomatchcallback: callable
+        :param endcallback: end of file callback, called
+            before the no-match one
+        :type endcallback: callable
+        '''
+        # byte ranges are read line by line
+        if self.__end is not None :
+            return self.run(matchcallback, nomatchcallback, endcallback)
+
+        begin = time.time()
+        if self.size > 0 :
+            with open(self.path, 'r') as f :
+                m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                try :
+                    index = NewlineIndex(m)
+                    # a trailing newline ends the last line, it does
+                    # not start an empty one
+                    datasize = len(m)
+                    if m[datasize-1] == b'\n' :
+                        datasize -= 1
+                    # start offsets of lines holding a hit
+                    lines = set()
+                    for pattern in patterns :
+                        pos = 0
+                        while pos <= datasize :
+                            match = pattern.search(m, pos)
+                            if match is None or match.start() > datasize :
+                                break
+                            (start, end) = index.getbounds(match.start())
+                            lines.add(start)
+                            # next hit starts on the next line at least
+                            pos = end + 1
+
+                    # line numbers are counted in file order
+                    for start in sorted(lines):
+                        (self.lineno, start, end) = index.getline(start)
+                        matchcallback(self, m[start:end])
+
+                    self.nblines = len(lines)
+                    self.nbbytes = len(m)
+                    self.offset = m.rfind(b'\n') + 1
+                    if self.offset < len(m):
+                        self.partial = getlinedigest(m[self.offset:])
+                finally :
+                    m.close()
+
+        if endcallback is not None :
+            endcallback(self)
+        self.elapsed += time.time() - begin
+
+        # execute nomatch if on in this program
+        if self.nbmatches == 0 :
+            nomatchcallback(self)
+
+        self.done = 1
+
+class InputProgramFollowFile(InputProgramFile):
+    ''' InputProgramFollowFile class
+
+        This class is used to read lines appended to a growing
+        file as program input, like tail -F. Truncated or rotated
+        files are reopened and idle files are polled with an
+        increasing delay
+    '''
+    def __init__(self, filepath, blocksize=DEFAULT_BLOCKSIZE, offset=0,
+            mindelay=0.1, maxdelay=5, timeout=None):
+        ''' Init program follow file
+
+        :param filepath: filepath to follow
+        :type filepath: str
+        :param blocksize: block size in bytes
+        :type blocksize: int
+        :param offset: offset to start reading from
+        :type offset: int
+        :param mindelay: poll delay in seconds after new data
+        :type mindelay: float
+        :param maxdelay: max poll delay in seconds of an idle file
+        :type maxdelay: float
+        :param timeout: stop after `timeout` idle seconds,
+            default is to follow until stop() is called
+        :type timeout: float
+        '''
+        InputProgramFile.__init__(self, filepath, blocksize=blocksize,
+                offset=offset)
+
+        self.restartdelay = mindelay
+        self.__mindelay = mindelay
+        self.__maxdelay = maxdelay
+        self.__timeout = timeout
+        self.__stopped = False
+
+    def stop(self):
+        ''' Stop following file once current poll ends
+
+        '''
+        self.__stopped = True
+
+    def readline(self):
+        ''' Return followed file read line iterator
+
+        :returns: line iterator
+        :rType: iterator
+        '''
+        for lines in self.readlines():
+            for line in lines :
+                yield line + b'\n'
+
+    def _open(self, offset):
+        ''' Open followed file at `offset`, from start if the
+            file is shorter
+
+        :param offset: offset to start reading from
+        :type offset: int
+        :returns: file object and inode or None if file does not exist
+        :rType: tuple
+        '''
+        try :
+            f = open(self.path, 'rb')
+        except IOError :
+            return (None, None)
+
+        stat = os.fstat(f.fileno())
+        if offset > stat.st_size :
+            offset = 0
+        f.seek(offset)
+        self.offset = offset
+
+        return (f, stat.st_ino)
+
+    def readlines(self):
+        ''' Return iterator of appended lines lists, lines without
+            line terminator. A partial last line is left unread
+            until it is complete and an empty list is yielded on
+            each poll of an idle file
+
+        :returns: lines lists iterator
+        :rType: iterator
+        '''
+        (f, inode) = self._open(self.offset)
+        # partial line at the end of previous block
+        tail = b''
+        idle = 0.0
+
+        try :
+            while not self.__stopped :
+                block = f.read(self.blocksize) if f is not None else b''
+                if block :
+                    self.nbbytes += len(block)
+                    lines = block.split(b'\n')
+                    lines[0] = tail + lines[0]
+                    tail = lines.pop()
+                    self.offset = f.tell() - len(tail)
+                    self.restartdelay = self.__mindelay
+                    idle = 0.0
+                    if lines :
+                        yield lines
+                    continue
+
+                try :
+                    stat = os.stat(self.path)
+                except OSError :
+                    # removed and not created again yet
+                    stat = None
+
+                if stat is not None and (f is None or stat.st_ino != inode \
+                        or stat.st_size < f.tell()):
+                    # rotated or truncated, the partial line is complete
+                    if tail :
+                        yield (tail,)
+                        tail = b''
+                    if f is not None :
+                        f.close()
+                    (f, inode) = self._open(0)
+                    continue
+
+                if self.__timeout is not None and idle >= self.__timeout :
+                    break
+
+                yield ()
+                time.sleep(self.restartdelay)
+                idle += self.restartdelay
+                self.restartdelay = min(self.restartdelay * 2, self.__maxdelay)
+        finally :
+            if f is not None :
+                f.close()
+
+    def runbuffer(self, patterns, matchcallback, nomatchcallback, endcallback=None):
+        ''' Followed files are not mapped, lines are read
+            by blocks and matched one by one
+
+        '''
+        self.run(matchcallback, nomatchcallback, endcallback)
+
+
+class DirEntry(object):
+    ''' DirEntry class
+
+        os.DirEntry like directory entry used when scandir
+        is not available, stat results are cached and the
+        lstat result of an entry which is not a symlink is
+        its stat result too
+    '''
+    def __init__(self, dirpath, name):
+        ''' Init directory entry
+
+        :param dirpath: directory path
+        :type dirpath: str
+        :param name: entry name
+        :type name: str
+        '''
+        self.name = name
+        self.path = os.path.join(dirpath, name)
+        self.__stat = None
+        self.__lstat = None
+
+    def stat(self, follow_symlinks=True):
+        if not follow_symlinks :
+            if self.__lstat is None :
+                self.__lstat = os.lstat(self.path)
+            return self.__lstat
+
+        if self.__stat is None :
+            if self.__lstat is not None and not S_ISLNK(self.__lstat.st_mode):
+                self.__stat = self.__lstat
+            else :
+                self.__stat = os.stat(self.path)
+        return self.__stat
+
+    def is_dir(self, follow_symlinks=True):
+        try :
+            return S_ISDIR(self.stat(follow_symlinks).st_mode)
+        except OSError :
+            return False
+
+    def is_file(self, follow_symlinks=True):
+        try :
+            return S_ISREG(self.stat(follow_symlinks).st_mode)
+        except OSError :
+            return False
+
+def iterdirentries(dirpath):
+    ''' Return directory entries of `dirpath` with scandir
+        or os.listdir
+
+    :param dirpath: directory path
+    :type dirpath: str
+    :returns: directory entries
+    :rType: iterator
+    '''
+    if scandir is not None :
+        return scandir(dirpath)
+    return (DirEntry(dirpath, name) for name in os.listdir(dirpath))
+
+def discoverinputs(root, recursive=False, include=None, exclude=None,
+        minsize=None, maxsize=None, minmtime=None, maxmtime=None):
+    ''' Yield files of `root` directory, directories are read one
+        at a time with their entries sorted by name, entries stat
+        are the ones cached by scandir
+
+    ..note::
+        * glob patterns are matched against entry names, or entry
+          paths relative to `root` if they hold a path separator
+        * excluded directories are not read
+        * symbolic links to directories are not followed
+
+    :param root: root directory
+    :type root: str
+    :param recursive: read sub directories
+    :type recursive: bool
+    :param include: glob patterns of files to yield, default is all
+    :type include: list
+    :param exclude: glob patterns of files and directories to skip
+    :type exclude: list
+    :param minsize: minimum file size in bytes
+    :type minsize: int
+    :param maxsize: maximum file size in bytes
+    :type maxsize: int
+    :param minmtime: minimum file modification time
+    :type minmtime: float
+    :param maxmtime: maximum file modification time
+    :type maxmtime: float
+    :returns: file paths
+    :rType: iterator
+    '''
+    def globmatch(name, relpath, patterns):
+        return any(fnmatch(relpath if os.sep in pattern else name, pattern) \
+                for pattern in patterns)
+
+    def direntries(dirpath):
+        return iter(sorted(iterdirentries(dirpath), key=lambda e : e.name))
+
+    statfilter = (minsize, maxsize, minmtime, maxmtime) != (None,) * 4
+    # root errors are raised, unreadable sub directories skipped
+    directories = [(direntries(root), '')]
+    while directories :
+        (entries, reldirpath) = directories[-1]
+        entry = next(entries, None)
+        if entry is None :
+            directories.pop()
+            continue
+
+        relpath = os.path.join(reldirpath, entry.name)
+        if exclude and globmatch(entry.name, relpath, exclude):
+            continue
+
+        if entry.is_dir(follow_symlinks=False):
+            # depth first, in name order
+            if recursive :
+                try :
+                    directories.append((direntries(entry.path), relpath))
+                except OSError :
+                    pass
+            continue
+
+        if not entry.is_file():
+            continue
+
+        if include and not globmatch(entry.name, relpath, include):
+            continue
+
+        if statfilter :
+            try :
+                stat = entry.stat()
+            except OSError :
+                continue
+            if (minsize is not None and stat.st_size < minsize) or \
+                    (maxsize is not None and stat.st_size > maxsize) or \
+                    (minmtime is not None and stat.st_mtime < minmtime) or \
+                    (maxmtime is not None and stat.st_mtime > maxmtime) :
+                continue
+
+        yield entry.path
+
+def splitinputfile(filepath, offset, size, splitsize):
+    ''' Split file from `offset` to `size` in byte ranges
+        of about `splitsize` bytes starting at line starts
+
+    :param filepath: file path
+    :type filepath: str
+    :param offset: range start, a line start
+    :type offset: int
+    :param size: file size
+    :type size: int
+    :param splitsize: range size
+    :type splitsize: int
+    :returns: (start, end) ranges, end excluded
+    :rType: list
+    '''
+    bounds = [offset]
+    with open(filepath, 'rb') as f :
+        position = offset + splitsize
+        while position < size :
+            # next line start
+            f.seek(position)
+            while True :
+                chunk = f.read(65536)
+                index = chunk.find(b'\n')
+                if index >= 0 or not chunk :
+                    break
+                position += len(chunk)
+
+            if index < 0 :
+                break
+            position += index + 1
+            if position >= size :
+                break
+
+            bounds.append(position)
+            position += splitsize
+
+    bounds.append(size)
+    return zip(bounds[:-1], bounds[1:])
+
+class InputProgramStdin(InputProgram):
+    ''' InputProgramStdin class
+
+        This class is used to read a stream piped to the standard
+        input as program input. Blocks are read as soon as they are
+        available so lines are matched while the stream is written
+    '''
+    def __init__(self, stream=None, blocksize=DEFAULT_BLOCKSIZE):
+        ''' Init program standard input
+
+        :param stream: stream to read, default is sys.stdin
+        :type stream: file
+        :param blocksize: maximum bytes read at once
+        :type blocksize: int
+        '''
+        InputProgram.__init__(self)
+        self.__stream = stream if stream is not None else sys.stdin
+        self.__blocksize = blocksize
+
+        # offset following the last complete line read
+        self.offset = 0
+
+    @property
+    def blocksize(self):
+        return self.__blocksize
+
+    def readline(self):
+        ''' Return stream line iterator
+
+        :returns: line iterator
+        :rType: iterator
+        '''
+        for lines in self.readlines():
+            for line in lines :
+                yield line + b'\n'
+
+    def readlines(self):
+        ''' Return iterator of lines lists read from the stream,
+            in blocks of up to `blocksize` bytes. An empty list is
+            yielded every `IDLE_INTERVAL` seconds without data
+
+        :returns: lines lists iterator
+        :rType: iterator
+        '''
+        for lines in self._splitblocks(self._readblocks()):
+            yield lines
+
+    def _readblocks(self):
+        ''' Return iterator of stream blocks, a read returns
+            the bytes available instead of waiting for a full block,
+            None is yielded when no data is available
+
+        :returns: blocks iterator
+        :rType: iterator
+        '''
+        fd = self.__stream.fileno()
+        while True :
+            try :
+                (ready, _, _) = select.select([fd], [], [], IDLE_INTERVAL)
+                if not ready :
+                    yield None
+                    continue
+                block = os.read(fd, self.__blocksize)
+            except OSError as e :
+                if e.errno == errno.EINTR :
+                    continue
+                raise
+
+            if not block :
+                break
+            yield block
+
+def getcompression(filepath):
+    ''' Return compression format of `filepath` from its magic bytes
+
+    :param filepath: file path
+    :type filepath: str
+    :returns: compression format, see `COMPRESSIONS`, or None
+    :rType: str
+    '''
+    with open(filepath, 'rb') as f :
+        magic = f.read(COMPRESSION_MAGICLENGTH)
+
+    for (compression, compressionmagic) in COMPRESSION_MAGICS :
+        if magic.startswith(compressionmagic):
+            return compression
+
+def getdecompressor(compression):
+    ''' Return a streaming decompressor for `compression`
+
+    :param compression: compression format, see `COMPRESSIONS`
+    :type compression: str
+    :returns: decompressor with decompress() and unused_data
+    :rType: object
+    '''
+    if compression == COMPRESSION_GZIP :
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    elif compression == COMPRESSION_BZ2 :
+        return bz2.BZ2Decompressor()
+    elif compression == COMPRESSION_XZ :
+        if lzma is None :
+            raise ValueError('Compression %s requires lzma module' % compression)
+        return lzma.LZMADecompressor()
+    raise ValueError('Invalid compression %s' % compression)
+
+class InputProgramCompressedFile(InputProgramFile):
+    ''' InputProgramCompressedFile class
+
+        This class is used to read compressed file line
+        as program input, decompressed by blocks
+    '''
+    def __init__(self, filepath, compression=None, blocksize=DEFAULT_BLOCKSIZE):
+        ''' Init program compressed file
+
+        :param filepath: filepath to read
+        :type filepath: str
+        :param compression: compression format, see `COMPRESSIONS`.
+            default is found from file magic bytes
+        :type compression: str
+        :param blocksize: compressed block size in bytes
+        :type blocksize: int
+        '''
+        InputProgramFile.__init__(self, filepath, blocksize=blocksize)
+        self.__compression = compression or getcompression(filepath)
+
+        # check compression is supported before reading
+        getdecompressor(self.__compression)
+
+    @property
+    def compression(self):
+        return self.__compression
+
+    def readline(self):
+        ''' Return decompressed file read line iterator
+
+        :returns: line iterator
+        :rType: iterator
+        '''
+        for lines in self.readlines():
+            for line in lines :
+                yield line + b'\n'
+
+    def runbuffer(self, patterns, matchcallback, nomatchcallback, endcallback=None):
+        ''' Compressed files can not be mapped, lines are read
+            by blocks and matched one by one
+
+        '''
+        self.run(matchcallback, nomatchcallback, endcallback)
+
+    def _decompressblocks(self, f):
+        ''' Return iterator of decompressed data blocks of up to
+            `blocksize` bytes where decompressors limit their output,
+            concatenated streams are decompressed in sequence
+
+        :param f: compressed file object
+        :type f: file
+        :returns: decompressed blocks iterator
+        :rType: iterator
+        '''
+        decompressor = getdecompressor(self.__compression)
+        for block in iter(lambda : f.read(self.blocksize), b''):
+            while block :
+                # previous stream ended with the previous block
+                if getattr(decompressor, 'eof', False):
+                    decompressor = getdecompressor(self.__compression)
+
+                if self.__compression == COMPRESSION_GZIP :
+                    # input left once the output limit is reached, at
+                    # the end of stream it is the unused data too
+                    data = decompressor.decompress(block, self.blocksize)
+                    block = b'' if decompressor.unused_data else \
+                            decompressor.unconsumed_tail
+                elif hasattr(decompressor, 'needs_input'):
+                    # output left is kept by the decompressor
+                    data = decompressor.decompress(block, self.blocksize)
+                    while not decompressor.needs_input and not decompressor.eof :
+                        yield data
+                        data = decompressor.decompress(b'', self.blocksize)
+                    block = b''
+                else :
+                    # no output limit, input is given by small chunks
+                    (chunk, block) = (block[:DECOMPRESS_INPUTSIZE],
+                            block[DECOMPRESS_INPUTSIZE:])
+                    try :
+                        data = decompressor.decompress(chunk)
+                    except EOFError :
+                        decompressor = getdecompressor(self.__compression)
+                        data = decompressor.decompress(chunk)
+                yield data
+
+                # next stream of a concatenated file
+                if decompressor.unused_data :
+                    block = decompressor.unused_data + block
+                    decompressor = getdecompressor(self.__compression)
+
+        if hasattr(decompressor, 'flush'):
+            yield decompressor.flush()
+
+    def readlines(self):
+        ''' Return iterator of decompressed lines lists,
+            lines without line terminator
+
+        :returns: lines lists iterator
+        :rType: iterator
+        '''
+        with open(self.path, 'rb') as f :
+            for lines in self._splitblocks(self._decompressblocks(f)):
+                yield lines
+
+
 class InputProgramProcess(InputProgram):
     ''' InputProgramProcess class
 
         This class is used to read process
-        output line as program input
+        output line as program input. Output streams are
+        read without blocking as one line stream, the process
+        can be restarted on exit or run at intervals
+
     '''
-    def __init__(self, command):
+    def __init__(self, command, restartonexit=False, minrestartdelay=5,
+            runinterval=None, readstderr=False, maxruns=None,
+            maxrestartdelay=300):
         ''' Init program process
 
         :param command: command to execute
         :type command: str
+        :param restartonexit: restart process when it exits,
+            with a delay doubled while it keeps exiting early
+        :type restartonexit: bool
+        :param minrestartdelay: min restart delay in seconds
+        :type minrestartdelay: float
+        :param runinterval: run process every `runinterval` seconds,
+            default is to run it once
+        :type runinterval: float
+        :param readstderr: read standard error with standard output
+        :type readstderr: bool
+        :param maxruns: max number of runs, default is unlimited
+            when restarted or run at intervals
+        :type maxruns: int
+        :param maxrestartdelay: max restart delay in seconds, a process
+            running longer is restarted after `minrestartdelay`
+        :type maxrestartdelay: float
         '''
         InputProgram.__init__(self)
         self.__command = command
-        self.__restartonexit = False
-        self.__minrestartdelay = 5 # seconds
-        self.__runinterval = 60 # seconds
-        self.__readstderr = False
+        self.__restartonexit = restartonexit
+        self.__minrestartdelay = minrestartdelay # seconds
+        self.__maxrestartdelay = maxrestartdelay # seconds
+        self.__runinterval = runinterval # seconds
+        self.__readstderr = readstderr
+        self.__maxruns = maxruns
+
+        self.restartdelay = minrestartdelay
+        self.nbruns = 0
+        self.returncode = None
+
+        self.__proc = None
+        self.__runstart = None
+        self.__stopped = False
+        # partial last line by stream file descriptor
+        self.__tails = {}
 
     @property
     def command(self):
         return self.__command
 
+    def start(self):
+        ''' Start process
+
+        '''
+        self.__proc = subprocess.Popen(self.__command, shell=True,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE if self.__readstderr else None,
+                close_fds=True)
+        self.__runstart = time.time()
+        self.returncode = None
+
+        self.__tails = {self.__proc.stdout.fileno() : b''}
+        if self.__readstderr :
+            self.__tails[self.__proc.stderr.fileno()] = b''
+
+    def filenos(self):
+        ''' Return process output streams still open
+
+        :returns: file descriptors
+        :rType: list
+        '''
+        return list(self.__tails)
+
+    def read(self, fd, size=65536):
+        ''' Read available output of stream `fd`, to call
+            when `fd` is ready to read
+
+        :param fd: stream file descriptor
+        :type fd: int
+        :param size: max number of bytes to read
+        :type size: int
+        :returns: complete lines read, without line terminator
+        :rType: list
+        '''
+        data = os.read(fd, size)
+        tail = self.__tails[fd]
+
+        if not data :
+            # end of stream, the partial line is complete
+            del self.__tails[fd]
+            return [tail] if tail else []
+
+        self.nbbytes += len(data)
+        lines = data.split(b'\n')
+        lines[0] = tail + lines[0]
+        self.__tails[fd] = lines.pop()
+        return lines
+
+    def wait(self):
+        ''' Wait process exit once its output streams are closed
+
+        :returns: process return code
+        :rType: int
+        '''
+        for stream in (self.__proc.stdout, self.__proc.stderr):
+            if stream is not None :
+                stream.close()
+        self.returncode = self.__proc.wait()
+        self.nbruns += 1
+        return self.returncode
+
+    def getnextdelay(self):
+        ''' Return delay before next run of exited process
+
+        :returns: delay in seconds or None if process is done
+        :rType: float
+        '''
+        if self.__stopped :
+            return None
+
+        if self.__maxruns is not None and self.nbruns >= self.__maxruns :
+            return None
+
+        now = time.time()
+
+        if self.__runinterval is not None :
+            return max(0, self.__runstart + self.__runinterval - now)
+
+        if self.__restartonexit :
+            # a process running long enough restarts fast again
+            if now - self.__runstart >= self.__maxrestartdelay :
+                self.restartdelay = self.__minrestartdelay
+            delay = self.restartdelay
+            self.restartdelay = min(delay * 2, self.__maxrestartdelay)
+            return delay
+
+        return None
+
+    def stop(self):
+        ''' Stop process and do not run it again
+
+        '''
+        self.__stopped = True
+        if self.__proc is not None and self.__proc.poll() is None :
+            self.__proc.terminate()
+
+    def readlines(self):
+        ''' Return iterator of process output lines lists,
+            lines without line terminator. An empty list is
+            yielded every `IDLE_INTERVAL` seconds without output
+
+        :returns: lines lists iterator
+        :rType: iterator
+        '''
+        while True :
+            self.start()
+
+            while self.filenos():
+                try :
+                    (ready, _, _) = select.select(self.filenos(), [], [],
+                            IDLE_INTERVAL)
+                except select.error, e :
+                    if e.args[0] == errno.EINTR :
+                        continue
+                    raise
+                if not ready :
+                    yield ()
+                for fd in ready :
+                    lines = self.read(fd)
+                    if lines :
+                        yield lines
+
+            self.wait()
+
+            delay = self.getnextdelay()
+            if delay is None :
+                break
+            time.sleep(delay)
+
     def readline(self):
         ''' Return process read line iterator
 
         :returns: line iterator
         :rType: iterator
         '''
-        proc = subprocess.Popen(self.__command, shell=True,
-                    stdout=subprocess.PIPE)
+        for lines in self.readlines():
+            for line in lines :
+                yield line + b'\n'
+
+
+class InputProcessManager(object):
+    ''' InputProcessManager class
+
+        Run many `InputProgramProcess` concurrently in a single
+        select loop, output lines of every process are matched
+        as they are read, attributed to their process input
+
+    '''
+    def __init__(self, matchcallback, nomatchcallback, maxconcurrency=8,
+            endcallback=None, idlecallback=None):
+        ''' Init process manager
+
+        :param matchcallback: match callback
+        :type matchcallback: callable
+        :param nomatchcallback: no-match callback
+        :type nomatchcallback: callable
+        :param maxconcurrency: max number of processes running at once,
+            at least one
+        :type maxconcurrency: int
+        :param endcallback: end of process callback, called
+            before the no-match one
+        :type endcallback: callable
+        :param idlecallback: callback of running processes, called
+            every `IDLE_INTERVAL` seconds
+        :type idlecallback: callable
+        '''
+        self.__matchcallback = matchcallback
+        self.__nomatchcallback = nomatchcallback
+        self.__endcallback = endcallback
+        self.__idlecallback = idlecallback
+        self.__maxconcurrency = max(1, maxconcurrency)
+
+        # processes ready to start, in order
+        self.__ready = deque()
+        # (start time, index, process) waiting for a restart
+        self.__waiting = []
+        # running processes by output file descriptor
+        self.__running = {}
+        self.__nbrunning = 0
+        # processes start time of their first run
+        self.__starts = {}
+
+    def add(self, inputprocess):
+        ''' Add process to run
+
+        :param inputprocess: process input
+        :type inputprocess: `InputProgramProcess`
+        '''
+        self.__ready.append(inputprocess)
+
+    def _start(self, inputprocess):
+        if inputprocess not in self.__starts :
+            self.__starts[inputprocess] = time.time()
+
+        inputprocess.start()
+        self.__nbrunning += 1
+        for fd in inputprocess.filenos():
+            self.__running[fd] = inputprocess
+
+    def _exit(self, inputprocess):
+        inputprocess.wait()
+        self.__nbrunning -= 1
+
+        delay = inputprocess.getnextdelay()
+        if delay is not None :
+            heapq.heappush(self.__waiting,
+                    (time.time() + delay, id(inputprocess), inputprocess))
+            return
+
+        if self.__endcallback is not None :
+            self.__endcallback(inputprocess)
+
+        inputprocess.nblines = inputprocess.lineno
+        inputprocess.elapsed += time.time() - self.__starts.pop(inputprocess)
+
+        # execute nomatch if on in this program
+        if inputprocess.nbmatches == 0 :
+            self.__nomatchcallback(inputprocess)
+
+        inputprocess.done = 1
+
+    def run(self):
+        ''' Run all processes until they are done
+
+        '''
+        nexttick = time.time() + IDLE_INTERVAL
+        while self.__ready or self.__waiting or self.__running :
+
+            now = time.time()
+            if now >= nexttick :
+                nexttick = now + IDLE_INTERVAL
+                if self.__idlecallback is not None :
+                    for inputprocess in set(self.__running.values()):
+                        self.__idlecallback(inputprocess)
+
+            while self.__waiting and self.__waiting[0][0] <= now :
+                self.__ready.append(heapq.heappop(self.__waiting)[2])
+
+            while self.__ready and self.__nbrunning < self.__maxconcurrency :
+                self._start(self.__ready.popleft())
+
+            # wake up for the next restart or idle callback
+            timeout = None
+            if self.__waiting :
+                timeout = max(0, self.__waiting[0][0] - time.time())
+            if self.__running :
+                timeout = max(0, min(timeout if timeout is not None else \
+                        IDLE_INTERVAL, nexttick - time.time()))
+
+            if not self.__running :
+                if timeout is not None :
+                    time.sleep(timeout)
+                continue
+
+            try :
+                (ready, _, _) = select.select(list(self.__running), [], [], timeout)
+            except select.error, e :
+                if e.args[0] == errno.EINTR :
+                    continue
+                raise
+
+            for fd in ready :
+                inputprocess = self.__running[fd]
+                for line in inputprocess.read(fd):
+                    inputprocess.lineno += 1
+                    self.__matchcallback(inputprocess, line)
+
+                if fd not in inputprocess.filenos():
+                    del self.__running[fd]
+                    if not inputprocess.filenos():
+                        self._exit(inputprocess)
+
+
+class RecordAssembler(object):
+    ''' RecordAssembler class
+
+        Assemble lines of a single input in multi-line records :
+        a record starts with a line matching the start pattern and
+        goes on with the following lines until a line matches the
+        end pattern, a line does not match the continuation pattern,
+        a new record starts or the record holds `maxlines` lines
+
+    '''
+    def __init__(self, start, continuation=None, end=None,
+            maxlines=DEFAULT_RECORD_MAXLINES, timeout=None):
+        ''' Init record assembler
+
+        :param start: record first line pattern
+        :type start: `Grok`
+        :param continuation: record next lines pattern, default
+            is any line
+        :type continuation: `Grok`
+        :param end: record last line pattern
+        :type end: `Grok`
+        :param maxlines: maximum record lines
+        :type maxlines: int
+        :param timeout: seconds after which a record is complete,
+            checked when lines are added and by `expire`
+        :type timeout: float
+        '''
+        self.__start = start
+        self.__continuation = continuation
+        self.__end = end
+        self.__maxlines = maxlines
+        self.__timeout = timeout
+
+        # lines of the current record and its start time
+        self.__lines = []
+        self.__started = None
+
+    def add(self, line):
+        ''' Add input line
+
+        :param line: line without line terminator
+        :type line: str
+        :returns: records completed by the line
+        :rType: list of str
+        '''
+        records = []
+        record = self.expire()
+        if record is not None :
+            records.append(record)
+
+        if self.__lines :
+            if self.__start.match(line) is not None :
+                records.append(self.flush())
+            elif self.__continuation is not None and \
+                    self.__continuation.match(line) is None :
+                records.append(self.flush())
+            else :
+                self.__lines.append(line)
+                if (self.__end is not None and self.__end.match(line) is not None) or \
+                        len(self.__lines) >= self.__maxlines :
+                    records.append(self.flush())
+                return records
 
-        for line in iter(proc.stdout.readline, ''):
-            yield line
+        if self.__start.match(line) is not None :
+            self.__lines.append(line)
+            self.__started = time.time()
+            if len(self.__lines) >= self.__maxlines :
+                records.append(self.flush())
 
-        proc.stdout.close()
+        return records
 
+    def expire(self):
+        ''' Return current record if it timed out, called while
+            the input is idle
+
+        :returns: record lines joined or None
+        :rType: str
+        '''
+        if self.__lines and self.__timeout is not None and \
+                time.time() - self.__started >= self.__timeout :
+            return self.flush()
+        return None
+
+    def flush(self):
+        ''' Return current record and start a new one
+
+        :returns: record lines joined or None if no record started
+        :rType: str
+        '''
+        if not self.__lines :
+            return None
+
+        record = b'\n'.join(self.__lines)
+        self.__lines = []
+        self.__started = None
+        return record
+
+class ActionExecutor(object):
+    ''' ActionExecutor class
+
+        Run filtered actions of a match config in batches : with
+        `BATCH_STDIN` the command is started once and reads actions
+        on its standard input, with `BATCH_XARGS` the command is run
+        with up to `batchsize` actions as arguments. Commands output
+        goes to the program standard output. A batch is flushed once
+        its first action waited `maxage` seconds
+
+    '''
+    def __init__(self, command, batch=BATCH_STDIN, batchsize=DEFAULT_BATCHSIZE,
+            delimiter='\n', maxage=DEFAULT_BATCH_MAXAGE):
+        ''' Init action executor
+
+        :param command: command to run
+        :type command: str
+        :param batch: batch mode, see `BATCHES`
+        :type batch: str
+        :param batchsize: actions buffered before they are written
+            to the command or run as its arguments
+        :type batchsize: int
+        :param delimiter: actions delimiter on standard input,
+            new line or NUL
+        :type delimiter: str
+        :param maxage: maximum seconds pending actions wait,
+            None waits for a full batch
+        :type maxage: float
+        '''
+        if batch not in BATCHES :
+            raise ValueError('Invalid batch %s' % batch)
+
+        self.__command = shlex.split(command)
+        self.__batch = batch
+        self.__batchsize = max(1, batchsize)
+        self.__delimiter = delimiter
+        self.__maxage = maxage
+        # pending actions and the time of the first one
+        self.__pending = []
+        self.__started = None
+        self.__process = None
+
+        # command runs
+        self.nbruns = 0
+
+    @property
+    def batch(self):
+        return self.__batch
+
+    def send(self, action):
+        ''' Add action to the current batch
+
+        :param action: filtered action
+        :type action: str
+        '''
+        if isinstance(action, unicode):
+            action = action.encode('utf8')
+
+        if not self.__pending :
+            self.__started = time.time()
+        self.__pending.append(action)
+        if len(self.__pending) >= self.__batchsize :
+            self.flush()
+        else :
+            self.expire()
+
+    def expire(self):
+        ''' Flush pending actions if the first one waited
+            `maxage` seconds, called while inputs are idle
+
+        '''
+        if self.__pending and self.__maxage is not None and \
+                time.time() - self.__started >= self.__maxage :
+            self.flush()
+
+    def flush(self):
+        ''' Write or run pending actions
+
+        '''
+        if not self.__pending :
+            return
+
+        (actions, self.__pending) = (self.__pending, [])
+        self.__started = None
+        if self.__batch == BATCH_XARGS :
+            self._call(actions)
+        else :
+            self._write(actions)
+
+    def close(self):
+        ''' Flush pending actions and wait for the command
+
+        '''
+        self.flush()
+
+        if self.__process is not None :
+            try :
+                self.__process.stdin.close()
+            except IOError :
+                pass
+            self.__process.wait()
+            self.__process = None
+
+    def _call(self, actions):
+        try :
+            subprocess.call(self.__command + actions)
+            self.nbruns += 1
+        except OSError as e :
+            print 'Failed to execute action', ' '.join(self.__command)
+            print e
+
+    def _write(self, actions):
+        # command is restarted if it exited
+        if self.__process is not None and self.__process.poll() is not None :
+            self.__process = None
+
+        try :
+            if self.__process is None :
+                self.__process = subprocess.Popen(self.__command,
+                        stdin=subprocess.PIPE, close_fds=True)
+                self.nbruns += 1
+
+            delimiter = self.__delimiter.encode('utf8')
+            self.__process.stdin.write(b''.join(action + delimiter \
+                    for action in actions))
+            self.__process.stdin.flush()
+        except (OSError, IOError) as e :
+            print 'Failed to execute action', ' '.join(self.__command)
+            print e
+            self.__process = None
+
+class OutputSink(object):
+    ''' OutputSink class
+
+        Buffered output of stdout actions : data is written to the
+        stream once `buffersize` bytes are buffered and every
+        `flushinterval` seconds by a background thread. The thread
+        stops once nothing was written for an interval and starts
+        again with the next buffered write. A terminal stream is
+        line buffered. A stream shared with other processes is
+        written by line-aligned chunks of at most `PIPE_BUF` bytes
+        so lines of processes are not interleaved
+
+    '''
+    def __init__(self, stream=None, buffersize=DEFAULT_OUTPUT_BUFFERSIZE,
+            flushinterval=DEFAULT_FLUSHINTERVAL, linebuffered=None,
+            shared=False):
+        ''' Init output sink
+
+        :param stream: output stream, default is sys.stdout
+        :type stream: file
+        :param buffersize: bytes buffered before a write
+        :type buffersize: int
+        :param flushinterval: maximum seconds data stays buffered,
+            0 flushes every write and None only full buffers
+        :type flushinterval: float
+        :param linebuffered: flush every write, default is to
+            flush every write only to a terminal
+        :type linebuffered: bool
+        :param shared: stream is written by other processes too
+        :type shared: bool
+        '''
+        self.__stream = stream if stream is not None else sys.stdout
+        if linebuffered is None :
+            isatty = getattr(self.__stream, 'isatty', None)
+            linebuffered = (isatty is not None and isatty()) or flushinterval == 0
+
+        self.__linebuffered = linebuffered
+        self.__buffersize = buffersize
+        self.__flushinterval = flushinterval
+        self.__shared = shared
+
+        self.__chunks = []
+        self.__size = 0
+        self.__lock = threading.Lock()
+
+        # background flusher, running while data is buffered
+        self.__flusher = None
+        self.__stopped = threading.Event()
+
+        # stream writes
+        self.nbflushes = 0
+
+    @property
+    def linebuffered(self):
+        return self.__linebuffered
+
+    def write(self, data):
+        ''' Write data to the stream or buffer it
+
+        :param data: data to write
+        :type data: str
+        '''
+        with self.__lock :
+            self.__chunks.append(data)
+            self.__size += len(data)
+            if self.__linebuffered or self.__size >= self.__buffersize :
+                self._flush()
+                return
+
+            if self.__flusher is None and self.__flushinterval and \
+                    not self.__stopped.is_set() :
+                self.__flusher = threading.Thread(target=self._run)
+                self.__flusher.daemon = True
+                self.__flusher.start()
+
+    def flush(self):
+        ''' Write buffered data to the stream
+
+        '''
+        with self.__lock :
+            self._flush()
+
+    def _flush(self):
+        if not self.__chunks :
+            return
+
+        data = ''.join(self.__chunks)
+        if not self.__shared :
+            self.__stream.write(data)
+            self.__stream.flush()
+        else :
+            # every chunk is a single write, a line longer
+            # than PIPE_BUF is written alone
+            start = 0
+            while start < len(data):
+                end = start + PIPE_BUF
+                if end < len(data):
+                    newline = data.rfind('\n', start, end)
+                    if newline < start :
+                        newline = data.find('\n', end)
+                    end = newline + 1 if newline >= 0 else len(data)
+                self.__stream.write(data[start:end])
+                self.__stream.flush()
+                start = end
+        self.__chunks = []
+        self.__size = 0
+        self.nbflushes += 1
+
+    def _run(self):
+        while not self.__stopped.wait(self.__flushinterval):
+            with self.__lock :
+                # idle, the next buffered write starts a new flusher
+                if not self.__chunks :
+                    self.__flusher = None
+                    return
+                self._flush()
+
+    def close(self):
+        ''' Stop background flusher and write buffered data
+
+        '''
+        self.__stopped.set()
+        with self.__lock :
+            flusher = self.__flusher
+            self.__flusher = None
+        if flusher is not None :
+            flusher.join()
+        self.flush()
+
+def runaction(action):
+    ''' Run action command and return its output
+
+    :param action: filtered action
+    :type action: str
+    :returns: command standard output and error
+    :rType: str
+    '''
+    try :
+        # pipes of commands started by other threads are not inherited
+        proc = subprocess.Popen(shlex.split(action), stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE, stderr=subprocess.STDOUT, close_fds=True)
+        (output, error) = proc.communicate()
+        return output
+    except Exception, e :
+        return 'Failed to execute action %s\n%s\n' % (action, e)
+
+class ActionQueue(object):
+    ''' ActionQueue class
+
+        Run actions in worker threads so matching does not wait for
+        them. Actions of an input run concurrently too, their output
+        is printed in order : outputs are numbered by input and kept
+        until the outputs of previous actions are printed. The queue
+        is bounded, adding an action to a full queue waits for a
+        worker
+
+    '''
+    def __init__(self, workers=DEFAULT_ACTIONWORKERS, maxsize=DEFAULT_ACTIONQUEUESIZE):
+        ''' Init action queue and start its workers
+
+        :param workers: number of worker threads
+        :type workers: int
+        :param maxsize: maximum number of queued actions
+        :type maxsize: int
+        '''
+        workers = max(1, workers)
+        self.__queue = Queue.Queue(max(1, maxsize))
+        self.__lock = threading.Lock()
+
+        # actions run and queued or running
+        self.nbruns = 0
+        self.__nbpending = 0
+
+        # next action number by key, and by key the number of the
+        # next output to print and outputs waiting for it
+        self.__nextseq = {}
+        self.__reorder = {}
+
+        self.__threads = []
+        for i in range(workers):
+            thread = threading.Thread(target=self._work)
+            thread.daemon = True
+            thread.start()
+            self.__threads.append(thread)
+
+    def put(self, key, action):
+        ''' Add action to the queue, wait while the queue is full
+
+        :param key: action output ordering key, ex : input name
+        :type key: str
+        :param action: filtered action
+        :type action: str
+        '''
+        with self.__lock :
+            self.__nbpending += 1
+            seq = self.__nextseq.get(key, 0)
+            self.__nextseq[key] = seq + 1
+            if seq == 0 :
+                self.__reorder[key] = [0, {}]
+        self.__queue.put((key, seq, action))
+
+    def _work(self):
+        while True :
+            item = self.__queue.get()
+            if item is None :
+                break
+
+            (key, seq, action) = item
+            output = runaction(action)
+            with self.__lock :
+                self.nbruns += 1
+                self.__nbpending -= 1
+
+                # print outputs of the key following the last printed
+                reorder = self.__reorder[key]
+                reorder[1][seq] = output
+                while reorder[0] in reorder[1]:
+                    sys.stdout.write(reorder[1].pop(reorder[0]))
+                    reorder[0] += 1
+                sys.stdout.flush()
+
+                # no action of the key left, numbering starts again
+                if reorder[0] == self.__nextseq[key] :
+                    del self.__reorder[key]
+                    del self.__nextseq[key]
+
+    def drain(self, timeout=None):
+        ''' Run queued actions and stop workers
+
+        :param timeout: maximum seconds to wait, default is
+            to wait for every action
+        :type timeout: float
+        :returns: number of actions left undone
+        :rType: int
+        '''
+        deadline = time.time() + timeout if timeout is not None else None
+        def remaining():
+            if deadline is None :
+                return None
+            return max(0, deadline - time.time())
+
+        try :
+            for thread in self.__threads :
+                self.__queue.put(None, timeout=remaining())
+            for thread in self.__threads :
+                thread.join(remaining())
+        except Queue.Full :
+            pass
+
+        with self.__lock :
+            return self.__nbpending
 
 class MatchConfig(object):
 
     def __init__(self, patterns, action='%{@LINE}', breakifmatch=False,
-            noaction=False, nomatch=False, shell='stdout'):
+            noaction=False, nomatch=False, shell='stdout', allmatches=False,
+            record=None, batch=None, batchsize=DEFAULT_BATCHSIZE, delimiter='\n',
+            batchmaxage=DEFAULT_BATCH_MAXAGE):
         ''' Match config apply on every line of input file /process
 
         :param patterns: regex or grok patterns
@@ -611,8 +3465,29 @@ class MatchConfig(object):
         :param nomatch: executed if no output is matched. default is `False`
         :type nomatch: bool
         :param shell: default shell is stdout which means action is printed
-            directly to standard output
+            directly to standard output, with `batch` the command
+            receiving actions
         :type shell: str
+        :param allmatches: capture and run action for every match
+            in a line, not only the first one. default is `False`
+        :type allmatches: bool
+        :param record: patterns are matched on multi-line records
+            instead of lines, record lines are joined with new lines
+            and patterns line anchors match at every record line,
+            see `RecordAssembler`. keys are start, continuation, end,
+            maxlines and timeout, start is required
+            ex : {'start' : '^Traceback', 'end' : '%{PYTHON_ERROR}'}
+        :type record: dict
+        :param batch: run shell command once for many actions, see
+            `BATCHES`. default is a command run by action
+        :type batch: str
+        :param batchsize: actions by batch
+        :type batchsize: int
+        :param delimiter: actions delimiter of stdin batch
+        :type delimiter: str
+        :param batchmaxage: maximum seconds actions wait in a batch
+            which is not full, None waits for a full batch
+        :type batchmaxage: float
         '''
         # list of pattern to match
         # can be regex or grok patterns %{FOO}
@@ -633,19 +3508,85 @@ class MatchConfig(object):
         # Shell values are stdout or cmd string to run
         self.__shell = shell
 
+        # every match of a line instead of the first one
+        self.__allmatches = allmatches
+
+        # multi-line record options
+        self.__record = record
+
+        # batched shell command options
+        self.__batch = batch
+        self.__batchsize = batchsize
+        self.__delimiter = delimiter
+        self.__batchmaxage = batchmaxage
+
         self.__expandpatterns = []
+        self.__recordpatterns = None
 
         self._compile()
 
     def _compile(self):
 
         self.__expandpatterns = []
+        self.__recordpatterns = None
+
+        if self.__batch is not None :
+            if self.__batch not in BATCHES :
+                raise ValueError('Invalid batch %s' % self.__batch)
+            if self.__shell == 'stdout' :
+                raise ValueError('Batched actions require a shell command')
+
+        flags = 0
+        if self.__record is not None :
+            unknownkeys = set(self.__record) - set(RECORD_KEYS)
+            if unknownkeys :
+                raise ValueError('Invalid record keys %s' % ', '.join(sorted(unknownkeys)))
+            if not self.__record.get('start') :
+                raise ValueError('Record start pattern is required')
+
+            # (start, continuation, end) line patterns
+            self.__recordpatterns = []
+            for key in ('start', 'continuation', 'end'):
+                g = None
+                if self.__record.get(key) :
+                    g = Grok()
+                    g.compile(self.__record[key])
+                self.__recordpatterns.append(g)
+
+            flags = re.MULTILINE
 
         for pattern in self.__patterns :
             g = Grok()
-            g.compile(pattern)
+            g.compile(pattern, flags)
             self.__expandpatterns.append(g)
 
+    def getexecutor(self):
+        ''' Return a new batched actions executor of this config
+
+        :returns: actions executor or None if actions are not batched
+        :rType: `ActionExecutor`
+        '''
+        if self.__batch is None :
+            return None
+
+        return ActionExecutor(self.__shell, batch=self.__batch,
+                batchsize=self.__batchsize, delimiter=self.__delimiter,
+                maxage=self.__batchmaxage)
+
+    def getassembler(self):
+        ''' Return a new record assembler of this config
+
+        :returns: record assembler or None if patterns match lines
+        :rType: `RecordAssembler`
+        '''
+        if self.__record is None :
+            return None
+
+        (start, continuation, end) = self.__recordpatterns
+        return RecordAssembler(start, continuation, end,
+                maxlines=self.__record.get('maxlines') or DEFAULT_RECORD_MAXLINES,
+                timeout=self.__record.get('timeout'))
+
     @property
     def patterns(self):
         return self.__patterns
@@ -666,43 +3607,269 @@ class MatchConfig(object):
     def action(self):
         return self.__action
 
-    @property
-    def shell(self):
-        return self.__shell
+    @property
+    def shell(self):
+        return self.__shell
+
+    @property
+    def nomatch(self):
+        return self.__nomatch
+
+    @property
+    def allmatches(self):
+        return self.__allmatches
+
+    @property
+    def record(self):
+        return self.__record
+
+    @property
+    def batch(self):
+        return self.__batch
+
+    @property
+    def inputmatches(self):
+        return self.__inputmatches
+
+    @classmethod
+    def fromdict(cls, configdict):
+        ''' Load a `MatchConfig` from a dict
+
+        :param cls: match config class
+        :type cls: `MatchConfig`
+        :param configdict: confict dict
+        :type configdict: dict
+        :returns: match config instance from dict
+        :rType: `MatchConfig` object
+        '''
+        matchconfig = MatchConfig.__new__(MatchConfig)
+        matchconfig._MatchConfig__patterns = configdict['patterns']
+        matchconfig._MatchConfig__action = configdict['action']
+        matchconfig._MatchConfig__nomatch = configdict['nomatch']
+        matchconfig._MatchConfig__breakifmatch = configdict['breakifmatch']
+        matchconfig._MatchConfig__noaction = configdict['noaction']
+        matchconfig._MatchConfig__shell = configdict['shell']
+        matchconfig._MatchConfig__allmatches = configdict.get('allmatches', False)
+        matchconfig._MatchConfig__record = configdict.get('record')
+        matchconfig._MatchConfig__batch = configdict.get('batch')
+        matchconfig._MatchConfig__batchsize = configdict.get('batchsize', DEFAULT_BATCHSIZE)
+        matchconfig._MatchConfig__delimiter = configdict.get('delimiter', '\n')
+        matchconfig._MatchConfig__batchmaxage = configdict.get('batchmaxage',
+                DEFAULT_BATCH_MAXAGE)
+        matchconfig._compile()
+
+        return matchconfig
+
+class CheckpointStore(object):
+    ''' CheckpointStore class
+
+        On-disk store of input files scan checkpoints by file path :
+        inode, size, mtime, offset following the last complete line
+        read, digest of a partial last line read, program signature,
+        captures and number of matches.
+        The store file is read lazily on first lookup and
+        only written by `save`
+
+    '''
+    def __init__(self, path):
+        ''' Init store
+
+        :param path: store file path
+        :type path: str
+        '''
+        self.__path = path
+        self.__entries = None
+
+    @property
+    def path(self):
+        return self.__path
+
+    def _load(self):
+        self.__entries = {}
+
+        if not os.path.exists(self.__path):
+            return
+
+        try :
+            with open(self.__path, 'r') as f:
+                self.__entries = json.load(f)
+        except ValueError:
+            # ignore corrupted store, files are scanned again
+            pass
+
+    def __len__(self):
+        if self.__entries is None :
+            self._load()
+        return len(self.__entries)
+
+    def get(self, filepath):
+        ''' Return checkpoint of `filepath`
+
+        :param filepath: input file path
+        :type filepath: str
+        :returns: checkpoint dict or None
+        :rType: dict
+        '''
+        if self.__entries is None :
+            self._load()
+        return self.__entries.get(os.path.abspath(filepath))
+
+    def set(self, filepath, stat, offset, signature, captures, nbmatches,
+            partial=None):
+        ''' Set checkpoint of `filepath`
+
+        :param filepath: input file path
+        :type filepath: str
+        :param stat: file stat when scanned
+        :type stat: os.stat_result
+        :param offset: offset following the last complete line read
+        :type offset: int
+        :param signature: program signature
+        :type signature: str
+        :param captures: {pattern : [capture, ...]} of the file
+        :type captures: dict
+        :param nbmatches: file number of matches
+        :type nbmatches: int
+        :param partial: digest of the line without terminator
+            at `offset` already read, see `getlinedigest`
+        :type partial: str
+        '''
+        if self.__entries is None :
+            self._load()
+
+        self.__entries[os.path.abspath(filepath)] = {
+                'inode' : stat.st_ino,
+                'size' : stat.st_size,
+                'mtime' : stat.st_mtime,
+                'offset' : offset,
+                'signature' : signature,
+                'captures' : captures,
+                'nbmatches' : nbmatches,
+                'partial' : partial}
+
+    def save(self):
+        ''' Write store file
+
+        :returns: store file path
+        :rType: str
+        '''
+        if self.__entries is None :
+            self._load()
+
+        directory = os.path.dirname(os.path.abspath(self.__path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        # write then rename to never expose a partial store
+        tmppath = '%s.%d.tmp' % (self.__path, os.getpid())
+        with open(tmppath, 'w') as f:
+            json.dump(self.__entries, f)
+        os.rename(tmppath, self.__path)
+
+        return self.__path
+
+class LiteralDispatcher(object):
+    ''' LiteralDispatcher class
+
+        Select with a single scan of a text the `Grok` patterns
+        whose required literals (see `Grok.prefilter`) occur in it.
+        All literals are searched at once by an alternation
+        scanned with overlapped matches, which reports at every
+        position the longest literal, shorter literals
+        being its prefixes
+
+    '''
+    def __init__(self, groks):
+        ''' Init dispatcher
+
+        :param groks: compiled patterns in evaluation order
+        :type groks: list of `Grok`
+        '''
+        # number of texts dispatched
+        self.nbtexts = 0
+
+        # patterns without prefilter are evaluated on every text
+        self.__always = []
+        self.__clauses = []
+        self.__byliteral = {}
+        self.__nbcandidates = [0] * len(groks)
+
+        for index, grok in enumerate(groks):
+            self.__clauses.append(grok.prefilter)
+            if not len(grok.prefilter):
+                self.__always.append(index)
+                continue
+            for clause in grok.prefilter :
+                for literal in clause :
+                    self.__byliteral.setdefault(literal, set()).add(index)
+
+        literals = sorted(self.__byliteral, key=lambda l : (-len(l), l))
 
-    @property
-    def nomatch(self):
-        return self.__nomatch
+        # literals found with each literal, its prefixes included
+        self.__implied = {}
+        for literal in literals :
+            self.__implied[literal] = [literal[:i] for i in \
+                    range(1, len(literal) + 1) if literal[:i] in self.__byliteral]
 
-    @property
-    def inputmatches(self):
-        return self.__inputmatches
+        self.__scanner = None
+        if len(literals):
+            self.__scanner = re.compile('|'.join(re.escape(l) for l in literals))
 
-    @classmethod
-    def fromdict(cls, configdict):
-        ''' Load a `MatchConfig` from a dict
+    def candidates(self, text):
+        ''' Return indexes of patterns which may match `text`
 
-        :param cls: match config class
-        :type cls: `MatchConfig`
-        :param configdict: confict dict
-        :type configdict: dict
-        :returns: match config instance from dict
-        :rType: `MatchConfig` object
+        :param text: text to match
+        :type text: str
+        :returns: sorted patterns indexes
+        :rType: list
         '''
-        matchconfig = MatchConfig.__new__(MatchConfig)
-        matchconfig._MatchConfig__patterns = configdict['patterns']
-        matchconfig._MatchConfig__action = configdict['action']
-        matchconfig._MatchConfig__nomatch = configdict['nomatch']
-        matchconfig._MatchConfig__breakifmatch = configdict['breakifmatch']
-        matchconfig._MatchConfig__noaction = configdict['noaction']
-        matchconfig._MatchConfig__shell = configdict['shell']
-        matchconfig._compile()
+        self.nbtexts += 1
+
+        if self.__scanner is None :
+            return self.__always
+
+        found = set()
+        for literal in self.__scanner.findall(text, overlapped=True):
+            found.update(self.__implied[literal])
+
+        if not found :
+            return self.__always
+
+        candidates = set()
+        for literal in found :
+            for index in self.__byliteral[literal]:
+                if index in candidates :
+                    continue
+                for clause in self.__clauses[index]:
+                    for l in clause :
+                        if l in found :
+                            break
+                    else :
+                        break
+                else :
+                    candidates.add(index)
+                    self.__nbcandidates[index] += 1
 
-        return matchconfig
+        return sorted(candidates.union(self.__always))
+
+    def getrejected(self, index):
+        ''' Return number of texts pattern `index` was not evaluated on
+
+        :param index: pattern index
+        :type index: int
+        :returns: rejected texts number
+        :rType: int
+        '''
+        if not len(self.__clauses[index]):
+            return 0
+        return self.nbtexts - self.__nbcandidates[index]
 
 class Program(object):
 
-    def __init__(self, matchconfigs, name=None, captureformat='%{@PATTERNS}'):
+    def __init__(self, matchconfigs, name=None, captureformat='%{@PATTERNS}',
+            engine=ENGINE_LOOP, reader=READER_BLOCK, blocksize=DEFAULT_BLOCKSIZE,
+            actionworkers=0, actionqueuesize=DEFAULT_ACTIONQUEUESIZE, actiontimeout=None,
+            flushinterval=DEFAULT_FLUSHINTERVAL):
         ''' Init program with a list of match configs,
             optional name and capture format
 
@@ -712,12 +3879,37 @@ class Program(object):
         :type name: str
         :param captureformnat: capture format, default is %{@PATTERNS}
         :type captureformat: str
+        :param engine: matching engine, see `ENGINES`. default is loop
+        :type engine: str
+        :param reader: input files reader, see `READERS`. default is block
+        :type reader: str
+        :param blocksize: block reader block size in bytes
+        :type blocksize: int
+        :param actionworkers: number of threads running shell actions,
+            default is to run them while matching
+        :type actionworkers: int
+        :param actionqueuesize: maximum number of queued shell actions
+        :type actionqueuesize: int
+        :param actiontimeout: seconds to wait for queued shell actions
+            on `close`, default is to wait for every action
+        :type actiontimeout: float
+        :param flushinterval: maximum seconds stdout actions output stays
+            buffered, 0 flushes every action. output to a terminal is
+            never buffered
+        :type flushinterval: float
         '''
         self.__name = name
         self.__inputs = []
         self.__matchconfigs = matchconfigs
         self.__captureformat = captureformat
         self.__captures = {}
+        self.__engine = engine
+        self.__reader = reader
+        self.__blocksize = blocksize
+        self.__actionworkers = actionworkers
+        self.__actionqueuesize = actionqueuesize
+        self.__actiontimeout = actiontimeout
+        self.__flushinterval = flushinterval
 
         self._compile()
 
@@ -728,28 +3920,614 @@ class Program(object):
         self.__filterpattern.loadpatternsfromstring('FILTER (?:\|\w+)+')
         self.__filterpattern.compile('%{PATTERN}')
 
-    def addinputfile(self, filepath):
+        # (matchconfig, pattern index, grok) for every line pattern
+        # in evaluation order, dispatched by literals
+        self.__dispatchtable = []
+        for matchconfig in self.__matchconfigs :
+            if matchconfig.record is not None :
+                continue
+            for i, grok in enumerate(matchconfig.expandpatterns):
+                self.__dispatchtable.append((matchconfig, i, grok))
+
+        # match configs of multi-line records and
+        # their assemblers by input
+        self.__recordconfigs = [matchconfig for matchconfig in \
+                self.__matchconfigs if matchconfig.record is not None]
+        self.__assemblers = {}
+
+        # batched actions executors by match config
+        self.__executors = {}
+        # shell actions run by worker threads, started with
+        # the first action
+        self.__actionqueue = None
+        # stdout actions output, opened with the first action,
+        # shared by worker processes
+        self.__output = None
+        self.__sharedoutput = False
+
+        self.__dispatcher = LiteralDispatcher([grok for \
+                (matchconfig, i, grok) in self.__dispatchtable])
+
+        if self.__engine not in ENGINES :
+            raise ValueError('Invalid engine %s' % self.__engine)
+
+        if self.__reader not in READERS :
+            raise ValueError('Invalid reader %s' % self.__reader)
+
+        self.__combinedpattern = None
+        if self.__engine == ENGINE_COMBINED :
+            self.__combinedpattern = self._combine()
+
+        # with breakifmatch on every pattern a line has a single
+        # match, the first pattern matching it, found from the
+        # combined patterns of aligned ranges of branches compiled
+        # on first use, by (start, end) range
+        self.__dispatchbranches = self.__combinedpattern is not None and \
+                all(matchconfig.breakifmatch for \
+                (matchconfig, i, grok) in self.__dispatchtable)
+        self.__rangepatterns = {}
+
+        self.__signature = None
+
+        self.__bufferpatterns = None
+        if self.__engine == ENGINE_BUFFER :
+            self.__bufferpatterns = self._getbufferpatterns()
+
+    def _combine(self, start=0, end=None):
+        ''' Combine patterns in a single alternation, a branch is the
+            only capturing group of its pattern, numbered after its
+            dispatch table index from `start`
+
+        :param start: first dispatch table index combined
+        :type start: int
+        :param end: dispatch table index following the last combined,
+            default is all
+        :type end: int
+        :returns: combined pattern or None if patterns can not be combined
+        :rType: regex.Pattern
+        '''
+        branches = []
+        for (matchconfig, i, grok) in self.__dispatchtable[start:end]:
+            expandpattern = grok.expandpattern.pattern
+            if UNCOMBINABLE_REGEX.search(expandpattern):
+                return None
+            # captures are read from the pattern match
+            branches.append('({pattern})'.format(
+                pattern=uncapturegroups(expandpattern)))
+
+        if not len(branches):
+            return None
+
+        try :
+            return re.compile('|'.join(branches))
+        except (re.error, RuntimeError):
+            return None
+
+    def _getbranch(self, match):
+        ''' Return dispatch table index of combined pattern match
+
+        :param match: combined pattern match
+        :type match: regex.Match
+        :returns: dispatch table index
+        :rType: int
+        '''
+        return match.lastindex - 1
+
+    def _getbufferpatterns(self):
+        ''' Compile patterns to scan whole buffers, line anchors
+            match at every line
+
+        :returns: MULTILINE patterns or None if a pattern anchors
+            to the input start or end or records are assembled
+        :rType: list of regex.Pattern
+        '''
+        # records are assembled from every line
+        if self.__recordconfigs :
+            return None
+
+        bufferpatterns = []
+        for (matchconfig, i, grok) in self.__dispatchtable:
+            expandpattern = grok.expandpattern.pattern
+            if UNSCANNABLE_REGEX.search(expandpattern):
+                return None
+            bufferpatterns.append(re.compile(expandpattern, re.MULTILINE))
+
+        return bufferpatterns
+
+    @property
+    def engine(self):
+        ''' Engine used, combined and buffer engines fall back
+            to loop when patterns can not be combined or scanned
+
+        '''
+        if self.__combinedpattern is not None :
+            return ENGINE_COMBINED
+        if self.__bufferpatterns is not None :
+            return ENGINE_BUFFER
+        return ENGINE_LOOP
+
+    @property
+    def reader(self):
+        ''' Input files reader
+
+        '''
+        return self.__reader
+
+    def addinputfile(self, filepath, checkpoints=None):
         ''' Add input file to program
 
+        ..note::
+            * with `checkpoints`, a file unchanged since its checkpoint
+              is not read and its captures are restored, lines appended
+              since are read from the checkpoint offset
+
         :param fileptah: input filepath
         :type filepath: str
+        :param checkpoints: scan checkpoints store
+        :type checkpoints: `CheckpointStore`
         '''
         if not os.path.exists(filepath):
             return
 
-        inputfile = InputProgramFile(filepath)
+        (inputfile, checkpoint, stat) = self._openinputfile(filepath, checkpoints)
+        self.__inputs.append(inputfile)
+
+        if checkpoint is not None :
+            self._restorecheckpoint(inputfile, checkpoint)
+            if self._isunchanged(checkpoint, stat):
+                inputfile.done = 1
+                return
+
+        filecaptures = self._runinputfile(inputfile)
+
+        if checkpoints is not None :
+            self._setcheckpoint(checkpoints, inputfile, stat,
+                    checkpoint, filecaptures)
+
+    def addinputfiles(self, filepaths, jobs=1, checkpoints=None, callback=None,
+            splitsize=DEFAULT_SPLITSIZE):
+        ''' Add input files to program, analyzed by `jobs` worker
+            processes, largest files first. Captures are merged
+            in `filepaths` order as if files were added one by one
+
+        ..note::
+            * actions run in worker processes
+            * uncompressed files larger than `splitsize` are split in
+              byte ranges starting at line starts, analyzed in parallel
+              and merged in offset order. Line numbers restart at
+              each range and no-match actions run in this process
+
+        :param filepaths: input filepaths, read as they come
+            with a single job
+        :type filepaths: iterable
+        :param jobs: number of worker processes
+        :type jobs: int
+        :param checkpoints: scan checkpoints store
+        :type checkpoints: `CheckpointStore`
+        :param callback: called with (index, filepath) once a file is
+            merged, returning False stops the analysis
+        :type callback: callable
+        :param splitsize: minimum size in bytes of a split file range,
+            None disables splitting
+        :type splitsize: int
+        '''
+        filepaths = (filepath for filepath in filepaths \
+                if os.path.exists(filepath))
+
+        if jobs <= 1 :
+            for (index, filepath) in enumerate(filepaths):
+                self.addinputfile(filepath, checkpoints=checkpoints)
+                if callback is not None and callback(index, filepath) is False :
+                    return
+            return
+
+        opened = []
+        nbranges = []
+        tasks = []
+        for (index, filepath) in enumerate(filepaths):
+            (inputfile, checkpoint, stat) = self._openinputfile(filepath, checkpoints)
+            opened.append((inputfile, checkpoint, stat))
+            nbranges.append(0)
+
+            if checkpoint is not None and self._isunchanged(checkpoint, stat):
+                continue
+
+            nbmatches = checkpoint['nbmatches'] if checkpoint is not None else 0
+            # compressed files are read in sequence
+            # and records may span ranges
+            if splitsize is None or self.__recordconfigs or \
+                    isinstance(inputfile, InputProgramCompressedFile) or \
+                    stat.st_size - inputfile.offset <= splitsize :
+                nbranges[index] = 1
+                tasks.append((stat.st_size, (index, 0),
+                        (filepath, inputfile.offset, nbmatches, None,
+                        inputfile.partial)))
+                continue
+
+            ranges = splitinputfile(filepath, inputfile.offset,
+                    stat.st_size, splitsize)
+            nbranges[index] = len(ranges)
+            for (rangeindex, (start, end)) in enumerate(ranges):
+                # previous matches are counted once, with the first range
+                tasks.append((end - start, (index, rangeindex),
+                        (filepath, start, 0 if rangeindex else nbmatches, end,
+                        None if rangeindex else inputfile.partial)))
+
+        # largest files first for a balanced end of analysis
+        tasks = [(key, task) for (size, key, task) in \
+                sorted(tasks, key=lambda t : (-t[0], t[1]))]
+
+        pool = multiprocessing.Pool(jobs, initializer=initworker,
+                initargs=(self.todict(),))
+        try :
+            results = {}
+            iterresults = pool.imap_unordered(analyzeinputfile, tasks)
+            for index in range(len(opened)):
+                (inputfile, checkpoint, stat) = opened[index]
+
+                keys = [(index, rangeindex) for \
+                        rangeindex in range(nbranges[index])]
+                for key in keys :
+                    while key not in results :
+                        (resultkey, result) = next(iterresults)
+                        results[resultkey] = result
+
+                result = None
+                if len(keys) == 1 :
+                    result = results.pop(keys[0])
+                elif keys :
+                    result = self._mergeranges([results.pop(key) for key in keys])
+
+                # ranges do not know of each other matches
+                self._mergeinputfile(inputfile, checkpoints, checkpoint,
+                        stat, result, nomatch=len(keys) > 1)
+
+                if callback is not None and \
+                        callback(index, inputfile.path) is False :
+                    pool.terminate()
+                    return
+            pool.close()
+        except :
+            pool.terminate()
+            raise
+        finally :
+            pool.join()
+
+    def _openinputfile(self, filepath, checkpoints=None):
+        ''' Create input of `filepath` starting at its valid checkpoint
+            offset, compressed files are found from magic bytes
+
+        :param filepath: input filepath
+        :type filepath: str
+        :param checkpoints: scan checkpoints store
+        :type checkpoints: `CheckpointStore`
+        :returns: input file, checkpoint or None and file stat
+        :rType: tuple
+        '''
+        compression = getcompression(filepath)
+        stat = os.stat(filepath)
+
+        checkpoint = None
+        if checkpoints is not None :
+            checkpoint = self._getcheckpoint(checkpoints, filepath, stat,
+                    resumable=compression is None)
+
+        (offset, partial) = (0, None)
+        if checkpoint is not None :
+            offset = checkpoint['offset']
+            partial = checkpoint.get('partial')
+
+        return (self._createinputfile(filepath, offset, compression,
+                partial=partial), checkpoint, stat)
+
+    def _createinputfile(self, filepath, offset=0, compression=None, end=None,
+            partial=None):
+        ''' Create input of `filepath` with program reader options
+
+        :param filepath: input filepath
+        :type filepath: str
+        :param offset: offset to start reading from
+        :type offset: int
+        :param compression: file compression, see `COMPRESSIONS`
+        :type compression: str
+        :param end: offset to stop reading at
+        :type end: int
+        :param partial: digest of a partial line at `offset` already read
+        :type partial: str
+        :returns: input file
+        :rType: `InputProgramFile`
+        '''
+        if compression is not None :
+            return InputProgramCompressedFile(filepath,
+                    compression=compression, blocksize=self.__blocksize)
+
+        return InputProgramFile(filepath, reader=self.__reader,
+                blocksize=self.__blocksize, offset=offset, end=end,
+                partial=partial)
+
+    def _runinputfile(self, inputfile, nomatch=True):
+        ''' Run input file with program engine
+
+        :param inputfile: input file
+        :type inputfile: `InputProgramFile`
+        :param nomatch: run no-match actions at end of file
+        :type nomatch: bool
+        :returns: captures of this run {pattern : [capture, ...]}
+        :rType: dict
+        '''
+        nbcaptures = {pattern : len(captures) for \
+                (pattern, captures) in self.__captures.items()}
+
+        nomatchcallback = self._nomatchconfigs
+        if not nomatch :
+            nomatchcallback = lambda programinput : None
+
+        if self.__bufferpatterns is not None and inputfile.offset == 0 and \
+                inputfile.partial is None :
+            inputfile.runbuffer(self.__bufferpatterns,
+                    self._matchconfigs, nomatchcallback, self._endinput)
+        else :
+            inputfile.run(self._matchconfigs, nomatchcallback,
+                    self._endinput)
+
+        return {pattern : [capture for (inputname, capture) in \
+                captures[nbcaptures.get(pattern, 0):]] for \
+                (pattern, captures) in self.__captures.items() \
+                if len(captures) > nbcaptures.get(pattern, 0)}
+
+    def _shareoutput(self):
+        ''' Write stdout actions output as stdout is shared with
+            other worker processes, see `OutputSink`
+
+        '''
+        self.__sharedoutput = True
+
+    def _analyzeinputfile(self, filepath, offset=0, nbmatches=0, end=None,
+            partial=None):
+        ''' Analyze input file in a worker process, the program
+            keeps no capture between files
+
+        :param filepath: input filepath
+        :type filepath: str
+        :param offset: offset to start reading from
+        :type offset: int
+        :param nbmatches: matches of file previous analysis
+        :type nbmatches: int
+        :param end: offset to stop reading at, no-match actions
+            are left to the caller for file ranges
+        :type end: int
+        :param partial: digest of a partial line at `offset` already read
+        :type partial: str
+        :returns: input file state and captures
+        :rType: dict
+        '''
+        inputfile = self._createinputfile(filepath, offset,
+                getcompression(filepath), end, partial)
+        inputfile.nbmatches = nbmatches
+
+        try :
+            captures = self._runinputfile(inputfile,
+                    nomatch=end is None)
+        finally :
+            self.__captures = {}
+
+        return {'captures' : captures,
+                'nbmatches' : inputfile.nbmatches,
+                'lineno' : inputfile.lineno,
+                'nblines' : inputfile.nblines,
+                'nbbytes' : inputfile.nbbytes,
+                'elapsed' : inputfile.elapsed,
+                'offset' : inputfile.offset,
+                'partial' : inputfile.partial}
+
+    def _mergeranges(self, results):
+        ''' Merge analyses of a file ranges, in offset order
+
+        :param results: ranges worker analyses
+        :type results: list of dict
+        :returns: file analysis
+        :rType: dict
+        '''
+        merged = {'captures' : {},
+                'nbmatches' : 0,
+                'lineno' : 0,
+                'nblines' : 0,
+                'nbbytes' : 0,
+                'elapsed' : 0,
+                'offset' : results[-1]['offset'],
+                'partial' : results[-1]['partial']}
+
+        for result in results :
+            for (pattern, captures) in result['captures'].items():
+                merged['captures'].setdefault(pattern, []).extend(captures)
+
+            for key in ('nbmatches', 'lineno', 'nblines', 'nbbytes', 'elapsed'):
+                merged[key] += result[key]
+
+        return merged
+
+    def _mergeinputfile(self, inputfile, checkpoints, checkpoint, stat, result,
+            nomatch=False):
+        ''' Merge input file analyzed by a worker process
+
+        :param inputfile: input file
+        :type inputfile: `InputProgramFile`
+        :param checkpoints: scan checkpoints store
+        :type checkpoints: `CheckpointStore`
+        :param checkpoint: input file valid checkpoint
+        :type checkpoint: dict
+        :param stat: input file stat
+        :type stat: os.stat_result
+        :param result: worker analysis or None if file is unchanged
+        :type result: dict
+        :param nomatch: run no-match actions if the file has no match
+        :type nomatch: bool
+        '''
+        self.__inputs.append(inputfile)
+
+        if checkpoint is not None :
+            self._restorecheckpoint(inputfile, checkpoint)
+
+        inputfile.done = 1
+        if result is None :
+            return
+
+        for key in ('nbmatches', 'lineno', 'nblines', 'nbbytes', 'elapsed',
+                'offset', 'partial'):
+            setattr(inputfile, key, result[key])
+
+        for (pattern, captures) in sorted(result['captures'].items()):
+            self.__captures.setdefault(pattern, []).extend(
+                    (inputfile.inputname, capture) for capture in captures)
+
+        if nomatch and inputfile.nbmatches == 0 :
+            self._nomatchconfigs(inputfile)
+
+        if checkpoints is not None :
+            self._setcheckpoint(checkpoints, inputfile, stat,
+                    checkpoint, result['captures'])
+
+    def _setcheckpoint(self, checkpoints, inputfile, stat, checkpoint, filecaptures):
+        ''' Record input file checkpoint
+
+        :param checkpoints: scan checkpoints store
+        :type checkpoints: `CheckpointStore`
+        :param inputfile: input file
+        :type inputfile: `InputProgramFile`
+        :param stat: input file stat when opened
+        :type stat: os.stat_result
+        :param checkpoint: previous valid checkpoint
+        :type checkpoint: dict
+        :param filecaptures: captures of this run {pattern : [capture, ...]}
+        :type filecaptures: dict
+        '''
+        # previous captures of the file are kept
+        captures = dict(filecaptures)
+        if checkpoint is not None :
+            for (pattern, previous) in checkpoint['captures'].items():
+                captures[pattern] = previous + captures.get(pattern, [])
+
+        checkpoints.set(inputfile.path, stat, inputfile.offset, self.signature,
+                captures, inputfile.nbmatches, inputfile.partial)
+
+    def _isunchanged(self, checkpoint, stat):
+        ''' Return `True` if file did not change since `checkpoint`
+
+        '''
+        return (checkpoint['size'], checkpoint['mtime']) == \
+                (stat.st_size, stat.st_mtime)
+
+    def _getcheckpoint(self, checkpoints, filepath, stat, resumable=True):
+        ''' Return valid checkpoint of `filepath`
+
+        :param checkpoints: scan checkpoints store
+        :type checkpoints: `CheckpointStore`
+        :param filepath: input filepath
+        :type filepath: str
+        :param stat: input file stat
+        :type stat: os.stat_result
+        :param resumable: file can be read from an offset
+        :type resumable: bool
+        :returns: checkpoint or None if the file must be read again
+        :rType: dict
+        '''
+        checkpoint = checkpoints.get(filepath)
+        if checkpoint is None :
+            return None
+
+        # other program, other file or rewritten file
+        if checkpoint['signature'] != self.signature or \
+                checkpoint['inode'] != stat.st_ino or \
+                checkpoint['size'] > stat.st_size :
+            return None
+
+        unchanged = (checkpoint['size'], checkpoint['mtime']) == \
+                (stat.st_size, stat.st_mtime)
+        if not unchanged and not resumable :
+            return None
+
+        return checkpoint
+
+    def _restorecheckpoint(self, programinput, checkpoint):
+        ''' Restore captures and matches of an input checkpoint
+
+        :param programinput: program input
+        :type programinput: InputProgram
+        :param checkpoint: input checkpoint
+        :type checkpoint: dict
+        '''
+        programinput.nbmatches = checkpoint['nbmatches']
+        for (pattern, captures) in checkpoint['captures'].items():
+            self.__captures.setdefault(pattern, []).extend(
+                    (programinput.inputname, capture) for capture in captures)
+
+    def addfollowfile(self, filepath, timeout=None):
+        ''' Add followed input file to program, lines appended
+            to the file are matched until `timeout` idle seconds
+
+        :param filepath: input filepath
+        :type filepath: str
+        :param timeout: idle timeout in seconds, default is
+            to follow file until the input is stopped
+        :type timeout: float
+        :returns: followed input file
+        :rType: `InputProgramFollowFile`
+        '''
+        inputfile = InputProgramFollowFile(filepath,
+                blocksize=self.__blocksize, timeout=timeout)
         self.__inputs.append(inputfile)
-        inputfile.run(self._matchconfigs, self._nomatchconfigs)
+        inputfile.run(self._matchconfigs, self._nomatchconfigs,
+                self._endinput, self._idleinput)
+        return inputfile
+
+    def addinputstdin(self, stream=None):
+        ''' Add standard input to program, lines are matched
+            until the end of stream
+
+        :param stream: stream to read, default is sys.stdin
+        :type stream: file
+        :returns: standard input
+        :rType: `InputProgramStdin`
+        '''
+        inputstdin = InputProgramStdin(stream, blocksize=self.__blocksize)
+        self.__inputs.append(inputstdin)
+        inputstdin.run(self._matchconfigs, self._nomatchconfigs,
+                self._endinput, self._idleinput)
+        return inputstdin
 
-    def addinputprocess(self, command):
+    def addinputprocess(self, command, **options):
         ''' Add input process to program
 
         :param command: process command
         :type command: str
+        :param options: process options, see `InputProgramProcess`
+        :type options: dict
         '''
-        inputprocess = InputProgramProcess(command)
+        inputprocess = InputProgramProcess(command, **options)
         self.__inputs.append(inputprocess)
-        inputprocess.run(self._matchconfigs, self._nomatchconfigs)
+        inputprocess.run(self._matchconfigs, self._nomatchconfigs,
+                self._endinput, self._idleinput)
+
+    def addinputprocesses(self, commands, maxconcurrency=8, **options):
+        ''' Add input processes to program, run concurrently
+
+        :param commands: processes commands
+        :type commands: list
+        :param maxconcurrency: max number of processes running at once
+        :type maxconcurrency: int
+        :param options: processes options, see `InputProgramProcess`
+        :type options: dict
+        '''
+        manager = InputProcessManager(self._matchconfigs,
+                self._nomatchconfigs, maxconcurrency=maxconcurrency,
+                endcallback=self._endinput, idlecallback=self._idleinput)
+
+        for command in commands :
+            inputprocess = InputProgramProcess(command, **options)
+            self.__inputs.append(inputprocess)
+            manager.add(inputprocess)
+
+        manager.run()
 
     def nbinputs(self):
         ''' Return inputs number
@@ -787,6 +4565,35 @@ class Program(object):
         '''
         return self.__captures
 
+    def getinputstats(self):
+        ''' Return read statistics by input
+
+        :returns: {inputname: {'lines': nb lines evaluated,
+            'bytes': nb bytes read, 'elapsed': seconds}, ...}
+        :rType: dict
+        '''
+        return {programinput.inputname : {
+                    'lines' : programinput.nblines,
+                    'bytes' : programinput.nbbytes,
+                    'elapsed' : programinput.elapsed}
+                for programinput in self.__inputs}
+
+    def getstats(self):
+        ''' Return number of texts searched with regex and
+            rejected by the literals prefilter by pattern
+
+        :returns: {pattern : {'searched' : n, 'rejected' : n}}
+        :rType: dict
+        '''
+        stats = {}
+        for index, (matchconfig, i, grok) in enumerate(self.__dispatchtable):
+            stat = stats.setdefault(matchconfig.patterns[i],
+                    {'searched' : 0, 'rejected' : 0})
+            stat['searched'] += grok.nbsearched
+            stat['rejected'] += grok.nbrejected + \
+                    self.__dispatcher.getrejected(index)
+        return stats
+
     def _matchconfigs(self, programinput, text):
         ''' Run match case config action
 
@@ -795,25 +4602,212 @@ class Program(object):
         :param text: input process/file text to match
         :type text: str
         '''
-        _break = False
+        # records completed by the line are matched first
+        if self.__recordconfigs :
+            self._assemblerecords(programinput, text)
+
+        # a line no pattern can match is skipped by a single search
+        first = 0
+        if self.__combinedpattern is not None :
+            match = self.__combinedpattern.search(text)
+            if match is None :
+                return
+
+            # other matchconfigs matching the line are evaluated
+            # pattern by pattern to keep their captures
+            if self.__dispatchbranches :
+                first = self._dispatchbranch(text, self._getbranch(match))
+                if self._matchpattern(programinput, first, text):
+                    return
+                first += 1
+
+        # only patterns whose required literals are in text
+        # are evaluated, in matchconfigs order
+        for index in self.__dispatcher.candidates(text):
+            if index < first :
+                continue
 
-        for matchconfig in self.__matchconfigs :
+            matched = self._matchpattern(programinput, index, text)
+
+            if matched and self.__dispatchtable[index][0].breakifmatch :
+                break
+
+    def _dispatchbranch(self, text, index):
+        ''' Return first pattern in dispatch table order matching
+            text, a branch preceding the leftmost match one may
+            match further in the line. Preceding branches are
+            searched by aligned ranges of a power of two branches
+
+        :param text: input process/file text to match
+        :type text: str
+        :param index: dispatch table index of a branch matching text
+        :type index: int
+        :returns: dispatch table index
+        :rType: int
+        '''
+        start = 0
+        while start < index :
+            size = 1
+            while start % (size * 2) == 0 and start + size * 2 <= index :
+                size *= 2
+
+            rangepattern = self.__rangepatterns.get((start, start + size))
+            if rangepattern is None :
+                rangepattern = self._combine(start, start + size)
+                # patterns from start are evaluated in order
+                if rangepattern is None :
+                    return start
+                self.__rangepatterns[(start, start + size)] = rangepattern
+
+            match = rangepattern.search(text)
+            if match is None :
+                start += size
+            else :
+                index = start + self._getbranch(match)
+
+        return index
+
+    def _matchpattern(self, programinput, index, text):
+        ''' Evaluate dispatch table pattern, add its captures
+            and run its matchconfig action
+
+        :param programinput: program input instance
+        :type programinput: InputProgram
+        :param index: dispatch table index
+        :type index: int
+        :param text: input process/file text to match
+        :type text: str
+        :returns: `True` if pattern matched
+        :rType: bool
+        '''
+        (matchconfig, i, pattern) = self.__dispatchtable[index]
+
+        if matchconfig.allmatches :
+            matches = pattern.finditer(text, prefilter=False)
+        else :
+            match = pattern.match(text, prefilter=False)
+            matches = (match,) if match is not None else ()
 
-            for i, pattern in enumerate(matchconfig.expandpatterns) :
+        matched = False
+        for match in matches :
+            matched = True
 
-                match = pattern.match(text)
+            self._addcapture(programinput, matchconfig.patterns[i], match)
 
-                if match is not None :
+            self._matchconfigaction(programinput, matchconfig, match)
 
-                    self._addcapture(programinput, matchconfig.patterns[i], match)
+        return matched
 
-                    self._matchconfigaction(programinput, matchconfig, match)
+    def _assemblerecords(self, programinput, text):
+        ''' Add line to records of input and match completed ones
 
-                    if matchconfig.breakifmatch :
-                        _break = True
-                        break
+        :param programinput: program input instance
+        :type programinput: InputProgram
+        :param text: input process/file text to match
+        :type text: str
+        '''
+        assemblers = self.__assemblers.get(programinput)
+        if assemblers is None :
+            assemblers = [(matchconfig, matchconfig.getassembler()) for \
+                    matchconfig in self.__recordconfigs]
+            self.__assemblers[programinput] = assemblers
+
+        for (matchconfig, assembler) in assemblers :
+            for record in assembler.add(text):
+                self._matchrecord(programinput, matchconfig, record)
+
+    def _idleinput(self, programinput):
+        ''' Match timed out records of an input waiting for data
+            and flush expired batched actions
+
+        :param programinput: program input instance
+        :type programinput: InputProgram
+        '''
+        for (matchconfig, assembler) in self.__assemblers.get(programinput, ()):
+            record = assembler.expire()
+            if record is not None :
+                self._matchrecord(programinput, matchconfig, record)
+
+        # a batch which is not full is not held until the end of
+        # followed files, standard input or processes
+        for executor in self.__executors.values():
+            executor.expire()
+
+    def _endinput(self, programinput):
+        ''' Match last records of input and flush stdin batched
+            actions, called at end of input
+
+        :param programinput: program input instance
+        :type programinput: InputProgram
+        '''
+        for (matchconfig, assembler) in self.__assemblers.pop(programinput, ()):
+            record = assembler.flush()
+            if record is not None :
+                self._matchrecord(programinput, matchconfig, record)
+
+        # xargs batches span inputs until they are full or expire
+        for executor in self.__executors.values():
+            if executor.batch == BATCH_STDIN :
+                executor.flush()
+
+        if self.__output is not None :
+            self.__output.flush()
+
+    def close(self):
+        ''' Run pending batched and queued actions, wait
+            for their commands and write buffered output
+
+        :returns: number of queued actions left undone
+            after the action timeout
+        :rType: int
+        '''
+        for executor in self.__executors.values():
+            executor.close()
+        self.__executors = {}
+
+        undone = 0
+        if self.__actionqueue is not None :
+            undone = self.__actionqueue.drain(self.__actiontimeout)
+            self.__actionqueue = None
+
+        if self.__output is not None :
+            self.__output.close()
+            self.__output = None
+        return undone
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exctype, excvalue, exctb):
+        self.close()
+
+    def _matchrecord(self, programinput, matchconfig, record):
+        ''' Run record match config action
+
+        :param programinput: program input instance
+        :type programinput: InputProgram
+        :param matchconfig: record match config
+        :type matchconfig: MatchConfig
+        :param record: record lines
+        :type record: str
+        '''
+        for (i, pattern) in enumerate(matchconfig.expandpatterns):
+
+            if matchconfig.allmatches :
+                matches = pattern.finditer(record)
+            else :
+                match = pattern.match(record)
+                matches = (match,) if match is not None else ()
+
+            matched = False
+            for match in matches :
+                matched = True
 
-            if _break is True :
+                self._addcapture(programinput, matchconfig.patterns[i], match)
+
+                self._matchconfigaction(programinput, matchconfig, match)
+
+            if matched and matchconfig.breakifmatch :
                 break
 
     def _nomatchconfigs(self, programinput):
@@ -827,6 +4821,10 @@ class Program(object):
             if matchconfig.nomatch :
                 self._matchconfigaction(programinput, matchconfig, None)
 
+        # input is done, its output is not kept buffered
+        if self.__output is not None :
+            self.__output.flush()
+
     def _matchconfigaction(self, programinput, matchconfig, match):
         ''' Run match case config action
 
@@ -848,22 +4846,29 @@ class Program(object):
             action = self._filteraction(programinput, matchconfig.action, match)
 
         if matchconfig.shell == 'stdout':
-            sys.stdout.write(action+'\n')
-            sys.stdout.flush()
+            if self.__output is None :
+                self.__output = OutputSink(sys.stdout,
+                        flushinterval=self.__flushinterval,
+                        shared=self.__sharedoutput)
+            self.__output.write(action+'\n')
+        elif matchconfig.batch is not None :
+            executor = self.__executors.get(matchconfig)
+            if executor is None :
+                executor = matchconfig.getexecutor()
+                self.__executors[matchconfig] = executor
+            executor.send(action)
+        elif self.__actionworkers > 0 :
+            if self.__actionqueue is None :
+                self.__actionqueue = ActionQueue(self.__actionworkers,
+                        self.__actionqueuesize)
+            self.__actionqueue.put(programinput.inputname, action)
         else :
-            try :
-                proc = subprocess.Popen(shlex.split(action), stdin=subprocess.PIPE,
-                        stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-
-                while True :
-                    line = proc.stdout.readline()
-                    if not line :
-                        break
+            # command output follows buffered stdout actions
+            if self.__output is not None :
+                self.__output.flush()
 
-                    print line,
-            except Exception, e :
-                print 'Failed to execute action', action
-                print e
+            sys.stdout.write(runaction(action))
+            sys.stdout.flush()
 
     def _getmacrovalue(self, macrotype, programinput, match):
         ''' Return macro value from macrotype
@@ -985,22 +4990,28 @@ class Program(object):
 
                     value = self._applyfilter(patternfilter[1:], value)
 
-                    substring += '\\' + patternfilter
+                    substring += patternfilter
 
                 substring += '}'
 
-                output = re.sub(substring, value, output )
+                # literal replacement, %{name} is not a valid regex
+                # for every name and values may hold backslashes
+                output = output.replace(substring, value)
 
         return output
 
-    def save(self, filepath):
-        ''' Save program config as json file
+    def todict(self):
+        ''' Return program config as dict, see `fromdict`
 
-        :param filepath: filepath
-        :type filepath: str
+        :returns: program config
+        :rType: dict
         '''
         excludekeys = ['inputs', 'captures', 'filterpattern',
-                    'expandpatterns']
+                    'expandpatterns', 'dispatchtable', 'dispatcher',
+                    'combinedpattern', 'dispatchbranches', 'rangepatterns',
+                    'bufferpatterns', 'signature',
+                    'recordconfigs', 'assemblers', 'recordpatterns',
+                    'executors', 'actionqueue', 'output', 'sharedoutput']
         supportedclass = ['MatchConfig', 'Program']
 
         def deletekeys(d, keys):
@@ -1009,23 +5020,68 @@ class Program(object):
             return {k:v for k, v in ((k, deletekeys(v, keys)) \
                     for k, v in d.items()) if k not in keys}
 
+        return json.loads(json.dumps(self, default=lambda x: deletekeys({ re.sub( '_%s__' % x.__class__.__name__, '', k) : v \
+                    for (k, v) in x.__dict__.iteritems() if x.__class__.__name__ in supportedclass }, excludekeys)))
+
+    @property
+    def signature(self):
+        ''' Program signature, changes with matchconfigs, capture
+            format and patterns library but not with engine or reader
+
+        '''
+        if self.__signature is not None :
+            return self.__signature
+
+        programdict = self.todict()
+        for key in ('name', 'engine', 'reader', 'blocksize',
+                'actionworkers', 'actionqueuesize', 'actiontimeout',
+                'flushinterval'):
+            programdict.pop(key, None)
+
+        versions = sorted(set(grok.library.version for \
+                (matchconfig, i, grok) in self.__dispatchtable))
+
+        self.__signature = hashlib.sha1(json.dumps([programdict, versions],
+            sort_keys=True)).hexdigest()
+        return self.__signature
+
+    def save(self, filepath):
+        ''' Save program config as json file
+
+        :param filepath: filepath
+        :type filepath: str
+        '''
         with open(filepath, 'w') as outfile:
-            data = json.dumps(self, default=lambda x: deletekeys({ re.sub( '_%s__' % x.__class__.__name__, '', k) : v \
-                    for (k, v) in x.__dict__.iteritems() if x.__class__.__name__ in supportedclass }, excludekeys),
-                    sort_keys=True, indent=2)
+            data = json.dumps(self.todict(), sort_keys=True, indent=2)
 
             outfile.write(data)
 
         return filepath
 
     @classmethod
-    def load(cls, filepath):
+    def load(cls, filepath, engine=None, reader=None, blocksize=None,
+            actionworkers=None, actionqueuesize=None, actiontimeout=None,
+            flushinterval=None):
         ''' Load program as from config file
 
         :param cls: class
         :type cls: Program
         :param filepath: program config file
         :type filepath : str
+        :param engine: override config engine
+        :type engine: str
+        :param reader: override config reader
+        :type reader: str
+        :param blocksize: override config block size
+        :type blocksize: int
+        :param actionworkers: override config action workers
+        :type actionworkers: int
+        :param actionqueuesize: override config action queue size
+        :type actionqueuesize: int
+        :param actiontimeout: override config action timeout
+        :type actiontimeout: float
+        :param flushinterval: override config output flush interval
+        :type flushinterval: float
         :returns: program instance from dict
         :rType: Program
         '''
@@ -1033,6 +5089,27 @@ class Program(object):
 
             content = json.load(f)
 
+        if engine is not None :
+            content['engine'] = engine
+
+        if reader is not None :
+            content['reader'] = reader
+
+        if blocksize is not None :
+            content['blocksize'] = blocksize
+
+        if actionworkers is not None :
+            content['actionworkers'] = actionworkers
+
+        if actionqueuesize is not None :
+            content['actionqueuesize'] = actionqueuesize
+
+        if actiontimeout is not None :
+            content['actiontimeout'] = actiontimeout
+
+        if flushinterval is not None :
+            content['flushinterval'] = flushinterval
+
         program = cls.fromdict(content)
         return program
 
@@ -1053,7 +5130,15 @@ class Program(object):
         program._Program__captureformat = programdict.get('captureformat','%{@PATTERNS}')
         program._Program__inputs = []
         program._Program__captures = {}
-        program._compile()
+        program._Program__engine = programdict.get('engine', ENGINE_LOOP)
+        program._Program__reader = programdict.get('reader', READER_BLOCK)
+        program._Program__blocksize = programdict.get('blocksize', DEFAULT_BLOCKSIZE)
+        program._Program__actionworkers = programdict.get('actionworkers', 0)
+        program._Program__actionqueuesize = programdict.get('actionqueuesize',
+                DEFAULT_ACTIONQUEUESIZE)
+        program._Program__actiontimeout = programdict.get('actiontimeout')
+        program._Program__flushinterval = programdict.get('flushinterval',
+                DEFAULT_FLUSHINTERVAL)
 
         matchconfigs = []
 
@@ -1062,5 +5147,34 @@ class Program(object):
             matchconfigs.append(matchconfig)
 
         program._Program__matchconfigs = matchconfigs
+        program._compile()
 
         return program
+
+# program of a worker process, see `Program.addinputfiles`
+WORKER_PROGRAM = None
+
+def initworker(programdict):
+    ''' Init worker process program from `Program.todict`
+
+    :param programdict: program dict
+    :type programdict: dict
+    '''
+    global WORKER_PROGRAM
+    WORKER_PROGRAM = Program.fromdict(programdict)
+    WORKER_PROGRAM._shareoutput()
+
+    # batched and queued actions span the files of the worker,
+    # they are run when the worker exits
+    multiprocessing.util.Finalize(None, WORKER_PROGRAM.close, exitpriority=10)
+
+def analyzeinputfile(task):
+    ''' Analyze input file with worker process program
+
+    :param task: (key, (filepath, offset, nbmatches, end, partial))
+    :type task: tuple
+    :returns: (key, input file state and captures)
+    :rType: tuple
+    '''
+    (key, args) = task
+    return (key, WORKER_PROGRAM._analyzeinputfile(*args))
@@ -1,11 +1,13 @@
 # coding: utf8
 from __future__ import unicode_literals
 
-from core import Program, MatchConfig
+from core import Program, MatchConfig, CheckpointStore, GROK_CACHE, getgrokstore, getpatternlibrary, \
+        discoverinputs, STDIN_INPUTNAME
 
 import os
 import sys
 import json
+import time
 import regex as re
 import traceback
 
@@ -86,7 +88,23 @@ def programanalyze(program, toppatterns=None):
 
     return result
 
-def run(patterns=None, matches=None, config=None, root=None, logfile=None, action=None, output=None, verbose=False):
+def close(logparser, verbose=False):
+    ''' Wait for program pending actions
+
+    :param logparser: program
+    :type logparser: `Program`
+    :param verbose: Turn on verbose
+    :type verbose: bool
+    '''
+    undone = logparser.close()
+    if undone and verbose :
+        print '------ (%d) actions left undone after action timeout' % undone
+
+def run(patterns=None, matches=None, config=None, root=None, logfile=None, action=None, output=None, verbose=False,
+        warmcache=False, engine=None, reader=None, blocksize=None, follow=False, followtimeout=None,
+        checkpoints=None, jobs=1, splitsize=None, recursive=False, include=None, exclude=None,
+        minsize=None, maxsize=None, minage=None, maxage=None, batch=None, shell=None, batchsize=None,
+        batchmaxage=None, null=False, actionworkers=None, actionqueuesize=None, actiontimeout=None, flushinterval=None):
     ''' Run program analyze with specific config
         on a list of logfiles
 
@@ -94,49 +112,195 @@ def run(patterns=None, matches=None, config=None, root=None, logfile=None, actio
     :type config: str
     :param root: log files root
     :type root: str
+    :param logfile: log file, - reads standard input
+    :type logfile: str
     :param output: save output analyze as file
     :type ouput: str
     :param verbose: Turn on verbose
     :type verbose: bool
+    :param warmcache: only save program expanded patterns
+        in the on-disk patterns store
+    :type warmcache: bool
+    :param engine: matching engine loop, combined or buffer
+    :type engine: str
+    :param reader: input files reader block or mmap
+    :type reader: str
+    :param blocksize: block reader block size in bytes
+    :type blocksize: int
+    :param follow: follow lines appended to logfile
+    :type follow: bool
+    :param followtimeout: stop following after idle seconds
+    :type followtimeout: float
+    :param checkpoints: scan checkpoints file, unchanged log files
+        are skipped and appended ones read from their last offset
+    :type checkpoints: str
+    :param jobs: number of worker processes analyzing log files
+    :type jobs: int
+    :param splitsize: log files larger than split size in bytes are
+        analyzed by ranges in parallel, 0 disables splitting
+    :type splitsize: int
+    :param recursive: analyze log files of root sub directories
+    :type recursive: bool
+    :param include: glob patterns of root log files to analyze
+    :type include: list
+    :param exclude: glob patterns of root log files and directories to skip
+    :type exclude: list
+    :param minsize: minimum log file size in bytes
+    :type minsize: int
+    :param maxsize: maximum log file size in bytes
+    :type maxsize: int
+    :param minage: minimum log file age in seconds since last modification
+    :type minage: float
+    :param maxage: maximum log file age in seconds since last modification
+    :type maxage: float
+    :param batch: run shell command once for many actions, stdin or xargs
+    :type batch: str
+    :param shell: command receiving batched actions
+    :type shell: str
+    :param batchsize: actions by batch
+    :type batchsize: int
+    :param batchmaxage: maximum seconds actions wait in a batch
+        which is not full
+    :type batchmaxage: float
+    :param null: batched actions are NUL delimited on standard input
+    :type null: bool
+    :param actionworkers: number of threads running shell actions
+        while log files are analyzed
+    :type actionworkers: int
+    :param actionqueuesize: maximum number of queued shell actions
+    :type actionqueuesize: int
+    :param actiontimeout: seconds to wait for queued shell actions at exit
+    :type actiontimeout: float
+    :param flushinterval: maximum seconds matches printed to a pipe or
+        a file stay buffered, 0 writes every match
+    :type flushinterval: float
     '''
-    logfiles = []
-
-    if logfile is not None :
-        logfiles = [logfile]
-    else :
-        logfiles = sorted([ os.path.join(root, f) for f in os.listdir(root) \
-                if os.path.isfile(os.path.join(root, f))])
-
-    if verbose :
-        print '------ (%d) files to analyze' % len(logfiles)
+    actionoptions = {'shell' : action if action else 'stdout'}
+    if batch is not None :
+        if shell is None :
+            raise ValueError('Batched actions require a shell command')
+        actionoptions = {'shell' : shell, 'batch' : batch,
+                'delimiter' : '\0' if null else '\n'}
+        if batchsize is not None :
+            actionoptions['batchsize'] = batchsize
+        if batchmaxage is not None :
+            actionoptions['batchmaxage'] = batchmaxage
+
+    programoptions = {}
+    if engine is not None :
+        programoptions['engine'] = engine
+    if reader is not None :
+        programoptions['reader'] = reader
+    if blocksize is not None :
+        programoptions['blocksize'] = blocksize
+    if actionworkers is not None :
+        programoptions['actionworkers'] = actionworkers
+    if actionqueuesize is not None :
+        programoptions['actionqueuesize'] = actionqueuesize
+    if actiontimeout is not None :
+        programoptions['actiontimeout'] = actiontimeout
+    if flushinterval is not None :
+        programoptions['flushinterval'] = flushinterval
 
     # grok pattern name defined in library
     # ex : WORD, PATH, ...
     if patterns is not None:
         matchconfig = MatchConfig(['%{'+p+'}' for p in patterns],
-                        shell=action if action is not None else 'stdout',
-                        action=action if action is not None else '%{@LINE}')
-        logparser = Program([matchconfig])
+                        action=action if action is not None else '%{@LINE}',
+                        **actionoptions)
+        logparser = Program([matchconfig], **programoptions)
 
     # match can be regex or/and grok patterns
     # ex : DATE : %{DATE}[- ]%{HOUR}:%{MINUTE}
     elif matches is not None :
         matchconfig = MatchConfig(matches,
-                        shell=action if action else 'stdout',
-                        action=action if action is not None else '%{@LINE}')
-        logparser = Program([matchconfig])
+                        action=action if action is not None else '%{@LINE}',
+                        **actionoptions)
+        logparser = Program([matchconfig], **programoptions)
 
     # Use match config file
     elif config is not None:
-        logparser = Program.load(config)
+        logparser = Program.load(config, **programoptions)
     else :
         return
 
-    for logfile in logfiles :
+    if warmcache :
+        path = getgrokstore(getpatternlibrary()).save()
+        if verbose :
+            print 'patterns store saved as %s' % path
+        return
+
+    if follow :
+        if logfile is None or logfile == STDIN_INPUTNAME :
+            raise ValueError('Follow mode requires a single log file')
+
+        if verbose :
+            print '------ follow %s' % logfile
+
+        try :
+            logparser.addfollowfile(logfile, timeout=followtimeout)
+        except KeyboardInterrupt :
+            pass
+        close(logparser, verbose)
+        return
+
+    if logfile == STDIN_INPUTNAME :
+        logfiles = []
+    elif logfile is not None :
+        logfiles = [logfile]
+    else :
+        now = time.time()
+        # log files are analyzed as they are discovered
+        logfiles = discoverinputs(root, recursive=recursive,
+                include=include, exclude=exclude, minsize=minsize, maxsize=maxsize,
+                minmtime=now - maxage if maxage is not None else None,
+                maxmtime=now - minage if minage is not None else None)
+
+    if verbose :
+        print '------ analyze files of %s' % (logfile or root)
+
+    checkpointstore = None
+    if checkpoints is not None :
+        checkpointstore = CheckpointStore(checkpoints)
+
+    def analyzed(index, logfile):
         if verbose :
-            print '------ analyze %s' % logfile
+            print '------ analyzed %s' % logfile
+
+    start = time.time()
+    splitoptions = {}
+    if splitsize is not None :
+        splitoptions['splitsize'] = splitsize or None
+    if logfile == STDIN_INPUTNAME :
+        # lines piped to standard input are matched as they come
+        try :
+            logparser.addinputstdin()
+        except KeyboardInterrupt :
+            pass
+    else :
+        logparser.addinputfiles(logfiles, jobs=jobs, checkpoints=checkpointstore,
+                callback=analyzed, **splitoptions)
 
-        logparser.addinputfile(logfile)
+    # pending batched and queued actions
+    close(logparser, verbose)
+
+    if checkpointstore is not None :
+        path = checkpointstore.save()
+        if verbose :
+            print '------ checkpoints saved as %s' % path
+
+    if verbose :
+        print '------ (%d) files analyzed in %0.3f sec with %s engine' % (logparser.nbinputs(),
+                time.time() - start, logparser.engine)
+
+        inputstats = logparser.getinputstats().values()
+        nblines = sum(stats['lines'] for stats in inputstats)
+        nbbytes = sum(stats['bytes'] for stats in inputstats)
+        elapsed = sum(stats['elapsed'] for stats in inputstats)
+        if elapsed :
+            print '------ %d lines read with %s reader, %0.1f lines/sec, %0.2f MB/sec' % (
+                    nblines, logparser.reader, nblines / elapsed,
+                    nbbytes / elapsed / 1024. / 1024.)
 
     result = programanalyze(logparser, toppatterns={'%{PYTHON_ERROR}':'PYTHON_ERROR'})
 
@@ -147,6 +311,8 @@ def run(patterns=None, matches=None, config=None, root=None, logfile=None, actio
 
     if verbose:
         print(json.dumps(result, indent=4))
+        print '------ compiled patterns cache %s' % json.dumps(GROK_CACHE.info())
+        print '------ prefilter %s' % json.dumps(logparser.getstats(), indent=4)
 
 def main():
     '''
@@ -186,6 +352,24 @@ def main():
 
     # apply jsonencode filter on %{@JSON} capture data
     >>> logparser -m '%{DATE}[- ]%{HOUR}:%{MINUTE}' -a 'python -c "print(\"Result is : \" + %{@JSON|jsonencode})"'
+
+    # analyze log files with 8 worker processes
+    >>> logparser -r /studio/code/packages/coalition/latest/src/logs -p PYTHON_ERROR -j 8 -o '/tmp/analyze.log'
+
+    # echo each PYTHON_ERROR appended to a running job log
+    >>> logparser -f /studio/code/packages/coalition/latest/src/logs/1234.log -F -p PYTHON_ERROR
+
+    # echo each PYTHON_ERROR of compressed logs of a remote host piped to standard input
+    >>> ssh renderhost 'zcat /var/log/render/*.gz' | logparser -f - -p PYTHON_ERROR
+
+    # send each PYTHON_ERROR to a single notify process, one action by line on its standard input
+    >>> logparser -r /studio/code/packages/coalition/latest/src/logs -p PYTHON_ERROR -a '%{@INPUT} %{@MATCH}' --batch stdin --shell 'python notify.py'
+
+    # run updatejobenv with up to 50 job logs by invocation
+    >>> logparser -m '%{REZ_USED_RESOLVE =~ /dispatcher-dev/}' -r /studio/code/packages/coalition/latest/src/logs -a '%{@INPUT}' --batch xargs --batch-size 50 --shell 'updatejobenv -l'
+
+    # save expanded patterns of a config in $XDG_CACHE_HOME/logparser for faster start
+    >>> logparser -c /../configs/logparserprogram.config --warm-cache
     '''
 
     import argparse
@@ -207,12 +391,73 @@ def main():
 
     parser.add_argument("-r", "--root", dest="root", default=None, type=str,
             help="Specify root directory to analyze log files arg --root /../logs")
+    parser.add_argument("-R", "--recursive", dest="recursive", action="store_true",
+            help="Analyze log files of root sub directories too")
+    parser.add_argument("--include", dest="include", type=str, nargs="*",
+            help="Glob patterns of root log files to analyze, matched against file names "
+            "or relative paths --include '*.log' '2017-*/job*/*.txt'")
+    parser.add_argument("--exclude", dest="exclude", type=str, nargs="*",
+            help="Glob patterns of root log files and directories to skip --exclude '*.gz' tmp")
+    parser.add_argument("--min-size", dest="minsize", type=int,
+            help="Minimum root log file size in bytes")
+    parser.add_argument("--max-size", dest="maxsize", type=int,
+            help="Maximum root log file size in bytes")
+    parser.add_argument("--min-age", dest="minage", type=float,
+            help="Minimum root log file age in seconds since last modification")
+    parser.add_argument("--max-age", dest="maxage", type=float,
+            help="Maximum root log file age in seconds since last modification --max-age 86400")
     parser.add_argument("-f", "--logfile", dest="logfile", type=str,
-            help="Specify a log file to analyze --file /../logs/1234.log")
+            help="Specify a log file to analyze --file /../logs/1234.log, - reads standard input "
+            "zcat *.log.gz | logparser --file -")
+    parser.add_argument("-F", "--follow", dest="follow", action="store_true",
+            help="Follow lines appended to the log file, truncated or rotated file is reopened")
+    parser.add_argument("--follow-timeout", dest="followtimeout", type=float,
+            help="Stop following the log file after idle seconds")
+    parser.add_argument("-j", "--jobs", dest="jobs", type=int, default=1,
+            help="Number of worker processes analyzing log files, largest files first")
+    parser.add_argument("--split-size", dest="splitsize", type=int,
+            help="With --jobs, log files larger than split size in bytes are analyzed by line "
+            "aligned ranges in parallel, default is 128 MiB, 0 disables splitting")
+    parser.add_argument("--batch", dest="batch", choices=['stdin', 'xargs'],
+            help="Run the --shell command once for many actions, stdin writes actions to the command "
+            "standard input, xargs runs the command with --batch-size actions as arguments")
+    parser.add_argument("--shell", dest="shell", type=str,
+            help="Command receiving batched actions --shell 'python notify.py'")
+    parser.add_argument("--batch-size", dest="batchsize", type=int,
+            help="Number of actions by batch, default is 100")
+    parser.add_argument("--batch-max-age", dest="batchmaxage", type=float,
+            help="Maximum seconds actions wait in a batch which is not full, "
+            "batches of followed files, stdin and processes are flushed, default is 5")
+    parser.add_argument("-0", "--null", dest="null", action="store_true",
+            help="Batched actions are NUL delimited on the command standard input")
+    parser.add_argument("--action-workers", dest="actionworkers", type=int,
+            help="Number of threads running shell actions while log files are analyzed, "
+            "actions of a log file run concurrently and print their output in order, "
+            "default is to run them while matching")
+    parser.add_argument("--action-queue-size", dest="actionqueuesize", type=int,
+            help="Maximum number of queued shell actions, matching waits while the queue is full")
+    parser.add_argument("--action-timeout", dest="actiontimeout", type=float,
+            help="Seconds to wait for queued shell actions at exit, default is to wait for all of them")
+    parser.add_argument("--flush-interval", dest="flushinterval", type=float,
+            help="Maximum seconds matches printed to a pipe or a file stay buffered, default is 1 second, "
+            "0 writes every match. Matches printed to a terminal are not buffered")
     parser.add_argument("-v", "--verbose", dest="verbose", action="store_true",
             help="Turns on verbose output")
     parser.add_argument("-o", "--output", dest="output", type=str,
             help="Save as output file report")
+    parser.add_argument("--engine", dest="engine", choices=['loop', 'combined', 'buffer'],
+            help="Matching engine, combined skips with a single search lines no pattern matches "
+            "and evaluates the other ones pattern by pattern, "
+            "buffer scans whole files with every pattern and evaluates only lines holding a hit")
+    parser.add_argument("--reader", dest="reader", choices=['block', 'mmap'],
+            help="Input files reader, block reads large blocks split in lines in bulk, mmap reads line by line")
+    parser.add_argument("--block-size", dest="blocksize", type=int,
+            help="Block reader block size in bytes, default is 4 MiB")
+    parser.add_argument("--checkpoints", dest="checkpoints", type=str,
+            help="Scan checkpoints file, log files unchanged since last run are not read again "
+            "and appended ones are read from their last offset")
+    parser.add_argument("--warm-cache", dest="warmcache", action="store_true",
+            help="Save expanded patterns of the program in the patterns store and exit")
 
     args = parser.parse_args()
     run(**vars(args))
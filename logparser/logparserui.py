@@ -6,7 +6,7 @@ import sys
 import json
 from pprint import pprint
 
-from core import Program, MatchConfig, Grok, getpatternmacrotypes
+from core import Program, MatchConfig, Grok, getpatternmacrotypes, discoverinputs
 
 try :
     import PySide2.QtCore as QtCore
@@ -711,8 +711,7 @@ class LogParserWidget(QtWidgets.QWidget):
         if not os.path.exists(root):
             return
 
-        logfiles = sorted([ { 'path' : os.path.join(root, f)} for f in os.listdir(root) \
-                if os.path.isfile(os.path.join(root, f))])
+        logfiles = [ { 'path' : path } for path in discoverinputs(root) ]
 
         self.inputTreeWidget.setData(logfiles)
         self.inputTreeWidget.update(self.inputProgressBar.setValue)
@@ -732,19 +731,20 @@ class LogParserWidget(QtWidgets.QWidget):
 
         self.__stop = False
 
-        for i, inputfile in enumerate(inputfiles) :
-
-            if self.__stop :
-                self.captureTreeWidget.update(pg.getcaptures())
-                return
-
-            pg.addinputfile(filepath=inputfile)
+        def progress(i, inputfile):
             self.captureProgressBar.setValue(i/float(len(inputfiles))*100)
             QtGui.qApp.processEvents()
+            return not self.__stop
+
+        # files are analyzed in this process, a Qt application
+        # is not safe to fork
+        pg.addinputfiles(inputfiles, callback=progress)
+        pg.close()
 
         self.captureTreeWidget.update(pg.getcaptures())
 
-        self.captureProgressBar.setValue(100)
+        if not self.__stop :
+            self.captureProgressBar.setValue(100)
 
     def keyPressEvent(self, event):
 
@@ -2,8 +2,17 @@
 from __future__ import unicode_literals
 
 import os
+import bz2
+import gzip
 import sys
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
 import unittest
+from pipes import quote
+from StringIO import StringIO
 from pprint import pprint
 
 from logparser import core as lpc
@@ -222,6 +231,42 @@ class TestPatterns(unittest.TestCase):
         self.assertIsNone(self.grok.match('70'))
         self.assertIsNone(self.grok.match('100'))
 
+    def test_predicate_multiple(self):
+
+        self.grok.compile('^%{WORD=~/^ab/} %{INT>3}')
+        self.assertIsNotNone(self.grok.match('abc 4'))
+        self.assertIsNone(self.grok.match('abc 3'))
+        self.assertIsNone(self.grok.match('bc 4'))
+
+        # predicate on a group which did not participate
+        self.grok.compile('^(?:%{INT>3})?x')
+        self.assertIsNotNone(self.grok.match('4x'))
+        self.assertIsNone(self.grok.match('x'))
+
+    def test_predicate_finditer(self):
+
+        self.grok.compile('%{NUMBER:n>10}')
+
+        values = [m.group('n') for m in self.grok.finditer('5 20 7 31.5')]
+        self.assertEqual(values, ['20', '31.5'])
+        self.assertEqual(list(self.grok.finditer('no number')), [])
+
+    def test_program_allmatches(self):
+        (fd, logfile) = tempfile.mkstemp(suffix='.log')
+        with os.fdopen(fd, 'w') as f:
+            f.write('REZ_FOO_VERSION=1.0 REZ_BAR_VERSION=2.1\n')
+        self.addCleanup(os.remove, logfile)
+
+        def run(allmatches):
+            mc = lpc.MatchConfig(patterns=['%{REZ_PACKAGE_VERSION}'],
+                    noaction=True, allmatches=allmatches)
+            pg = lpc.Program(matchconfigs=[mc], captureformat='%{@MATCH}')
+            pg.addinputfile(logfile)
+            return [c for (i, c) in pg.getcaptures()['%{REZ_PACKAGE_VERSION}']]
+
+        self.assertEqual(run(False), ['REZ_FOO_VERSION=1.0'])
+        self.assertEqual(run(True), ['REZ_FOO_VERSION=1.0', 'REZ_BAR_VERSION=2.1'])
+
     def test_program_inputfile(self):
 
 
@@ -248,6 +293,7 @@ class TestPatterns(unittest.TestCase):
             pg.addinputfile(filepath=log)
 
         pg.save('/tmp/program.txt')
+        pg.close()
 
     def test_program_inputprocess_pythoncommand(self):
         mc = lpc.MatchConfig(
@@ -258,6 +304,62 @@ class TestPatterns(unittest.TestCase):
         pg = lpc.Program(name='HelloWorld', matchconfigs=[mc])
         command ='python -c \'print("hello world")\''
         pg.addinputprocess(command=command)
+        pg.close()
+
+    def test_inputprocess_options(self):
+        def run(command, **options):
+            inputprocess = lpc.InputProgramProcess(command, **options)
+            lines = []
+            inputprocess.run(lambda i, line : lines.append(line), lambda i : None)
+            return (inputprocess, lines)
+
+        (inputprocess, lines) = run('printf "a\\nb"; echo err >&2', readstderr=True)
+        self.assertEqual(sorted(lines), ['a', 'b', 'err'])
+        self.assertEqual(inputprocess.returncode, 0)
+
+        (inputprocess, lines) = run('echo x', runinterval=0.01, maxruns=3)
+        self.assertEqual(lines, ['x', 'x', 'x'])
+
+        (inputprocess, lines) = run('echo y; exit 1', restartonexit=True,
+                minrestartdelay=0.01, maxruns=3)
+        self.assertEqual(lines, ['y', 'y', 'y'])
+        self.assertEqual(inputprocess.nbruns, 3)
+        self.assertEqual(inputprocess.returncode, 1)
+        # delay doubled on each early exit
+        self.assertAlmostEqual(inputprocess.restartdelay, 0.04)
+
+    def test_program_inputprocesses(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+
+        def run(maxconcurrency):
+            # processes log their start and end, running
+            # processes are counted from the log. A process
+            # waits for the concurrent ones to start, up to 5s
+            runlog = os.path.join(tmpdir, 'run%d.log' % maxconcurrency)
+            mc = lpc.MatchConfig(patterns=['done %{INT:n}'], noaction=True)
+            pg = lpc.Program(matchconfigs=[mc], captureformat='%{n}')
+            barrier = 'i=0; while [ $(grep -c + %s) -lt %d ] && [ $i -lt 50 ]; ' \
+                    'do sleep 0.1; i=$((i+1)); done' % (runlog, max(1, maxconcurrency))
+            commands = ['echo + >> %s; %s; echo - >> %s; echo done %d' % \
+                    (runlog, barrier, runlog, n) for n in range(4)]
+            pg.addinputprocesses(commands, maxconcurrency=maxconcurrency)
+            captures = sorted(pg.getcaptures()['done %{INT:n}'])
+            self.assertEqual(captures, [(c, '%d' % n) for (n, c) in enumerate(commands)])
+
+            (running, maxrunning) = (0, 0)
+            with open(runlog) as f:
+                for mark in f.read().split():
+                    running += 1 if mark == '+' else -1
+                    maxrunning = max(running, maxrunning)
+            self.assertEqual(running, 0)
+            return maxrunning
+
+        self.assertEqual(run(4), 4)
+        self.assertEqual(run(2), 2)
+        self.assertEqual(run(1), 1)
+        # processes run one at a time instead of never
+        self.assertEqual(run(0), 1)
 
     def test_program_inputprocess_pingcommand(self):
 
@@ -268,6 +370,7 @@ class TestPatterns(unittest.TestCase):
         pg = lpc.Program(name='Ping Google', matchconfigs=[mc])
         command ='ping -c 1 www.google.ca'
         pg.addinputprocess(command=command)
+        pg.close()
 
     def test_program_log_stats(self):
 
@@ -295,6 +398,1132 @@ class TestPatterns(unittest.TestCase):
                                 len(logs))
         print 'Total Failures: %d/%d' % (len(captures.get('%{COALITION_JOB_FAILURE}')),
                                 len(logs))
+        pg.close()
+
+class TestPatternLibrary(unittest.TestCase):
+
+    def setUp(self):
+        self.patternsdir = tempfile.mkdtemp()
+        self.patternsfile = os.path.join(self.patternsdir, 'test.patterns')
+        with open(self.patternsfile, 'w') as f:
+            f.write('GREETING hello\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.patternsdir)
+
+    def test_shared_library(self):
+        g1 = lpc.Grok()
+        g2 = lpc.Grok()
+        self.assertIs(g1.library, g2.library)
+        self.assertIs(g1.library, lpc.getpatternlibrary())
+
+    def test_library_reload_on_change(self):
+        library = lpc.getpatternlibrary(self.patternsdir)
+        self.assertIs(library, lpc.getpatternlibrary(self.patternsdir))
+        self.assertEqual(library.get('GREETING').regexp, 'hello')
+
+        with open(self.patternsfile, 'w') as f:
+            f.write('GREETING bonjour\n')
+        os.utime(self.patternsfile, (0, 0))
+
+        reloaded = lpc.getpatternlibrary(self.patternsdir)
+        self.assertIsNot(library, reloaded)
+        self.assertNotEqual(library.version, reloaded.version)
+        self.assertEqual(reloaded.get('GREETING').regexp, 'bonjour')
+
+    def test_library_dependencies(self):
+        library = lpc.getpatternlibrary()
+        dependencies = library.getdependencies('URIHOST')
+        self.assertIn('IPORHOST', dependencies)
+        self.assertIn('IPV6', dependencies)
+        self.assertIn('POSINT', dependencies)
+        self.assertEqual(library.getdependencies('WORD'), [])
+
+        g = lpc.Grok()
+        g.compile('%{URIHOST} %{WORD}')
+        self.assertIn('IPV6', g.getdependencies())
+        self.assertIn('WORD', g.getdependencies())
+
+    def test_cyclic_and_undefined_patterns(self):
+        with open(self.patternsfile, 'w') as f:
+            f.write('LOOPA foo%{LOOPB}\nLOOPB bar%{LOOPA}\nBROKEN %{UNDEFINED}\n')
+        library = lpc.getpatternlibrary(self.patternsdir)
+
+        with self.assertRaisesRegexp(ValueError, 'LOOPA -> LOOPB -> LOOPA'):
+            library.expand('LOOPA')
+        with self.assertRaisesRegexp(ValueError, 'UNDEFINED referenced by BROKEN'):
+            library.expand('BROKEN')
+
+        g = lpc.Grok()
+        g.addpattern('SELF', 'a%{SELF}')
+        with self.assertRaisesRegexp(ValueError, 'Cyclic'):
+            g.compile('%{SELF}')
+
+    def test_local_pattern_overrides_library(self):
+        g = lpc.Grok()
+        g.addpattern('BASE10NUM', 'forty-two')
+        g.compile('^%{NUMBER:value}$')
+        self.assertIsNone(g.match('42'))
+        self.assertEqual(g.match('forty-two').group('value'), 'forty-two')
+
+    def test_local_patterns_not_shared(self):
+        g1 = lpc.Grok()
+        g1.addpattern('LOCALONLY', 'foo')
+        g1.compile('^%{WORD=~/^hello/}')
+        g2 = lpc.Grok()
+        self.assertIsNone(g2.getpattern('LOCALONLY'))
+        self.assertIsNone(g2.getpattern('WORD').predicate)
+
+class TestPrefilter(unittest.TestCase):
+
+    def test_required_literals(self):
+        self.assertEqual(lpc.requiredliterals('EXIT : (1|22|3)'), [('EXIT : ',)])
+        self.assertEqual(lpc.requiredliterals('a{2}bc(?:xy)?z'), [('bc',)])
+        self.assertEqual(lpc.requiredliterals('(?:foo|bar)\\d+'), [('bar', 'foo')])
+        self.assertEqual(lpc.requiredliterals('(?:KeyError: |NameError: )'), [('Error: ',)])
+        self.assertEqual(lpc.requiredliterals('(?:foo|\\d)'), [])
+        self.assertEqual(lpc.requiredliterals('(?i)hello'), [])
+        self.assertEqual(lpc.requiredliterals('ab\\x41cd'), [('ab',), ('cd',)])
+
+    def test_prefilter_rejects(self):
+        grok = lpc.Grok()
+        grok.compile('%{COALITION_JOB_EXITCODE}')
+        self.assertEqual(grok.prefilter, (('EXIT : ',),))
+
+        self.assertIsNone(grok.match('REZ_USED_RESOLVE=onmaya-2017.0.11'))
+        self.assertEqual(grok.nbrejected, 1)
+        self.assertEqual(grok.nbsearched, 0)
+
+        self.assertIsNotNone(grok.match('* EXIT : 1'))
+        self.assertEqual(grok.nbsearched, 1)
+
+    def test_prefilter_alternation(self):
+        grok = lpc.Grok()
+        grok.compile('%{PYTHON_ERROR}')
+        self.assertIsNotNone(grok.match("KeyError: 'foo'"))
+        self.assertIsNone(grok.match("Warning: 'foo'"))
+        self.assertEqual(grok.nbrejected, 1)
+
+    def test_prefilter_predicates(self):
+        grok = lpc.Grok()
+        grok.compile('%{REZ_USED_RESOLVE =~ /dispatcher-dev/}')
+        self.assertIn(('dispatcher-dev',), grok.prefilter)
+        self.assertIsNone(grok.match('REZ_USED_RESOLVE=onmaya-2017.0.11'))
+        self.assertEqual(grok.nbrejected, 1)
+        self.assertIsNotNone(grok.match('REZ_USED_RESOLVE=dispatcher-dev-1.0'))
+
+        grok.compile('%{REZ_PACKAGE_VERSION $== REZ_ONMAYAUTILS_VERSION=0.1.126}')
+        self.assertIn(('REZ_ONMAYAUTILS_VERSION=0.1.126',), grok.prefilter)
+        self.assertIsNotNone(grok.match('REZ_ONMAYAUTILS_VERSION=0.1.126'))
+
+        # negative predicates do not require literals
+        grok.compile('%{REZ_USED_RESOLVE !~ /dispatcher-dev/}')
+        self.assertNotIn(('dispatcher-dev',), grok.prefilter)
+
+class TestLiteralDispatcher(unittest.TestCase):
+
+    def setUp(self):
+        (fd, self.logfile) = tempfile.mkstemp(suffix='.log')
+        with os.fdopen(fd, 'w') as f:
+            f.write('* WORKER : canwork140-1\n')
+            f.write('* EXIT : 1\n')
+            f.write('KeyError: foo\n')
+
+    def tearDown(self):
+        os.remove(self.logfile)
+
+    def test_candidates(self):
+        groks = []
+        for pattern in ['%{COALITION_JOB_EXITCODE}', '%{WORD}', 'EXIT : %{NUMBER}', '%{PYTHON_ERROR}']:
+            grok = lpc.Grok()
+            grok.compile(pattern)
+            groks.append(grok)
+
+        dispatcher = lpc.LiteralDispatcher(groks)
+        self.assertEqual(dispatcher.candidates('* EXIT : 1'), [0, 1, 2])
+        self.assertEqual(dispatcher.candidates('KeyError: foo'), [1, 3])
+        self.assertEqual(dispatcher.candidates('nothing'), [1])
+        self.assertEqual(dispatcher.getrejected(0), 2)
+        self.assertEqual(dispatcher.getrejected(1), 0)
+
+    def test_breakifmatch_order(self):
+        mcexit = lpc.MatchConfig(patterns=['EXIT : %{NUMBER}'],
+                breakifmatch=True, noaction=True)
+        mcword = lpc.MatchConfig(patterns=['%{WORD}'], noaction=True)
+
+        pg = lpc.Program(matchconfigs=[mcexit, mcword])
+        pg.addinputfile(self.logfile)
+        captures = pg.getcaptures()
+        self.assertEqual(len(captures['EXIT : %{NUMBER}']), 1)
+        # EXIT line stops at first matchconfig
+        self.assertEqual(len(captures['%{WORD}']), 2)
+
+        stats = pg.getstats()
+        self.assertEqual(stats['EXIT : %{NUMBER}'], {'searched' : 1, 'rejected' : 2})
+
+    def test_combined_engine(self):
+        def run(engine, patterns):
+            mcs = [lpc.MatchConfig(patterns=[pattern], noaction=True) \
+                for pattern in patterns]
+            pg = lpc.Program(matchconfigs=mcs, engine=engine)
+            pg.addinputfile(self.logfile)
+            return pg
+
+        patterns = ['EXIT : %{NUMBER}', '%{WORD}', '%{PYTHON_ERROR}']
+        loop = run('loop', patterns)
+        combined = run('combined', patterns)
+        self.assertEqual(combined.engine, 'combined')
+        self.assertEqual(combined.getcaptures(), loop.getcaptures())
+
+        # inline flags can not be combined
+        self.assertEqual(run('combined', ['(?i)exit']).engine, 'loop')
+        self.assertRaises(ValueError, run, 'unknown', patterns)
+
+    def test_combined_dispatch(self):
+        def run(engine, patterns):
+            mcs = [lpc.MatchConfig(patterns=[pattern], noaction=True,
+                breakifmatch=True) for pattern in patterns]
+            pg = lpc.Program(matchconfigs=mcs, engine=engine)
+            pg.addinputfile(self.logfile)
+            return pg
+
+        # a first pattern matching further than the leftmost branch
+        # match takes the line
+        patterns = ['%{NUMBER:n}', '%{WORD:w}', 'KeyError', '(%{WORD})']
+        loop = run('loop', patterns)
+        combined = run('combined', patterns)
+        self.assertEqual(combined.engine, 'combined')
+        self.assertEqual(combined.getcaptures(), loop.getcaptures())
+        self.assertEqual(len(combined.getcaptures()['%{NUMBER:n}']), 2)
+
+        self.assertEqual(lpc.uncapturegroups(r'(?P<n>\d+)(a|\(b)[(]'),
+            r'(?:\d+)(?:a|\(b)[(]')
+
+    def test_buffer_engine(self):
+        def run(engine, patterns):
+            mcs = [lpc.MatchConfig(patterns=[pattern], noaction=True) \
+                for pattern in patterns]
+            pg = lpc.Program(matchconfigs=mcs, engine=engine)
+            pg.addinputfile(self.logfile)
+            return pg
+
+        patterns = ['^\* EXIT : %{NUMBER}$', '%{WORD}$', '%{PYTHON_ERROR}', '%{DATA}']
+        loop = run('loop', patterns)
+        buffered = run('buffer', patterns)
+        self.assertEqual(buffered.engine, 'buffer')
+        self.assertEqual(buffered.getcaptures(), loop.getcaptures())
+
+        # input anchors can not be scanned over a whole buffer
+        self.assertEqual(run('buffer', ['\\AKeyError']).engine, 'loop')
+
+    def test_newline_index(self):
+        index = lpc.NewlineIndex(b'ab\n\ncd\nef')
+        self.assertEqual(index.getline(0), (1, 0, 2))
+        self.assertEqual(index.getline(3), (2, 3, 3))
+        self.assertEqual(index.getline(5), (3, 4, 6))
+        self.assertEqual(index.getline(9), (4, 7, 9))
+        self.assertEqual(index.getline(1), (1, 0, 2))
+        self.assertEqual(index.getbounds(6), (4, 6))
+
+        # newlines indexed by blocks
+        blocksize = lpc.DEFAULT_BLOCKSIZE
+        self.addCleanup(setattr, lpc, 'DEFAULT_BLOCKSIZE', blocksize)
+        lpc.DEFAULT_BLOCKSIZE = 3
+        index = lpc.NewlineIndex(b'ab\n\ncd\nef')
+        self.assertEqual([index.getline(offset) for offset in (0, 3, 5, 9)],
+                [(1, 0, 2), (2, 3, 3), (3, 4, 6), (4, 7, 9)])
+        self.assertEqual(lpc.NewlineIndex(b'').getline(0), (1, 0, 0))
+
+class TestRecords(unittest.TestCase):
+
+    def setUp(self):
+        logdir = os.path.abspath(os.path.join(
+            os.path.dirname(__file__), '../logs'))
+        self.logs = sorted([ os.path.join(logdir, f) for f in os.listdir(logdir) \
+                if f.endswith('.log')])
+
+    def grok(self, pattern):
+        g = lpc.Grok()
+        g.compile(pattern)
+        return g
+
+    def test_assembler(self):
+        assembler = lpc.RecordAssembler(self.grok('^BEGIN'),
+                continuation=self.grok('^ '), maxlines=3)
+        records = [assembler.add(line) for line in
+                ['x', 'BEGIN 1', ' a', 'y', 'BEGIN 2', 'BEGIN 3', ' b', ' c', ' d']]
+        self.assertEqual(records, [[], [], [], ['BEGIN 1\n a'], [], ['BEGIN 2'],
+                [], ['BEGIN 3\n b\n c'], []])
+        self.assertIsNone(assembler.flush())
+
+        assembler = lpc.RecordAssembler(self.grok('^BEGIN'), end=self.grok('^END'))
+        records = [assembler.add(line) for line in ['BEGIN', 'a', 'END', 'b', 'BEGIN']]
+        self.assertEqual(records, [[], [], ['BEGIN\na\nEND'], [], []])
+        self.assertEqual(assembler.flush(), 'BEGIN')
+
+    def test_record_timeout(self):
+        assembler = lpc.RecordAssembler(self.grok('^BEGIN'), timeout=0)
+        self.assertIsNone(assembler.expire())
+        self.assertEqual(assembler.add('BEGIN'), [])
+        self.assertEqual(assembler.expire(), 'BEGIN')
+        self.assertIsNone(assembler.flush())
+
+        # a timed out record of an idle input is matched
+        # before the next line
+        (rfd, wfd) = os.pipe()
+        stream = os.fdopen(rfd, 'rb')
+        self.addCleanup(stream.close)
+
+        mc = lpc.MatchConfig(['^BEGIN\n%{WORD:word}$'], noaction=True,
+                record={'start' : '^BEGIN', 'timeout' : 0.1})
+        pg = lpc.Program(matchconfigs=[mc], captureformat='%{word}')
+        idle = []
+        def write():
+            os.write(wfd, b'BEGIN\nidle\n')
+            deadline = time.time() + 5
+            while not pg.getcaptures() and time.time() < deadline:
+                time.sleep(0.05)
+            idle.extend(pg.getcaptures().get(mc.patterns[0], []))
+            os.write(wfd, b'BEGIN\nend\n')
+            os.close(wfd)
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        pg.addinputstdin(stream)
+        writer.join()
+        self.assertEqual(idle, [('-', 'idle')])
+        self.assertEqual(pg.getcaptures()[mc.patterns[0]], [('-', 'idle'), ('-', 'end')])
+
+    def test_record_config(self):
+        self.assertRaises(ValueError, lpc.MatchConfig, ['a'], record={'end' : 'b'})
+        self.assertRaises(ValueError, lpc.MatchConfig, ['a'], record={'start' : 'a', 'stop' : 'b'})
+
+        # line anchors match at every record line
+        mc = lpc.MatchConfig(['^b$'], record={'start' : 'a'})
+        self.assertIsNotNone(mc.expandpatterns[0].match('a\nb'))
+        self.assertIsNone(lpc.MatchConfig(['^b$']).expandpatterns[0].match('a\nb'))
+
+    def test_program_records(self):
+        tracebacks = lpc.MatchConfig(['%{PYTHON_TRACEBACK_ERROR}\n%{PYTHON_ERROR}'],
+                noaction=True, record={'start' : '^Traceback', 'end' : '%{PYTHON_ERROR}'})
+        jobs = lpc.MatchConfig(['^\\* EXIT : %{NUMBER:exit}$'], noaction=True,
+                record={'start' : '%{COALITION_JOB_START}', 'end' : '^END \\*+'})
+        lines = lpc.MatchConfig(['%{PYTHON_ERROR}'], noaction=True)
+
+        for engine in lpc.ENGINES:
+            pg = lpc.Program(matchconfigs=[tracebacks, jobs, lines], engine=engine)
+            for log in self.logs:
+                pg.addinputfile(log)
+
+            captures = pg.getcaptures()
+            self.assertEqual(len(captures[jobs.patterns[0]]), len(self.logs))
+            self.assertEqual(len(captures[lines.patterns[0]]), len(self.logs))
+            self.assertEqual(len(captures[tracebacks.patterns[0]]), len(self.logs))
+            for (inputname, capture) in captures[tracebacks.patterns[0]]:
+                self.assertIn('traceback_file', capture)
+                self.assertIn('python_error', capture)
+
+            # records are reassembled in worker processes
+            pg = lpc.Program.fromdict(pg.todict())
+            pg.addinputfiles(self.logs, jobs=2, splitsize=1)
+            self.assertEqual(pg.getcaptures(), captures)
+
+class TestActionExecutor(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.output = os.path.join(self.tmpdir, 'output')
+        logdir = os.path.abspath(os.path.join(
+            os.path.dirname(__file__), '../logs'))
+        self.logs = sorted([ os.path.join(logdir, f) for f in os.listdir(logdir) \
+                if f.endswith('.log')])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def command(self, script):
+        return ' '.join(quote(arg) for arg in [sys.executable, '-c',
+                'import sys\nf = open(sys.argv[1], "ab")\n' + script, self.output])
+
+    def read(self):
+        with open(self.output, 'rb') as f:
+            return f.read()
+
+    def test_stdin_batch(self):
+        executor = lpc.ActionExecutor(self.command('f.write(sys.stdin.read())'),
+                batchsize=2, delimiter='\0')
+        for action in ('a', 'b c', 'd'):
+            executor.send(action)
+        executor.close()
+        self.assertEqual(self.read(), 'a\0b c\0d\0')
+        self.assertEqual(executor.nbruns, 1)
+
+    def test_xargs_batch(self):
+        executor = lpc.ActionExecutor(self.command('f.write("|".join(sys.argv[2:]) + "\\n")'),
+                batch='xargs', batchsize=2)
+        for action in ('a', 'b c', 'd'):
+            executor.send(action)
+        executor.close()
+        self.assertEqual(self.read(), 'a|b c\nd\n')
+        self.assertEqual(executor.nbruns, 2)
+
+        self.assertRaises(ValueError, lpc.ActionExecutor, 'cat', batch='unknown')
+        self.assertRaises(ValueError, lpc.MatchConfig, ['a'], batch='stdin')
+
+    def test_batch_maxage(self):
+        executor = lpc.ActionExecutor(self.command('f.write("|".join(sys.argv[2:]) + "\\n")'),
+                batch='xargs', batchsize=50, maxage=None)
+        executor.send('a')
+        executor.expire()
+        self.assertEqual(executor.nbruns, 0)
+
+        executor = lpc.ActionExecutor(self.command('f.write("|".join(sys.argv[2:]) + "\\n")'),
+                batch='xargs', batchsize=50, maxage=0)
+        executor.expire()
+        self.assertEqual(executor.nbruns, 0)
+        executor.send('a')
+        executor.send('b')
+        self.assertEqual(executor.nbruns, 2)
+        executor.close()
+        self.assertEqual(self.read(), 'a\nb\n')
+
+    def test_program_batch_maxage(self):
+        # a batch which is not full runs while standard input is open
+        (rfd, wfd) = os.pipe()
+        stream = os.fdopen(rfd, 'rb')
+        self.addCleanup(stream.close)
+
+        mc = lpc.MatchConfig(['EXIT : %{NUMBER:exit}'], action='%{exit}',
+                shell=self.command('f.write("|".join(sys.argv[2:]) + "\\n")'),
+                batch='xargs', batchsize=50, batchmaxage=0.1)
+        flushed = []
+        def write():
+            os.write(wfd, b'* EXIT : 1\n* EXIT : 2\n')
+            deadline = time.time() + 5
+            while not os.path.exists(self.output) and time.time() < deadline:
+                time.sleep(0.05)
+            flushed.append(os.path.exists(self.output))
+            os.write(wfd, b'* EXIT : 3\n')
+            os.close(wfd)
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        with lpc.Program([mc]) as pg:
+            pg.addinputstdin(stream)
+        writer.join()
+        self.assertEqual(flushed, [True])
+        self.assertEqual(self.read(), '1|2\n3\n')
+
+    def test_program_batch(self):
+        mc = lpc.MatchConfig(['EXIT : %{NUMBER:exit}'], action='exit %{exit}',
+                shell=self.command('f.write(sys.stdin.read())'), batch='stdin')
+        with lpc.Program([mc], captureformat='%{exit}') as pg:
+            for log in self.logs:
+                pg.addinputfile(log)
+        self.assertEqual(self.read(), ''.join('exit %s\n' % capture for \
+                (inputname, capture) in pg.getcaptures()[mc.patterns[0]]))
+
+    def test_program_xargs_batch(self):
+        script = 'f.write("|".join(sys.argv[2:]) + "\\n")'
+        for jobs in (1, 2):
+            if os.path.exists(self.output):
+                os.remove(self.output)
+            mc = lpc.MatchConfig(['EXIT : %{NUMBER:exit}'], action='%{exit}',
+                    shell=self.command(script), batch='xargs', batchsize=50)
+            with lpc.Program([mc], captureformat='%{exit}') as pg:
+                pg.addinputfiles(self.logs, jobs=jobs)
+            runs = self.read().splitlines()
+            # batch spans the files of a process
+            self.assertGreaterEqual(len(runs), 1)
+            self.assertLessEqual(len(runs), jobs)
+            self.assertEqual(sorted('|'.join(runs).split('|')), sorted(capture \
+                    for (inputname, capture) in pg.getcaptures()[mc.patterns[0]]))
+            self.assertEqual(len(pg.getcaptures()[mc.patterns[0]]), len(self.logs))
+
+class TestActionQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.output = os.path.join(self.tmpdir, 'output')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_ordered_by_key(self):
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            queue = lpc.ActionQueue(workers=3, maxsize=6)
+            # later actions of a key end first
+            for i in range(5):
+                for key in ('a', 'b', 'c'):
+                    queue.put(key, 'sh -c "sleep 0.%d; echo %s %d"' % (4 - i, key, i))
+            self.assertEqual(queue.drain(), 0)
+            lines = sys.stdout.getvalue().splitlines()
+        finally:
+            sys.stdout = stdout
+        self.assertEqual(queue.nbruns, 15)
+
+        for key in ('a', 'b', 'c'):
+            self.assertEqual([line for line in lines if line.startswith(key)],
+                    ['%s %d' % (key, i) for i in range(5)])
+
+    def blockactions(self):
+        # action runs wait for the returned event, runs are
+        # listed with whether they were released
+        release = threading.Event()
+        self.started = threading.Event()
+        self.running = []
+        self.runs = []
+        def runaction(action):
+            self.started.set()
+            self.running.append(action)
+            self.runs.append((action, release.wait(5)))
+            return ''
+
+        self.addCleanup(setattr, lpc, 'runaction', lpc.runaction)
+        lpc.runaction = runaction
+        return release
+
+    def test_backpressure_and_timeout(self):
+        release = self.blockactions()
+        queue = lpc.ActionQueue(workers=1, maxsize=1)
+        queue.put('a', 'a')
+        self.assertTrue(self.started.wait(5))
+        queue.put('a', 'b')
+
+        # third action waits for the worker to take the second one
+        putter = threading.Thread(target=queue.put, args=('a', 'c'))
+        putter.start()
+        putter.join(0.1)
+        self.assertTrue(putter.is_alive())
+
+        self.assertEqual(queue.drain(timeout=0.1), 3)
+        self.assertEqual(queue.nbruns, 0)
+
+        release.set()
+        putter.join()
+        self.assertEqual(queue.drain(), 0)
+        self.assertEqual(self.runs, [('a', True), ('b', True), ('c', True)])
+
+    def test_parallel_key(self):
+        release = self.blockactions()
+        queue = lpc.ActionQueue(workers=4, maxsize=8)
+        for i in range(4):
+            queue.put('a', 'a %d' % i)
+
+        # actions of a single input run at once
+        deadline = time.time() + 5
+        while len(self.running) < 4 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(sorted(self.running), ['a %d' % i for i in range(4)])
+        release.set()
+        self.assertEqual(queue.drain(), 0)
+        self.assertEqual(sorted(self.runs), [('a %d' % i, True) for i in range(4)])
+
+    def test_program_actions(self):
+        with open(self.output, 'w') as f:
+            f.write('* EXIT : 1\n' * 3)
+
+        release = self.blockactions()
+        mc = lpc.MatchConfig(['EXIT : %{NUMBER:exit}'], shell='sleep', action='sleep 0.2')
+        pg = lpc.Program([mc], actionworkers=2)
+        # matching does not wait for actions
+        pg.addinputfile(self.output)
+        release.set()
+        self.assertEqual(pg.close(), 0)
+        self.assertEqual(self.runs, [('sleep 0.2', True)] * 3)
+
+        self.assertEqual(lpc.Program.fromdict(pg.todict()).signature,
+                lpc.Program([mc]).signature)
+
+class TestOutputSink(unittest.TestCase):
+
+    class Stream(object):
+
+        def __init__(self, tty=False):
+            self.tty = tty
+            self.writes = []
+
+        def isatty(self):
+            return self.tty
+
+        def write(self, data):
+            self.writes.append(data)
+
+        def flush(self):
+            pass
+
+    def test_buffered(self):
+        stream = self.Stream()
+        sink = lpc.OutputSink(stream, buffersize=10, flushinterval=None)
+        self.assertFalse(sink.linebuffered)
+        sink.write('abcd\n')
+        self.assertEqual(stream.writes, [])
+        sink.write('efghij\n')
+        self.assertEqual(stream.writes, ['abcd\nefghij\n'])
+        sink.write('k\n')
+        sink.close()
+        self.assertEqual(stream.writes, ['abcd\nefghij\n', 'k\n'])
+
+    def test_flush_interval(self):
+        def wait(writes):
+            deadline = time.time() + 5
+            while (len(stream.writes) < writes or threading.active_count() > nbthreads) \
+                    and time.time() < deadline:
+                time.sleep(0.01)
+
+        stream = self.Stream()
+        nbthreads = threading.active_count()
+        sink = lpc.OutputSink(stream, flushinterval=0.05)
+        sink.write('a\n')
+        # flusher stops once idle
+        wait(1)
+        self.assertEqual(stream.writes, ['a\n'])
+        self.assertEqual(threading.active_count(), nbthreads)
+
+        # and starts again with the next write
+        sink.write('b\n')
+        wait(2)
+        self.assertEqual(stream.writes, ['a\n', 'b\n'])
+        self.assertEqual(threading.active_count(), nbthreads)
+        sink.close()
+
+    def test_line_buffered(self):
+        for (stream, flushinterval) in ((self.Stream(tty=True), 1), (self.Stream(), 0)):
+            sink = lpc.OutputSink(stream, flushinterval=flushinterval)
+            self.assertTrue(sink.linebuffered)
+            sink.write('a\n')
+            sink.write('b\n')
+            self.assertEqual(stream.writes, ['a\n', 'b\n'])
+
+    def test_program_output(self):
+        stdout = sys.stdout
+        sys.stdout = self.Stream()
+        try:
+            mc = lpc.MatchConfig(['EXIT : %{NUMBER:exit}'], action='exit %{exit}')
+            with lpc.Program([mc]) as pg:
+                pg.addinputfile(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        '../logs/100171.log'))
+                # output is written at the end of input
+                self.assertEqual(sys.stdout.writes, ['exit 1\n'])
+        finally:
+            sys.stdout = stdout
+
+    def test_shared(self):
+        stream = self.Stream()
+        sink = lpc.OutputSink(stream, flushinterval=None, shared=True)
+        lines = ['%d %s\n' % (i, 'x' * (i % 100)) for i in range(1000)]
+        lines.append('y' * (lpc.PIPE_BUF * 2) + '\n')
+        for line in lines:
+            sink.write(line)
+        sink.close()
+        # writes are whole lines, of at most PIPE_BUF bytes but long lines
+        self.assertEqual(''.join(stream.writes), ''.join(lines))
+        for data in stream.writes:
+            self.assertTrue(data.endswith('\n'))
+            self.assertTrue(len(data) <= lpc.PIPE_BUF or data.count('\n') == 1)
+
+    def test_workers_output(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        logs = []
+        for n in range(4):
+            logs.append(os.path.join(tmpdir, '%d.log' % n))
+            with open(logs[-1], 'w') as f:
+                for i in range(20000):
+                    f.write('line %d %d %s\n' % (n, i, 'x' * (i % 200)))
+
+        # workers write stdout actions output to a single pipe
+        script = '\n'.join(['import sys',
+                'from logparser import core as lpc',
+                'mc = lpc.MatchConfig(["^line"], action="%{@LINE}")',
+                'with lpc.Program([mc], flushinterval=None) as pg:',
+                '    pg.addinputfiles(sys.argv[1:], jobs=2)'])
+        env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(
+                os.path.abspath(lpc.__file__))))
+        proc = subprocess.Popen([sys.executable, '-c', script] + logs,
+                stdout=subprocess.PIPE, env=env)
+        (output, error) = proc.communicate()
+        self.assertEqual(proc.returncode, 0)
+
+        lines = output.splitlines()
+        self.assertEqual(len(lines), 4 * 20000)
+        for line in lines:
+            fields = line.split(' ')
+            self.assertEqual(len(fields), 4, line)
+            self.assertEqual(fields[3], 'x' * (int(fields[2]) % 200))
+
+class TestDiscoverInputs(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        for (relpath, size, age) in [('a.log', 10, 0),
+                                     ('b.txt', 100, 0),
+                                     ('2017-04-07/job1/render.log', 1000, 0),
+                                     ('2017-04-07/job1/render.log.gz', 10, 0),
+                                     ('2017-04-07/job2/render.log', 10, 7200),
+                                     ('tmp/c.log', 10, 0)]:
+            path = os.path.join(self.tmpdir, relpath)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'w') as f:
+                f.write('x' * size)
+            mtime = time.time() - age
+            os.utime(path, (mtime, mtime))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def discover(self, **options):
+        return [os.path.relpath(path, self.tmpdir) for path in \
+                lpc.discoverinputs(self.tmpdir, **options)]
+
+    def test_discover(self):
+        self.assertEqual(self.discover(), ['a.log', 'b.txt'])
+        self.assertEqual(self.discover(recursive=True),
+                ['2017-04-07/job1/render.log', '2017-04-07/job1/render.log.gz',
+                 '2017-04-07/job2/render.log', 'a.log', 'b.txt', 'tmp/c.log'])
+
+    def test_discover_filters(self):
+        self.assertEqual(self.discover(recursive=True, include=['*.log'], exclude=['tmp']),
+                ['2017-04-07/job1/render.log', '2017-04-07/job2/render.log', 'a.log'])
+        self.assertEqual(self.discover(recursive=True, include=['*/job2/*']),
+                ['2017-04-07/job2/render.log'])
+        self.assertEqual(self.discover(recursive=True, minsize=100, maxsize=500), ['b.txt'])
+        self.assertEqual(self.discover(recursive=True, maxmtime=time.time() - 3600),
+                ['2017-04-07/job2/render.log'])
+
+    def test_discover_listdir(self):
+        scandir = lpc.scandir
+        lpc.scandir = None
+        try:
+            self.assertEqual(self.discover(recursive=True, include=['*.log'], minsize=20),
+                    ['2017-04-07/job1/render.log'])
+        finally:
+            lpc.scandir = scandir
+
+        # a single lstat of entries which are not symlinks
+        entry = lpc.DirEntry(self.tmpdir, 'a.log')
+        self.assertFalse(entry.is_dir(follow_symlinks=False))
+        self.assertTrue(entry.is_file())
+        self.assertIs(entry.stat(), entry.stat(follow_symlinks=False))
+
+        os.symlink(os.path.join(self.tmpdir, 'a.log'), os.path.join(self.tmpdir, 'link'))
+        entry = lpc.DirEntry(self.tmpdir, 'link')
+        self.assertFalse(entry.is_file(follow_symlinks=False))
+        self.assertTrue(entry.is_file())
+        self.assertEqual(entry.stat().st_size, 10)
+
+def gzcompress(data):
+    buf = StringIO()
+    gz = gzip.GzipFile(fileobj=buf, mode='wb')
+    gz.write(data)
+    gz.close()
+    return buf.getvalue()
+
+class TestInputFile(unittest.TestCase):
+
+    def setUp(self):
+        (fd, self.logfile) = tempfile.mkstemp(suffix='.log')
+        with os.fdopen(fd, 'w') as f:
+            f.write('* WORKER : canwork140-1\n\n* EXIT : 1\nKeyError: foo')
+
+    def tearDown(self):
+        os.remove(self.logfile)
+
+    def readlines(self, **kwargs):
+        inputfile = lpc.InputProgramFile(self.logfile, **kwargs)
+        lines = []
+        inputfile.run(lambda i, line : lines.append(line), lambda i : None)
+        return (inputfile, lines)
+
+    def test_block_reader(self):
+        (inputfile, expected) = self.readlines(reader='mmap')
+        self.assertEqual(expected, ['* WORKER : canwork140-1', '',
+                '* EXIT : 1', 'KeyError: foo'])
+
+        # lines spanning blocks
+        for blocksize in (1, 5, 1024):
+            (inputfile, lines) = self.readlines(blocksize=blocksize)
+            self.assertEqual(lines, expected)
+            self.assertEqual(inputfile.nblines, 4)
+            self.assertEqual(inputfile.nbbytes, os.path.getsize(self.logfile))
+
+        self.assertRaises(ValueError, lpc.InputProgramFile, self.logfile, reader='unknown')
+
+    def test_compressed_files(self):
+        with open(self.logfile, 'rb') as f:
+            data = f.read()
+
+        (inputfile, expected) = self.readlines()
+
+        gzpath = self.logfile + '.gz'
+        # concatenated gzip members
+        with open(gzpath, 'wb') as f:
+            for part in (data[:10], data[10:]):
+                gz = gzip.GzipFile(fileobj=f, mode='wb')
+                gz.write(part)
+                gz.close()
+        self.addCleanup(os.remove, gzpath)
+
+        bz2path = self.logfile + '.bz2'
+        with open(bz2path, 'wb') as f:
+            f.write(bz2.compress(data))
+        self.addCleanup(os.remove, bz2path)
+
+        for (path, compression) in ((gzpath, 'gzip'), (bz2path, 'bz2')):
+            self.assertEqual(lpc.getcompression(path), compression)
+            for blocksize in (1, 1024):
+                inputfile = lpc.InputProgramCompressedFile(path, blocksize=blocksize)
+                lines = []
+                inputfile.run(lambda i, line : lines.append(line), lambda i : None)
+                self.assertEqual(lines, expected)
+
+        self.assertIsNone(lpc.getcompression(self.logfile))
+
+        # concatenated streams ending on a block boundary
+        for (compress, ext) in ((bz2.compress, '.bz2'), (gzcompress, '.gz')):
+            first = compress(data[:10])
+            path = self.logfile + '.2' + ext
+            with open(path, 'wb') as f:
+                f.write(first + compress(data[10:]))
+            self.addCleanup(os.remove, path)
+
+            inputfile = lpc.InputProgramCompressedFile(path, blocksize=len(first))
+            lines = []
+            inputfile.run(lambda i, line : lines.append(line), lambda i : None)
+            self.assertEqual(lines, expected)
+
+        mc = lpc.MatchConfig(patterns=['EXIT : %{NUMBER:exit}'], noaction=True)
+        pg = lpc.Program(matchconfigs=[mc], engine='buffer')
+        pg.addinputfile(gzpath)
+        self.assertEqual(len(pg.getcaptures()['EXIT : %{NUMBER:exit}']), 1)
+
+    def test_compressed_output_limit(self):
+        # highly compressed streams are decompressed by bounded blocks
+        data = b'* EXIT : 1\n' * (512 * 1024)
+        blocksize = 64 * 1024
+        for (compress, ext) in ((bz2.compress, '.bz2'), (gzcompress, '.gz')):
+            path = self.logfile + ext
+            with open(path, 'wb') as f:
+                f.write(compress(data) + compress(data))
+            self.addCleanup(os.remove, path)
+
+            inputfile = lpc.InputProgramCompressedFile(path, blocksize=blocksize)
+            with open(path, 'rb') as f:
+                blocks = list(inputfile._decompressblocks(f))
+            self.assertEqual(b''.join(blocks), data + data)
+            if ext == '.gz' :
+                self.assertLessEqual(max(len(block) for block in blocks), blocksize)
+
+            lines = []
+            inputfile.run(lambda i, line : lines.append(line), lambda i : None)
+            self.assertEqual(len(lines), 2 * 512 * 1024)
+
+    def test_follow_file(self):
+        def write(path, data, mode='a'):
+            with open(path, mode) as f:
+                f.write(data)
+            time.sleep(0.2)
+
+        write(self.logfile, 'a\n', 'w')
+        self.addCleanup(os.remove, self.logfile + '.1')
+
+        inputfile = lpc.InputProgramFollowFile(self.logfile,
+                mindelay=0.01, maxdelay=0.05, timeout=1)
+        lines = []
+        follower = threading.Thread(target=inputfile.run,
+                args=(lambda i, line : lines.append(line), lambda i : None))
+        follower.start()
+
+        write(self.logfile, 'b\npart')
+        write(self.logfile, 'ial\n')
+        # rotation
+        os.rename(self.logfile, self.logfile + '.1')
+        write(self.logfile, 'c\n', 'w')
+        # truncation
+        write(self.logfile, '', 'w')
+        write(self.logfile, 'd\ne')
+        follower.join()
+
+        self.assertEqual(lines, ['a', 'b', 'partial', 'c', 'd'])
+        # partial last line is left for next run
+        self.assertEqual(inputfile.offset, 2)
+
+    def test_stdin(self):
+        (rfd, wfd) = os.pipe()
+        stream = os.fdopen(rfd, 'rb')
+        self.addCleanup(stream.close)
+
+        lines = []
+        received = threading.Event()
+        def match(inputstdin, line):
+            lines.append(line)
+            received.set()
+
+        def write():
+            os.write(wfd, b'* EXIT : 1\npart')
+            # lines are matched before the end of stream
+            received.wait(5)
+            os.write(wfd, b'ial\n* EXIT : 2')
+            os.close(wfd)
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        inputstdin = lpc.InputProgramStdin(stream)
+        inputstdin.run(match, lambda i : None)
+        writer.join()
+
+        self.assertTrue(received.is_set())
+        self.assertEqual(lines, ['* EXIT : 1', 'partial', '* EXIT : 2'])
+        self.assertEqual(inputstdin.nblines, 3)
+        self.assertEqual(inputstdin.inputname, '-')
+
+    def test_program_stdin(self):
+        with open(self.logfile, 'rb') as stream:
+            mc = lpc.MatchConfig(patterns=['EXIT : %{NUMBER:exit}'], noaction=True)
+            pg = lpc.Program(matchconfigs=[mc])
+            pg.addinputstdin(stream)
+        self.assertEqual([inputname for (inputname, capture) in \
+                pg.getcaptures()['EXIT : %{NUMBER:exit}']], ['-'])
+        self.assertEqual(pg.getinputstats()['-']['lines'], 4)
+
+class TestCheckpoints(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.logfile = os.path.join(self.tmpdir, 'job.log')
+        self.storepath = os.path.join(self.tmpdir, 'checkpoints.json')
+        with open(self.logfile, 'w') as f:
+            f.write('* EXIT : 1\nKeyError: foo\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def run_program(self, pattern='EXIT : %{NUMBER:exit}', jobs=1, **options):
+        store = lpc.CheckpointStore(self.storepath)
+        mc = lpc.MatchConfig(patterns=[pattern], noaction=True)
+        pg = lpc.Program(matchconfigs=[mc], captureformat='%{@LINE}', **options)
+        pg.addinputfiles([self.logfile], jobs=jobs, checkpoints=store)
+        store.save()
+        captures = [c for (i, c) in pg.getcaptures().get(pattern, [])]
+        return (captures, pg.getinputstats()[self.logfile]['lines'])
+
+    def test_skip_and_resume(self):
+        self.assertEqual(self.run_program(), (['* EXIT : 1'], 2))
+
+        # unchanged file is not read
+        self.assertEqual(self.run_program(), (['* EXIT : 1'], 0))
+
+        # appended lines only are read
+        with open(self.logfile, 'a') as f:
+            f.write('* EXIT : 2\n')
+        self.assertEqual(self.run_program(), (['* EXIT : 1', '* EXIT : 2'], 1))
+        self.assertEqual(self.run_program(), (['* EXIT : 1', '* EXIT : 2'], 0))
+
+        # other program reads whole file
+        self.assertEqual(self.run_program('%{PYTHON_ERROR}'), (['KeyError: foo'], 3))
+
+        # rewritten file is read again
+        with open(self.logfile, 'w') as f:
+            f.write('* EXIT : 3\n')
+        self.assertEqual(self.run_program(), (['* EXIT : 3'], 1))
+
+    def test_resume_partial_line(self):
+        for (engine, reader, jobs) in ((lpc.ENGINE_LOOP, lpc.READER_BLOCK, 1),
+                (lpc.ENGINE_LOOP, lpc.READER_MMAP, 1), (lpc.ENGINE_BUFFER, lpc.READER_BLOCK, 1),
+                (lpc.ENGINE_LOOP, lpc.READER_BLOCK, 2)):
+            options = {'engine' : engine, 'reader' : reader, 'jobs' : jobs}
+            if os.path.exists(self.storepath):
+                os.remove(self.storepath)
+            with open(self.logfile, 'w') as f:
+                f.write('* EXIT : 1\n* EXIT : 2')
+            (captures, lines) = self.run_program(**options)
+            self.assertEqual(captures, ['* EXIT : 1', '* EXIT : 2'])
+
+            # the matched partial line is not matched again once complete
+            with open(self.logfile, 'a') as f:
+                f.write('\n* EXIT : 3\n* EXIT : 12')
+            (captures, lines) = self.run_program(**options)
+            self.assertEqual(captures, ['* EXIT : 1', '* EXIT : 2', '* EXIT : 3',
+                    '* EXIT : 12'])
+
+            # nor while it is unchanged
+            os.utime(self.logfile, (1000, 1000))
+            (captures, lines) = self.run_program(**options)
+            self.assertEqual(captures, ['* EXIT : 1', '* EXIT : 2', '* EXIT : 3',
+                    '* EXIT : 12'])
+
+            # a partial line written on is read again
+            with open(self.logfile, 'a') as f:
+                f.write('345\n* EXIT : 6\n')
+            (captures, lines) = self.run_program(**options)
+            self.assertEqual(captures, ['* EXIT : 1', '* EXIT : 2', '* EXIT : 3',
+                    '* EXIT : 12', '* EXIT : 12345', '* EXIT : 6'])
+
+class TestParallelFiles(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.logfiles = []
+        for n in range(6):
+            logfile = os.path.join(self.tmpdir, '%d.log' % n)
+            with open(logfile, 'w') as f:
+                for i in range(n * 50):
+                    f.write('* EXIT : %d\nKeyError: foo%d\n' % (i, n))
+            self.logfiles.append(logfile)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def run_program(self, jobs, checkpoints=None, reader=lpc.READER_BLOCK, **options):
+        mcs = [lpc.MatchConfig(patterns=['EXIT : %{NUMBER:exit}'], noaction=True),
+               lpc.MatchConfig(patterns=['%{PYTHON_ERROR}'], noaction=True,
+                   nomatch=True)]
+        pg = lpc.Program(matchconfigs=mcs, reader=reader)
+        merged = []
+        pg.addinputfiles(self.logfiles, jobs=jobs, checkpoints=checkpoints,
+                callback=lambda index, logfile : merged.append(index), **options)
+        self.assertEqual(merged, range(len(self.logfiles)))
+        return pg
+
+    def test_jobs_merge(self):
+        expected = self.run_program(1)
+        pg = self.run_program(3)
+        self.assertEqual(pg.getcaptures(), expected.getcaptures())
+        self.assertEqual(pg.nbinputs(), len(self.logfiles))
+        self.assertEqual([s['lines'] for (f, s) in sorted(pg.getinputstats().items())],
+                [n * 100 for n in range(6)])
+
+    def test_jobs_checkpoints(self):
+        store = lpc.CheckpointStore(os.path.join(self.tmpdir, 'checkpoints.json'))
+        self.run_program(3, store)
+
+        with open(self.logfiles[2], 'a') as f:
+            f.write('* EXIT : 1000\n')
+        expected = self.run_program(1).getcaptures()
+
+        pg = self.run_program(3, store)
+        self.assertEqual(pg.getcaptures(), expected)
+        self.assertEqual(pg.getinputstats()[self.logfiles[2]]['lines'], 1)
+
+    def test_split_ranges(self):
+        logfile = self.logfiles[5]
+        size = os.path.getsize(logfile)
+        ranges = lpc.splitinputfile(logfile, 0, size, 1000)
+        self.assertGreater(len(ranges), 1)
+        self.assertEqual(ranges[0][0], 0)
+        self.assertEqual(ranges[-1][1], size)
+
+        with open(logfile, 'rb') as f:
+            data = f.read()
+        for ((start, end), (nextstart, nextend)) in zip(ranges, ranges[1:]):
+            self.assertEqual(end, nextstart)
+            self.assertEqual(data[end-1], '\n')
+
+    def test_jobs_split(self):
+        # no hit, no-match runs once for the whole file
+        nomatchfile = os.path.join(self.tmpdir, 'nomatch.log')
+        with open(nomatchfile, 'w') as f:
+            for i in range(300):
+                f.write('* STEP : %d\n' % i)
+        self.logfiles.append(nomatchfile)
+
+        expected = self.run_program(1)
+        for reader in lpc.READERS:
+            store = lpc.CheckpointStore(os.path.join(self.tmpdir, '%s.json' % reader))
+            pg = self.run_program(3, store, reader=reader, splitsize=500)
+            self.assertEqual(pg.getcaptures(), expected.getcaptures())
+            self.assertEqual([(s['lines'], s['bytes']) for (f, s) in sorted(pg.getinputstats().items())],
+                    [(s['lines'], s['bytes']) for (f, s) in sorted(expected.getinputstats().items())])
+            self.assertEqual(store.get(nomatchfile)['nbmatches'], 1)
+            self.assertEqual(store.get(nomatchfile)['offset'], os.path.getsize(nomatchfile))
+
+class TestGrokCache(unittest.TestCase):
+
+    def test_compile_cache_hit(self):
+        g1 = lpc.Grok()
+        g1.compile('^%{NUMBER>10} cachetest$')
+        hits = lpc.GROK_CACHE.hits
+
+        g2 = lpc.Grok()
+        g2.compile('^%{NUMBER>10} cachetest$')
+        self.assertEqual(lpc.GROK_CACHE.hits, hits + 1)
+        self.assertIs(g1.expandpattern, g2.expandpattern)
+
+        # predicates table is restored from cache
+        self.assertIsNone(g2.match('9 cachetest'))
+        self.assertIsNotNone(g2.match('11 cachetest'))
+
+    def test_local_patterns_in_cache_key(self):
+        g1 = lpc.Grok()
+        g1.addpattern('CACHEKEY', 'foo')
+        g1.compile('%{CACHEKEY}')
+
+        g2 = lpc.Grok()
+        g2.addpattern('CACHEKEY', 'bar')
+        g2.compile('%{CACHEKEY}')
+        self.assertIsNone(g2.match('foo'))
+        self.assertIsNotNone(g2.match('bar'))
+
+    def test_lru_eviction(self):
+        cache = lpc.GrokCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.info()['size'], 2)
+
+class TestGrokStore(unittest.TestCase):
+
+    def setUp(self):
+        self.cachedir = tempfile.mkdtemp()
+        os.environ['DEFAULT_CACHE_DIR'] = self.cachedir
+        lpc.GROK_CACHE.clear()
+
+    def tearDown(self):
+        del os.environ['DEFAULT_CACHE_DIR']
+        lpc.GROK_STORES.clear()
+        lpc.GROK_CACHE.clear()
+        shutil.rmtree(self.cachedir)
+
+    def test_store_roundtrip(self):
+        g = lpc.Grok()
+        g.compile('^%{WORD:name} %{NUMBER>10}$')
+        store = lpc.getgrokstore(g.library)
+        path = store.save()
+        self.assertTrue(os.path.exists(path))
+
+        # unchanged store is not written again
+        os.utime(path, (1000, 1000))
+        store.save()
+        self.assertEqual(os.stat(path).st_mtime, 1000)
+
+        # new process: empty memory caches, store loaded lazily
+        lpc.GROK_STORES.clear()
+        lpc.GROK_CACHE.clear()
+        g = lpc.Grok()
+        g.compile('^%{WORD:name} %{NUMBER>10}$')
+        self.assertEqual(len(lpc.getgrokstore(g.library)), 1)
+        self.assertIsNone(g.match('foo 9'))
+        self.assertEqual(g.match('foo 11').group('name'), 'foo')
+
+    def test_store_is_used(self):
+        g = lpc.Grok()
+        g.compile('%{WORD:name}')
+        store = lpc.getgrokstore(g.library)
+        key = store.getkey('%{WORD:name}', ())
+        store.set(key, '(?<name>stored)', {})
+        store.save()
+
+        lpc.GROK_STORES.clear()
+        lpc.GROK_CACHE.clear()
+        g = lpc.Grok()
+        g.compile('%{WORD:name}')
+        self.assertEqual(g.expandpattern.pattern, '(?<name>stored)')
 
 if __name__ == "__main__":
     unittest.main()